@@ -0,0 +1,56 @@
+"""
+アカウントの削除
+
+todo・タグ・タグ付け・集計・取り込みの記録をまとめて消すので、
+リクエストの中では仕事を積むだけにして、ワーカーで実行する。
+"""
+
+from sqlalchemy import delete, select
+from cache import NAMES, cache
+from db import db
+from jobs import register
+from models import (
+    ImportIdMapModel,
+    ImportJobModel,
+    TagModel,
+    TodoCounterModel,
+    TodoModel,
+    TodoTags,
+    UserModel,
+)
+from search import remove_todos
+from serializers import IN_CHUNK_SIZE
+
+
+@register("account.delete")
+def delete_account(user_id, payload):
+    """
+    何度実行しても同じ結果になる (途中で失敗したらロールバックされてやり直す)
+
+    user_versions の行は残す。ETag のバージョンが 0 からやり直しにならないように
+    """
+    todo_ids = select(TodoModel.id).where(TodoModel.user_id == user_id)
+    ids = db.session.scalars(todo_ids).all()
+    # バインド変数の上限を超えないように分けて消す
+    for i in range(0, len(ids), IN_CHUNK_SIZE):
+        remove_todos(ids[i : i + IN_CHUNK_SIZE])
+    db.session.execute(delete(TodoTags).where(TodoTags.todo_id.in_(todo_ids)))
+    import_jobs = select(ImportJobModel.id).where(ImportJobModel.user_id == user_id)
+    db.session.execute(
+        delete(ImportIdMapModel).where(ImportIdMapModel.job_id.in_(import_jobs))
+    )
+    counts = {}
+    for model in (
+        ImportJobModel,
+        TodoCounterModel,
+        TodoModel,
+        TagModel,
+        UserModel,
+    ):
+        column = model.id if model is UserModel else model.user_id
+        counts[model.__tablename__] = db.session.execute(
+            delete(model).where(column == user_id),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+    cache.invalidate_on_commit(user_id, NAMES)
+    return {"deleted": counts}
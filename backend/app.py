@@ -1,20 +1,42 @@
 import os
-from flask import Flask, jsonify
+from flask import Flask, g, jsonify
 from flask_smorest import Api
 from flask_jwt_extended import JWTManager
-from ariadne import graphql_sync
-from ariadne.explorer import ExplorerGraphiQL
+from werkzeug.middleware.proxy_fix import ProxyFix
 from db import db
+import db_config
+from instrumentation import instrumentation
+from compression import StaticAsset, compression
+from passwords import hasher
+from blocklist import blocklist
+from ratelimit import limiter
+from changes import feed
+from cache import cache
+from jobs import queue
 import models
+import search
+import migrations
 from resources.todo import blp as TodoBlueprint
 from resources.tag import blp as TagBlueprint
 from resources.user import blp as UserBlueprint
-from resources.graphql_route import blp as GraphQLBlueprint
-from gql.index import schema
+from resources.transfer import blp as TransferBlueprint
+from resources.changes import blp as ChangesBlueprint
+from resources.stats import blp as StatsBlueprint
+from resources.jobs import blp as JobsBlueprint
+from resources.graphql_route import blp as GraphQLBlueprint, explorer
+from resources.health import blp as HealthBlueprint
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
 
 
 def create_app(db_url=None):
     app = Flask(__name__)
+    # リバースプロキシの段数。レート制限の IP を X-Forwarded-For から取る
+    proxy_count = int(os.getenv("PROXY_FIX_X_FOR", "0"))
+    if proxy_count:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_count, x_proto=proxy_count)
 
     app.config["PROPAGATE_EXCEPTIONS"] = True
     app.config["API_TITLE"] = "TodoApp REST API"
@@ -29,10 +51,33 @@ def create_app(db_url=None):
         "DATABASE_URL", "sqlite:///data.db"
     )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # 一覧系を marshmallow を通さずに列のタプルから直接 JSON にする
+    app.config["API_FAST_SERIALIZATION"] = os.getenv(
+        "API_FAST_SERIALIZATION", "1"
+    ).lower() not in ("0", "false", "no", "off")
+    # GraphQL のクエリの深さとコストの上限 (gql/cost.py)
+    app.config["GRAPHQL_MAX_DEPTH"] = int(os.getenv("GRAPHQL_MAX_DEPTH", "8"))
+    app.config["GRAPHQL_MAX_COST"] = int(os.getenv("GRAPHQL_MAX_COST", "10000"))
+    # GET /graphql の GraphiQL。本番では 0 にして無効にできる
+    app.config["GRAPHQL_EXPLORER"] = _env_bool("GRAPHQL_EXPLORER", True)
+    # 起動のたびに未適用のマイグレーションを適用する (開発・テスト向け)。
+    # 本番では 0 にして、デプロイ時に flask db-upgrade で1回だけ適用する
+    app.config["DB_AUTO_MIGRATE"] = _env_bool("DB_AUTO_MIGRATE", True)
+    db_config.configure_engine(app)
 
     db.init_app(app)
-    with app.app_context():
-        db.create_all()
+    db_config.init_app(app)
+    instrumentation.init_app(app)
+    compression.init_app(app)
+    search.init_app(app)
+    hasher.init_app(app)
+    feed.init_app(app)
+    cache.init_app(app)
+    queue.init_app(app)
+    migrations.init_app(app)
+    if app.config["DB_AUTO_MIGRATE"]:
+        with app.app_context():
+            migrations.upgrade()
 
     app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "local-secret-key")
 
@@ -45,6 +90,47 @@ def create_app(db_url=None):
     # ーーーXSS対策ーーー
 
     jwt = JWTManager(app)
+    blocklist.init_app(app)
+
+    @app.before_request
+    def forget_token_users():
+        # レート制限の前に登録する (そこでもトークンを確認するので)
+        g.pop("token_users", None)
+
+    limiter.init_app(app)
+
+    def token_user(jwt_payload):
+        # 失効の判定なのでレプリカの遅れを避けて primary から読む。
+        # セッションの identity map は弱参照なので、同じリクエストで読み直さないよう g に持つ
+        users = g.setdefault("token_users", {})
+        user_id = int(jwt_payload["sub"])
+        if user_id not in users:
+            users[user_id] = db.session.get(
+                models.UserModel, user_id, bind_arguments={"bind": db.engine}
+            )
+        return users[user_id]
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        if blocklist.is_revoked(jwt_payload["jti"]):
+            return True
+        # アカウント削除などでユーザーのトークンをまとめて失効させたとき
+        user = token_user(jwt_payload)
+        return user is not None and user.token_revoked(jwt_payload["iat"])
+
+    @jwt.user_lookup_loader
+    def user_lookup_callback(jwt_header, jwt_payload):
+        # 削除済みのユーザーのトークンは使えない
+        return token_user(jwt_payload)
+
+    @jwt.user_lookup_error_loader
+    def user_lookup_error_callback(jwt_header, jwt_payload):
+        return (
+            jsonify(
+                {"description": "The user no longer exists.", "error": "user_not_found"}
+            ),
+            401,
+        )
 
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -120,5 +206,18 @@ def create_app(db_url=None):
     api.register_blueprint(TodoBlueprint)
     api.register_blueprint(TagBlueprint)
     api.register_blueprint(UserBlueprint)
+    api.register_blueprint(TransferBlueprint)
+    api.register_blueprint(ChangesBlueprint)
+    api.register_blueprint(StatsBlueprint)
+    api.register_blueprint(JobsBlueprint)
     app.register_blueprint(GraphQLBlueprint)
+    app.register_blueprint(HealthBlueprint)
+
+    # OpenAPI の JSON は毎回 spec から作り直さず、1回だけ作って ETag 付きで返す
+    openapi_json = StaticAsset(
+        lambda: app.json.dumps(api.spec.to_dict(), indent=2, sort_keys=False),
+        "application/json",
+    )
+    app.view_functions["api-docs.openapi_json"] = openapi_json.response
+    app.extensions["static_assets"] = [openapi_json, explorer]
     return app
@@ -0,0 +1,145 @@
+"""
+ASGI のエントリーポイント (任意)
+
+POST /graphql だけを ariadne の非同期の実行 (ariadne.graphql) で処理し、それ以外は
+Flask のアプリを WSGI のままスレッドプールで動かす。
+
+    cd backend
+    GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker gunicorn asgi:app
+
+今のリゾルバは同期 (SQLAlchemy) なので、リゾルバの実行中はイベントループが止まる。
+I/O を待つリゾルバを async にしたときに効果が出る。既定の本番構成は wsgi.py。
+"""
+
+import io
+import sys
+import warnings
+from ariadne import graphql
+from flask import request
+from app import create_app
+from gql.index import get_schema
+from instrumentation import timer
+from resources.graphql_route import finish_request, prepare_request
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # a2wsgi が無ければ Starlette の (非推奨の) ものを使う
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        from starlette.middleware.wsgi import WSGIMiddleware
+
+
+def _environ(scope, body):
+    """ASGI の scope から Flask の request_context() に渡す WSGI の environ を作る"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin-1")
+        if name in environ:
+            # HTTP/2 では Cookie が複数のヘッダーに分かれて届く
+            separator = "; " if name == "HTTP_COOKIE" else ","
+            value = f"{environ[name]}{separator}{value}"
+        environ[name] = value
+    # 本文は読み終えているので、chunked で送られてきた場合も長さを付ける
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _execute():
+    data, options, cost, response = prepare_request(request.get_json())
+    if response is not None:
+        return response
+    with timer("graphql"):
+        success, result = await graphql(get_schema(), data, **options)
+    return finish_request(success, result, cost)
+
+
+class ASGIApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif (
+            scope["type"] == "http"
+            and scope["path"] == "/graphql"
+            and scope["method"] == "POST"
+        ):
+            await self._graphql(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _graphql(self, scope, receive, send):
+        body = await _read_body(receive)
+        app = self.flask_app
+        # before_request / after_request (認証・計測・レプリカの振り分け) は WSGI と同じものを通す
+        with app.request_context(_environ(scope, body)):
+            try:
+                response = app.preprocess_request()
+                if response is None:
+                    response = await _execute()
+            except Exception as e:
+                response = app.handle_user_exception(e)
+            response = app.process_response(app.make_response(response))
+            status = response.status_code
+            headers = [
+                (key.lower().encode("latin-1"), value.encode("latin-1"))
+                for key, value in response.headers.items()
+            ]
+            body = response.get_data()
+        await send(
+            {"type": "http.response.start", "status": status, "headers": headers}
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def create_asgi_app(flask_app=None):
+    return ASGIApp(flask_app or create_app())
+
+
+def __getattr__(name):
+    # asgi:app を読み込まれたときに作る (テストで ASGIApp だけ使う場合に DB を作らない)
+    if name == "app":
+        globals()["app"] = create_asgi_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,356 @@
+"""
+REST / GraphQL の負荷テスト
+
+データを投入したアプリに対して、ログイン・一覧・絞り込み・更新・タグ付け・GraphQL の
+ワークロードを流し、p50/p95/p99 のレイテンシ・スループット・1リクエストあたりの
+SQL の件数を出す。--baseline を指定すると保存済みの結果と比べ、悪化していれば
+終了コード 1 で終わる (CI 用)。
+
+    cd backend
+    python -m benchmarks.load
+    python -m benchmarks.load --server          # localhost の WSGI サーバー経由
+    python -m benchmarks.load --baseline benchmarks/baseline.json
+    python -m benchmarks.load --save-baseline benchmarks/baseline.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from random import Random
+from urllib.parse import quote
+from werkzeug.serving import make_server
+from benchmarks.seed import PASSWORD, seed
+
+QUERIES_RE = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+GRAPHQL_QUERY = "{ todos { id name is_done deadline tags { name } } }"
+SEARCH_WORDS = ["会議", "review", "買い物", "deploy"]
+
+
+class ClientSession:
+    """app.test_client() で直接アプリを呼ぶ"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        res = self.client.open(path, method=method, json=body)
+        return res.status_code, res.headers
+
+
+class HttpSession:
+    """localhost の WSGI サーバーに HTTP で繋ぐ。Cookie は自前で持つ"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.cookies = {}
+
+    def request(self, method, path, body=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = {}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        data = None
+        if body is not None:
+            data = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        try:
+            conn.request(method, path, body=data, headers=headers)
+            res = conn.getresponse()
+            res.read()
+        finally:
+            conn.close()
+        for header in res.headers.get_all("Set-Cookie") or []:
+            cookie = SimpleCookie(header)
+            for key, morsel in cookie.items():
+                self.cookies[key] = morsel.value
+        return res.status, res.headers
+
+
+class VirtualUser:
+    def __init__(self, session, user, rng):
+        self.session = session
+        self.user = user
+        self.rng = rng
+        self.lock = threading.Lock()
+
+    def login(self):
+        return self.session.request(
+            "POST",
+            "/api/login",
+            {"username": self.user.username, "password": PASSWORD},
+        )
+
+
+# ワークロード: VirtualUser を受け取り (status, headers) を返す
+def workload_login(vu):
+    return vu.login()
+
+
+def workload_list(vu):
+    return vu.session.request("GET", "/api/todos?limit=50")
+
+
+def workload_list_all(vu):
+    return vu.session.request("GET", "/api/todos")
+
+
+def workload_filter(vu):
+    tag_id = vu.rng.choice(vu.user.tag_ids)
+    if vu.rng.random() < 0.5:
+        path = f"/api/todos?is_done=false&tag_id={tag_id}&limit=50"
+    else:
+        path = f"/api/todos?name={quote(vu.rng.choice(SEARCH_WORDS))}&limit=50"
+    return vu.session.request("GET", path)
+
+
+def workload_patch(vu):
+    todo_id = vu.rng.choice(vu.user.todo_ids)
+    return vu.session.request(
+        "PATCH", f"/api/todos/{todo_id}", {"is_done": vu.rng.random() < 0.5}
+    )
+
+
+def workload_tag_link(vu):
+    todo_id = vu.rng.choice(vu.user.todo_ids)
+    tag_id = vu.rng.choice(vu.user.tag_ids)
+    method = "POST" if vu.rng.random() < 0.5 else "DELETE"
+    return vu.session.request(method, f"/api/todos/{todo_id}/tag/{tag_id}")
+
+
+def workload_graphql(vu):
+    return vu.session.request("POST", "/graphql", {"query": GRAPHQL_QUERY})
+
+
+WORKLOADS = {
+    "login": workload_login,
+    "list": workload_list,
+    "list_all": workload_list_all,
+    "filter": workload_filter,
+    "patch": workload_patch,
+    "tag_link": workload_tag_link,
+    "graphql": workload_graphql,
+}
+# KDF が重いログインは回数を減らす
+REQUEST_SHARE = {"login": 0.1}
+
+
+def percentile(values, p):
+    """最近傍法のパーセンタイル"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_workload(name, users, requests, concurrency):
+    fn = WORKLOADS[name]
+    latencies, queries, errors = [], [], 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        vu = users[i % len(users)]
+        # 同じユーザーの Cookie を複数スレッドから同時に触らない
+        with vu.lock:
+            start = time.perf_counter()
+            status, headers = fn(vu)
+            elapsed = time.perf_counter() - start
+        match = QUERIES_RE.search(headers.get("Server-Timing", ""))
+        with lock:
+            latencies.append(elapsed)
+            if match:
+                queries.append(int(match.group(1)))
+            # 既に付いている・付いていないタグの付け外しは 4xx になり得る
+            if status >= 500 or (status >= 400 and name != "tag_link"):
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput_rps": round(requests / wall, 1),
+        "queries_per_request": (
+            round(sum(queries) / len(queries), 2) if queries else None
+        ),
+    }
+
+
+def compare(results, baseline, tolerance, query_tolerance):
+    """悪化している項目のメッセージのリストを返す"""
+    problems = []
+    if baseline.get("config") != results["config"]:
+        problems.append(
+            f"config differs from the baseline: {baseline.get('config')} != {results['config']}"
+        )
+        return problems
+    for name, base in baseline["results"].items():
+        current = results["results"].get(name)
+        if current is None:
+            continue
+        if current["errors"] > base["errors"]:
+            problems.append(f"{name}: {current['errors']} errors")
+        for key in ("p95_ms", "p99_ms"):
+            if current[key] > base[key] * (1 + tolerance):
+                problems.append(
+                    f"{name}: {key} {current[key]} > {base[key]} (+{tolerance:.0%})"
+                )
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            problems.append(
+                f"{name}: throughput {current['throughput_rps']} < {base['throughput_rps']}"
+            )
+        # SQL の件数はマシンの速さに左右されないので厳しめに見る
+        if (
+            base["queries_per_request"] is not None
+            and current["queries_per_request"] is not None
+            and current["queries_per_request"]
+            > base["queries_per_request"] * (1 + query_tolerance)
+        ):
+            problems.append(
+                f"{name}: queries/request {current['queries_per_request']} > {base['queries_per_request']}"
+            )
+    return problems
+
+
+def start_server(app):
+    # アクセスログでベンチマークの出力が埋もれないようにする
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def run(args):
+    # Server-Timing から SQL の件数を読むので計測を有効にしてからアプリを作る
+    os.environ["INSTRUMENTATION_ENABLED"] = "1"
+    os.environ.setdefault("SLOW_QUERY_MS", "10000")
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+    # 同じ IP から大量に叩くので、レート制限ではなくアプリ自体の速さを測る
+    os.environ.setdefault("RATELIMIT_ENABLED", "0")
+    from app import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        # ブラウザではないので CSRF のヘッダーは付けない
+        app.config["JWT_COOKIE_CSRF_PROTECT"] = False
+        seeded = seed(app, args.users, args.mean_todos, args.seed)
+
+        server = start_server(app) if args.server else None
+        rng = Random(args.seed)
+        users = []
+        for user in seeded[: args.virtual_users]:
+            if server:
+                session = HttpSession("127.0.0.1", server.server_port)
+            else:
+                session = ClientSession(app)
+            vu = VirtualUser(session, user, Random(rng.random()))
+            vu.login()
+            users.append(vu)
+
+        results = {}
+        try:
+            for name in args.workloads:
+                requests = max(1, int(args.requests * REQUEST_SHARE.get(name, 1.0)))
+                # ウォームアップ (接続・キャッシュ・JIT 的な初回コストを除く)
+                run_workload(name, users, min(requests, 10), args.concurrency)
+                results[name] = run_workload(name, users, requests, args.concurrency)
+        finally:
+            if server:
+                server.shutdown()
+
+    config = {
+        "users": args.users,
+        "mean_todos": args.mean_todos,
+        "seed": args.seed,
+        "virtual_users": args.virtual_users,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "driver": "wsgi" if args.server else "test_client",
+    }
+    return {"config": config, "results": results}
+
+
+def print_results(results):
+    print(
+        f"{'workload':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'req/s':>8} {'queries':>8} {'errors':>7}"
+    )
+    for name, r in results["results"].items():
+        queries = r["queries_per_request"]
+        print(
+            f"{name:<10} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+            f"{r['throughput_rps']:>8.1f} {queries if queries is not None else '-':>8} "
+            f"{r['errors']:>7}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--mean-todos", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--virtual-users", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS)
+    )
+    parser.add_argument(
+        "--server", action="store_true", help="localhost の WSGI サーバー経由で叩く"
+    )
+    parser.add_argument("--output", help="結果を JSON で保存する")
+    parser.add_argument("--baseline", help="比較するベースラインの JSON")
+    parser.add_argument("--save-baseline", help="結果をベースラインとして保存する")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="レイテンシ・スループットの許容する悪化の割合",
+    )
+    parser.add_argument(
+        "--query-tolerance",
+        type=float,
+        default=0.1,
+        help="1リクエストあたりの SQL の件数の許容する増加の割合",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_results(results)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+                f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.tolerance, args.query_tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        if problems:
+            return 1
+        print("no regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
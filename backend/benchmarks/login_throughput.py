@@ -0,0 +1,65 @@
+"""
+ログインのスループットを PASSWORD_HASH_WORKERS ごとに計測するベンチマーク
+
+    cd backend
+    python -m benchmarks.login_throughput --logins 200 --threads 8
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app import create_app
+from passwords import hasher
+
+USERNAME = "bench_user"
+PASSWORD = "bench_password"
+
+
+def run(workers, logins, threads):
+    # 同じ IP とユーザー名で何百回もログインするので、レート制限ではなくハッシュの速さを測る
+    os.environ.setdefault("RATELIMIT_ENABLED", "0")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        app.config["PASSWORD_HASH_WORKERS"] = workers
+        app.test_client().post(
+            "/api/register", json={"username": USERNAME, "password": PASSWORD}
+        )
+
+        def login(_):
+            res = app.test_client().post(
+                "/api/login", json={"username": USERNAME, "password": PASSWORD}
+            )
+            assert res.status_code == 204, res.status_code
+
+        # プロセスプールの起動はスループットに含めない
+        login(None)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(login, range(logins)))
+        elapsed = time.perf_counter() - start
+    hasher.shutdown()
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({0, 1, 2, 4, os.cpu_count() or 1}),
+    )
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'logins/s':>10}")
+    for workers in args.workers:
+        throughput = run(workers, args.logins, args.threads)
+        print(f"{workers:>8} {throughput:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+ベンチマーク用のデータ投入
+
+ユーザーごとの todo の数は対数正規分布 (少数のユーザーが大量に持つ) にして、
+タグ・締め切り・完了状態・タグ付けも実際の使われ方に近い割合でばらつかせる。
+"""
+
+import math
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from db import db
+from models import TagModel, TodoModel, TodoTags, UserModel
+from passwords import hasher
+from search import index_todos
+
+PASSWORD = "bench_password"
+WORDS = [
+    "買い物",
+    "掃除",
+    "レポート",
+    "会議",
+    "予約",
+    "支払い",
+    "review",
+    "deploy",
+    "meeting",
+    "invoice",
+    "refactor",
+    "gym",
+    "dentist",
+    "読書",
+    "旅行",
+]
+TAG_NAMES = ["仕事", "家事", "買い物", "urgent", "later", "health", "study", "hobby"]
+
+
+class SeededUser:
+    def __init__(self, id, username, tag_ids, todo_ids):
+        self.id = id
+        self.username = username
+        self.tag_ids = tag_ids
+        self.todo_ids = todo_ids
+
+
+def _todo_count(rng, mean_todos, max_todos):
+    # 中央値が mean_todos の半分くらいになる裾の長い分布
+    sigma = 1.0
+    mu = math.log(mean_todos) - sigma**2 / 2
+    return max(1, min(max_todos, int(rng.lognormvariate(mu, sigma))))
+
+
+def seed(app, users=20, mean_todos=100, random_seed=0):
+    """データを投入して SeededUser のリストを返す"""
+    rng = random.Random(random_seed)
+    now = datetime(2025, 6, 1)
+    seeded = []
+    with app.app_context():
+        # KDF は重いので、全員同じパスワードのハッシュを使い回す
+        password_hash = hasher.hash(PASSWORD)
+        user_ids = db.session.scalars(
+            insert(UserModel).returning(UserModel.id, sort_by_parameter_order=True),
+            [
+                {"username": f"bench{i:04d}", "password": password_hash}
+                for i in range(users)
+            ],
+        ).all()
+        for index, user_id in enumerate(user_ids):
+            tag_count = rng.randint(2, len(TAG_NAMES))
+            tag_ids = db.session.scalars(
+                insert(TagModel).returning(TagModel.id, sort_by_parameter_order=True),
+                [
+                    # タグ名は全体で一意なのでユーザーごとに接尾辞を付ける
+                    {"name": f"{name}-{user_id}", "user_id": user_id}
+                    for name in rng.sample(TAG_NAMES, tag_count)
+                ],
+            ).all()
+
+            rows = []
+            for i in range(_todo_count(rng, mean_todos, mean_todos * 20)):
+                created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+                deadline = None
+                if rng.random() < 0.7:
+                    deadline = created_at + timedelta(days=rng.randint(-3, 60))
+                rows.append(
+                    {
+                        "name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}",
+                        "user_id": user_id,
+                        "created_at": created_at,
+                        "updated_at": created_at,
+                        "deadline": deadline,
+                        "is_done": rng.random() < 0.4,
+                    }
+                )
+            todo_ids = db.session.scalars(
+                insert(TodoModel).returning(TodoModel.id, sort_by_parameter_order=True),
+                rows,
+            ).all()
+            index_todos(user_id, zip(todo_ids, (row["name"] for row in rows)))
+
+            # タグ付けは 0〜3 個。付いていない todo が一番多い
+            links = []
+            for todo_id in todo_ids:
+                count = rng.choices([0, 1, 2, 3], weights=[50, 30, 15, 5])[0]
+                for tag_id in rng.sample(tag_ids, min(count, len(tag_ids))):
+                    links.append({"todo_id": todo_id, "tag_id": tag_id})
+            if links:
+                db.session.execute(insert(TodoTags), links)
+            seeded.append(
+                SeededUser(user_id, f"bench{index:04d}", list(tag_ids), list(todo_ids))
+            )
+        db.session.commit()
+    return seeded
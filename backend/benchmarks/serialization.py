@@ -0,0 +1,90 @@
+"""
+GET /api/todos の marshmallow と軽量シリアライズの比較ベンチマーク
+
+    cd backend
+    python -m benchmarks.serialization --sizes 1000 10000 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import create_app
+from db import db
+from models import TagModel, TodoModel, TodoTags
+
+USERNAME = "bench_user"
+PASSWORD = "bench_password"
+
+
+def seed(app, count):
+    with app.app_context():
+        tags = [TagModel(name=f"bench-tag-{i}", user_id=1) for i in range(10)]
+        db.session.add_all(tags)
+        db.session.flush()
+        start = datetime(2025, 1, 1)
+        db.session.execute(
+            insert(TodoModel),
+            [
+                {
+                    "name": f"todo {i}",
+                    "user_id": 1,
+                    "created_at": start + timedelta(seconds=i),
+                    "deadline": start + timedelta(days=i % 60),
+                    "is_done": i % 3 == 0,
+                }
+                for i in range(count)
+            ],
+        )
+        db.session.execute(
+            insert(TodoTags),
+            [{"todo_id": i + 1, "tag_id": tags[i % 10].id} for i in range(count)],
+        )
+        db.session.commit()
+
+
+def measure(client, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = client.get("/api/todos")
+        elapsed = time.perf_counter() - start
+        assert res.status_code == 200, res.status_code
+        best = min(best, elapsed)
+    return best, len(res.data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # サイズごとにログインして同じ一覧を何度も読むので、レート制限は外して測る
+    os.environ.setdefault("RATELIMIT_ENABLED", "0")
+    print(f"{'todos':>8} {'marshmallow':>12} {'fast':>10} {'speedup':>8} {'bytes':>10}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = create_app(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            app.config["PASSWORD_HASH_WORKERS"] = 0
+            client = app.test_client()
+            client.post(
+                "/api/register", json={"username": USERNAME, "password": PASSWORD}
+            )
+            client.post("/api/login", json={"username": USERNAME, "password": PASSWORD})
+            seed(app, size)
+
+            app.config["API_FAST_SERIALIZATION"] = False
+            slow, size_bytes = measure(client, args.repeat)
+            app.config["API_FAST_SERIALIZATION"] = True
+            fast, _ = measure(client, args.repeat)
+        print(
+            f"{size:>8} {slow * 1000:>10.1f}ms {fast * 1000:>8.1f}ms "
+            f"{slow / fast:>7.1f}x {size_bytes:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
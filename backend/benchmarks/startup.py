@@ -0,0 +1,92 @@
+"""
+起動時間のベンチマーク
+
+新しいプロセスで app の import・create_app()・最初のリクエストまでの時間を測る。
+オートスケールで増えたワーカーがリクエストを受けられるまでの時間の目安になる。
+中央値が --budget-ms を超えたら終了コード 1 で終わる (CI 用)。
+
+    cd backend
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --budget-ms 1500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# 既定の予算 (import + create_app、マイグレーション適用済みの DB)
+BUDGET_MS = 1500
+
+# 子プロセスで実行する。結果は JSON で標準出力に出す
+SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(sys.argv[1])
+created = time.perf_counter()
+client = app.test_client()
+client.get("/healthz")
+first_request = time.perf_counter()
+client.post("/graphql", json={"query": "{ hello }"})
+first_graphql = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (first_request - created) * 1000,
+    "first_graphql_ms": (first_graphql - first_request) * 1000,
+}))
+"""
+
+
+def measure(db_url, env):
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT, db_url],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    env = {**os.environ, "PASSWORD_HASH_WORKERS": "0"}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+        # 1回目でマイグレーションを適用しておき、以降は適用済みの DB で測る
+        first = measure(db_url, env)
+        print(
+            f"fresh database: create_app {first['create_app_ms']:.1f} ms "
+            "(applies migrations)"
+        )
+        runs = [measure(db_url, env) for _ in range(args.runs)]
+
+    print(f"{'phase':<18} {'median ms':>10} {'max ms':>10}")
+    for key in ("import_ms", "create_app_ms", "first_request_ms", "first_graphql_ms"):
+        values = [run[key] for run in runs]
+        print(f"{key[:-3]:<18} {statistics.median(values):>10.1f} {max(values):>10.1f}")
+    startup = statistics.median(run["import_ms"] + run["create_app_ms"] for run in runs)
+    print(
+        f"startup (import + create_app): {startup:.1f} ms, budget {args.budget_ms} ms"
+    )
+    if startup > args.budget_ms:
+        print("startup time is over the budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
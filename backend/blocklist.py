@@ -0,0 +1,235 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from resp import RespClient, RespError
+
+logger = logging.getLogger(__name__)
+
+# 失効の記録 (増分の同期用) を残す秒数。これより前から同期していなければ全件を読み直す
+LOG_RETENTION = 3600
+# プロセス間の時計のずれと、書き込み中の失効を取りこぼさないように少し前から読む
+SYNC_OVERLAP = 5.0
+
+
+class BloomFilter:
+    """失効済み JTI の集合。偽陽性はあるが偽陰性は無い"""
+
+    def __init__(self, capacity=100_000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value):
+        return all(
+            self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value)
+        )
+
+
+class InMemoryBlocklistStore:
+    """プロセス内だけで共有するストア。開発・テスト用"""
+
+    def __init__(self):
+        self._jtis = {}
+        self._revoked_at = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        for jti, expires_at in list(self._jtis.items()):
+            if expires_at <= now:
+                del self._jtis[jti]
+                self._revoked_at.pop(jti, None)
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._jtis[jti] = expires_at
+            self._revoked_at[jti] = time.time()
+            self._version += 1
+
+    def contains(self, jti):
+        expires_at = self._jtis.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def version(self):
+        return self._version
+
+    def all(self):
+        with self._lock:
+            self._prune(time.time())
+            return list(self._jtis)
+
+    def since(self, timestamp):
+        with self._lock:
+            return [jti for jti, at in self._revoked_at.items() if at >= timestamp]
+
+
+class RedisBlocklistStore:
+    """
+    Redis プロトコルのストア。プロセス間で失効情報を共有する
+
+    - blocklist:jti:<jti>  有効期限付きのキー (個別の確認用)
+    - blocklist:jtis       期限をスコアにした sorted set (ブルームフィルタ再構築用)
+    - blocklist:log        失効した時刻をスコアにした sorted set (増分の同期用)
+    - blocklist:version    失効のたびに増えるカウンタ
+    """
+
+    def __init__(self, url, prefix="blocklist"):
+        self.client = RespClient(url)
+        self.prefix = prefix
+
+    def add(self, jti, expires_at):
+        now = time.time()
+        ttl = max(1, int(math.ceil(expires_at - now)))
+        self.client.pipeline(
+            [
+                ["SET", f"{self.prefix}:jti:{jti}", 1, "EX", ttl],
+                ["ZADD", f"{self.prefix}:jtis", expires_at, jti],
+                ["ZADD", f"{self.prefix}:log", now, jti],
+                ["ZREMRANGEBYSCORE", f"{self.prefix}:log", "-inf", now - LOG_RETENTION],
+                ["INCR", f"{self.prefix}:version"],
+            ]
+        )
+
+    def contains(self, jti):
+        return bool(self.client.execute("EXISTS", f"{self.prefix}:jti:{jti}"))
+
+    def version(self):
+        return int(self.client.execute("GET", f"{self.prefix}:version") or 0)
+
+    def all(self):
+        now = time.time()
+        _, jtis = self.client.pipeline(
+            [
+                ["ZREMRANGEBYSCORE", f"{self.prefix}:jtis", "-inf", now],
+                ["ZRANGEBYSCORE", f"{self.prefix}:jtis", now, "+inf"],
+            ]
+        )
+        return jtis
+
+    def since(self, timestamp):
+        return self.client.execute(
+            "ZRANGEBYSCORE", f"{self.prefix}:log", timestamp, "+inf"
+        )
+
+
+def create_store(url):
+    if url.startswith("memory://"):
+        return InMemoryBlocklistStore()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBlocklistStore(url)
+    raise ValueError(f"Unsupported blocklist store: {url}")
+
+
+class TokenBlocklist:
+    """
+    JWT の JTI 失効リスト
+
+    ストアの前にプロセスごとのブルームフィルタと短い TTL のキャッシュを置く。
+    ブルームフィルタに載っていない JTI (ほとんどのトークン) はストアに問い合わせない。
+    他プロセスでの失効は TOKEN_BLOCKLIST_SYNC_INTERVAL 秒ごとに、前回の同期より後に
+    失効したものだけを取り込む (LOG_RETENTION ごとに全件から作り直して期限切れを落とす)。
+    ストアが落ちているときは最後に同期したフィルタで判定する。
+    """
+
+    def __init__(self, app=None):
+        self.store = InMemoryBlocklistStore()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "TOKEN_BLOCKLIST_URL", os.getenv("TOKEN_BLOCKLIST_URL", "memory://")
+        )
+        app.config.setdefault("TOKEN_BLOCKLIST_CACHE_TTL", 5.0)
+        app.config.setdefault("TOKEN_BLOCKLIST_SYNC_INTERVAL", 1.0)
+        app.config.setdefault("TOKEN_BLOCKLIST_CAPACITY", 100_000)
+        self.store = create_store(app.config["TOKEN_BLOCKLIST_URL"])
+        self.cache_ttl = app.config["TOKEN_BLOCKLIST_CACHE_TTL"]
+        self.sync_interval = app.config["TOKEN_BLOCKLIST_SYNC_INTERVAL"]
+        self.capacity = app.config["TOKEN_BLOCKLIST_CAPACITY"]
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._bloom = BloomFilter(self.capacity)
+        self._synced_version = None
+        self._synced_at = 0.0
+        # 最後に全件から作り直した時刻と、最後に同期した時刻 (time.time())
+        self._rebuilt_since = None
+        self._synced_since = None
+        app.extensions["token_blocklist"] = self
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+        started = time.time()
+        try:
+            version = self.store.version()
+            if version == self._synced_version:
+                return
+            if (
+                self._rebuilt_since is not None
+                and started - self._rebuilt_since < LOG_RETENTION
+            ):
+                jtis = self.store.since(self._synced_since - SYNC_OVERLAP)
+                with self._lock:
+                    for jti in jtis:
+                        self._bloom.add(jti)
+                        self._cache.pop(jti, None)
+                    self._synced_version = version
+                    self._synced_since = started
+                return
+            bloom = BloomFilter(self.capacity)
+            for jti in self.store.all():
+                bloom.add(jti)
+        except (OSError, RespError):
+            logger.warning(
+                "token blocklist store is unavailable; using the last synced filter",
+                exc_info=True,
+            )
+            return
+        with self._lock:
+            self._bloom = bloom
+            self._synced_version = version
+            self._rebuilt_since = self._synced_since = started
+            self._cache.clear()
+
+    def revoke(self, jti, expires_at):
+        self.store.add(jti, expires_at)
+        with self._lock:
+            self._bloom.add(jti)
+            self._cache[jti] = (True, time.monotonic() + self.cache_ttl)
+
+    def is_revoked(self, jti):
+        self._sync()
+        if jti not in self._bloom:
+            return False
+        cached = self._cache.get(jti)
+        now = time.monotonic()
+        if cached and cached[1] > now:
+            return cached[0]
+        try:
+            revoked = self.store.contains(jti)
+        except (OSError, RespError):
+            # フィルタに載っているので失効しているものとして扱う (偽陽性はまれ)
+            logger.warning("token blocklist store is unavailable", exc_info=True)
+            return True
+        with self._lock:
+            self._cache[jti] = (revoked, now + self.cache_ttl)
+        return revoked
+
+
+blocklist = TokenBlocklist()
@@ -0,0 +1,183 @@
+from sqlalchemy import delete, insert, select, tuple_, update
+from changes import emit
+from db import db
+from jobs import register
+from models import TagModel, TodoModel, TodoTags
+from schema import TodoBulkSchema
+from search import index_todos, remove_todos
+from stats import track
+from versions import bump_version
+
+UPDATABLE_FIELDS = ("name", "deadline", "is_done")
+
+
+def _result(index, status, id=None, message=None):
+    result = {"index": index, "status": status, "id": id}
+    if message:
+        result["message"] = message
+    return result
+
+
+def _owners(model, ids):
+    """id -> user_id の辞書を1回のクエリで取る"""
+    if not ids:
+        return {}
+    rows = db.session.execute(
+        select(model.id, model.user_id).where(model.id.in_(set(ids)))
+    ).all()
+    return dict(rows)
+
+
+def _check(owners, id, user_id):
+    if id not in owners:
+        return 404, "Not found"
+    if owners[id] != user_id:
+        return 403, "Invalid credentials"
+    return None, None
+
+
+def _create(user_id, items):
+    if not items:
+        return []
+    rows = [
+        {
+            "name": item["name"],
+            "deadline": item.get("deadline"),
+            "is_done": item.get("is_done", False),
+            "user_id": user_id,
+        }
+        for item in items
+    ]
+    # 複数行の INSERT ... RETURNING を1文で発行する
+    ids = db.session.scalars(
+        insert(TodoModel).returning(TodoModel.id, sort_by_parameter_order=True), rows
+    ).all()
+    index_todos(user_id, zip(ids, (row["name"] for row in rows)))
+    return [_result(i, 201, id) for i, id in enumerate(ids)]
+
+
+def _update(user_id, items):
+    owners = _owners(TodoModel, [item["id"] for item in items])
+    results, params = [], []
+    for i, item in enumerate(items):
+        status, message = _check(owners, item["id"], user_id)
+        if status:
+            results.append(_result(i, status, item["id"], message))
+            continue
+        values = {key: item[key] for key in UPDATABLE_FIELDS if key in item}
+        if values:
+            params.append({"id": item["id"], **values})
+        results.append(_result(i, 204, item["id"]))
+    if params:
+        # 主キー指定の一括 UPDATE (executemany)
+        db.session.execute(update(TodoModel), params)
+        index_todos(user_id, [(p["id"], p["name"]) for p in params if "name" in p])
+    return results
+
+
+def _delete(user_id, ids):
+    owners = _owners(TodoModel, ids)
+    results, deletable = [], []
+    for i, id in enumerate(ids):
+        status, message = _check(owners, id, user_id)
+        if status:
+            results.append(_result(i, status, id, message))
+            continue
+        deletable.append(id)
+        results.append(_result(i, 204, id))
+    if deletable:
+        remove_todos(deletable)
+        db.session.execute(delete(TodoTags).where(TodoTags.todo_id.in_(deletable)))
+        db.session.execute(
+            delete(TodoModel).where(TodoModel.id.in_(deletable)),
+            execution_options={"synchronize_session": False},
+        )
+    return results
+
+
+def _check_links(user_id, links):
+    todo_owners = _owners(TodoModel, [link["todo_id"] for link in links])
+    tag_owners = _owners(TagModel, [link["tag_id"] for link in links])
+    results, pairs = [], []
+    for i, link in enumerate(links):
+        status, message = _check(todo_owners, link["todo_id"], user_id)
+        if not status:
+            status, message = _check(tag_owners, link["tag_id"], user_id)
+        if status:
+            results.append(_result(i, status, link["todo_id"], message))
+            continue
+        pairs.append((link["todo_id"], link["tag_id"]))
+        results.append(_result(i, 204, link["todo_id"]))
+    return results, pairs
+
+
+def _link(user_id, links):
+    results, pairs = _check_links(user_id, links)
+    if pairs:
+        existing = set(
+            db.session.execute(
+                select(TodoTags.todo_id, TodoTags.tag_id).where(
+                    tuple_(TodoTags.todo_id, TodoTags.tag_id).in_(pairs)
+                )
+            ).all()
+        )
+        missing = [
+            {"todo_id": todo_id, "tag_id": tag_id}
+            for todo_id, tag_id in dict.fromkeys(pairs)
+            if (todo_id, tag_id) not in existing
+        ]
+        if missing:
+            db.session.execute(insert(TodoTags), missing)
+    return results
+
+
+def _unlink(user_id, links):
+    results, pairs = _check_links(user_id, links)
+    if pairs:
+        db.session.execute(
+            delete(TodoTags).where(tuple_(TodoTags.todo_id, TodoTags.tag_id).in_(pairs))
+        )
+    return results
+
+
+def apply_bulk(user_id, operations):
+    """
+    todo の一括作成・更新・削除とタグの付け外しを1トランザクションで行う
+
+    operations は create / update / delete / link / unlink のリストを持つ辞書。
+    所有者でない・存在しない項目は飛ばして、項目ごとの結果を返す。
+    コミットは呼び出し側で行う。
+    """
+    links = operations.get("link", []) + operations.get("unlink", [])
+    todo_ids = (
+        [item["id"] for item in operations.get("update", [])]
+        + operations.get("delete", [])
+        + [link["todo_id"] for link in links]
+    )
+    with track(user_id, todo_ids) as tracked:
+        results = {
+            "create": _create(user_id, operations.get("create", [])),
+            "update": _update(user_id, operations.get("update", [])),
+            "delete": _delete(user_id, operations.get("delete", [])),
+            "link": _link(user_id, operations.get("link", [])),
+            "unlink": _unlink(user_id, operations.get("unlink", [])),
+        }
+        tracked.created(r["id"] for r in results["create"])
+    if any(r["status"] < 400 for items in results.values() for r in items):
+        bump_version(user_id)
+        # 項目ごとではなく、一括操作1回につき1イベントにまとめる
+        emit(
+            user_id,
+            "todos.bulk",
+            {
+                op: sorted({r["id"] for r in items if r["status"] < 400})
+                for op, items in results.items()
+            },
+        )
+    return results
+
+
+@register("todos.bulk")
+def run_bulk(user_id, payload):
+    """件数の多い一括操作をワーカーで実行する。payload はリクエストの本文"""
+    return apply_bulk(user_id, TodoBulkSchema().load(payload))
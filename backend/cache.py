@@ -0,0 +1,219 @@
+"""
+読み取りの多い応答の read-through キャッシュ
+
+/api/tags と /api/me の JSON をユーザーごとにキャッシュする。
+ETag に使うバージョン番号は 304 の判定に使うのでキャッシュせず、毎回 DB から読む。
+キーは "<名前>:<user_id>:<世代>" で、書き込みがコミットされたら変わった名前の世代だけを
+1つ進める。古い世代のエントリーは読まれなくなり、LRU と TTL でそのうち消える。
+
+世代を読んでから DB を読むので、読み込みの途中で書き込みがコミットされても、
+古い内容は古い世代のキーにしか保存されない。
+レプリカは書き込みより遅れることがあるので、レプリカから読んだ内容は保存しない。
+
+どの書き込みがどのキャッシュを変えるかは INVALIDATES にまとめてある。
+emit() したイベントの種類から決めるので、書き込みのハンドラーに手を入れる必要はない。
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from db import RoutingSession, db, using_replica
+from resp import RespClient, RespError
+
+logger = logging.getLogger(__name__)
+
+NAMES = ("tags", "profile")
+
+# 変更イベントの種類 -> 内容が変わるキャッシュ
+INVALIDATES = {
+    # /api/me の todo は PlainTodoSchema (タグを含まない)
+    "todo.created": ("profile",),
+    "todo.updated": ("profile",),
+    "todo.deleted": ("profile",),
+    "todos.bulk": ("profile",),
+    "tag.created": ("tags", "profile"),
+    "tag.deleted": ("tags", "profile"),
+    # タグ付けはどちらの内容も変えない
+    "tag.linked": (),
+    "tag.unlinked": (),
+    "todo.tags_replaced": (),
+    "import.progress": ("tags", "profile"),
+}
+
+
+class InMemoryCache:
+    """
+    プロセス内の LRU。ワーカーが複数あると他のワーカーの書き込みでは無効にならない
+    """
+
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # 世代はユーザーと名前ごとの整数だけなので追い出さない
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, key):
+        return self._generations.get(key, 0)
+
+    def bump(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisCache:
+    """
+    Redis プロトコルのストア。プロセス間でキャッシュと世代を共有する
+
+    エントリーは SET PX で期限を付ける。上限を超えた分の追い出しは
+    サーバーの maxmemory-policy (allkeys-lru など) に任せる。
+    """
+
+    def __init__(self, url, prefix="cache"):
+        self.client = RespClient(url)
+        self.prefix = prefix
+
+    def generation(self, key):
+        return int(self.client.execute("GET", f"{self.prefix}:gen:{key}") or 0)
+
+    def bump(self, key):
+        self.client.execute("INCR", f"{self.prefix}:gen:{key}")
+
+    def get(self, key):
+        value = self.client.execute("GET", f"{self.prefix}:{key}")
+        return value.encode("utf-8") if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.execute(
+            "SET", f"{self.prefix}:{key}", value, "PX", max(1, int(ttl * 1000))
+        )
+
+
+def create_store(url, max_entries=10_000):
+    if url.startswith("memory://"):
+        return InMemoryCache(max_entries)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisCache(url)
+    raise ValueError(f"Unsupported cache store: {url}")
+
+
+class ReadThroughCache:
+    def __init__(self, app=None):
+        self.store = InMemoryCache()
+        self.enabled = True
+        self.ttl = 300.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "CACHE_ENABLED",
+            os.getenv("CACHE_ENABLED", "1").lower() not in ("0", "false", "no", "off"),
+        )
+        # ワーカーが複数あるときは redis:// にする (memory:// はプロセスごとに別)
+        app.config.setdefault("CACHE_URL", os.getenv("CACHE_URL", "memory://"))
+        # Web のワーカープロセスの数 (gunicorn.conf.py が設定する)
+        app.config.setdefault("WEB_CONCURRENCY", int(os.getenv("WEB_CONCURRENCY", "1")))
+        app.config.setdefault(
+            "CACHE_MAX_ENTRIES", int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+        )
+        # 無効化が届かなかったときの保険
+        app.config.setdefault("CACHE_TTL", float(os.getenv("CACHE_TTL", "300")))
+        self.enabled = app.config["CACHE_ENABLED"]
+        self.ttl = app.config["CACHE_TTL"]
+        local = app.config["CACHE_URL"].startswith("memory://")
+        if self.enabled and local and app.config["WEB_CONCURRENCY"] > 1:
+            # 他のワーカーの書き込みで無効にならず古い内容を返し続けるので使わない
+            logger.warning(
+                "CACHE_URL=memory:// is not shared between %d workers; "
+                "the read-through cache is disabled (set CACHE_URL=redis://...)",
+                app.config["WEB_CONCURRENCY"],
+            )
+            self.enabled = app.config["CACHE_ENABLED"] = False
+        self.store = create_store(
+            app.config["CACHE_URL"], app.config["CACHE_MAX_ENTRIES"]
+        )
+        app.extensions["cache"] = self
+
+    def get_or_set(self, name, user_id, load):
+        """
+        キャッシュにあればそれを、無ければ load() の結果 (bytes) を保存して返す
+        """
+        if not self.enabled:
+            return load()
+        try:
+            generation = self.store.generation(f"{name}:{user_id}")
+            key = f"{name}:{user_id}:{generation}"
+            value = self.store.get(key)
+        except (OSError, RespError):
+            # ストアが落ちていても DB から返す
+            logger.warning("cache store is unavailable", exc_info=True)
+            return load()
+        if value is not None:
+            return value
+        value = load()
+        if using_replica():
+            # 書き込みの直後だとコミット前の内容が新しい世代に残ってしまう
+            return value
+        try:
+            self.store.set(key, value, self.ttl)
+        except (OSError, RespError):
+            logger.warning("failed to store %s in cache", key)
+        return value
+
+    def invalidate(self, user_id, names=NAMES):
+        for name in names:
+            try:
+                self.store.bump(f"{name}:{user_id}")
+            except (OSError, RespError):
+                # 他のワーカーには TTL が切れるまで古い内容が見える
+                logger.warning("failed to invalidate %s for user %s", name, user_id)
+
+    def invalidate_on_commit(self, user_id, names):
+        """書き込みと同じトランザクションで呼ぶ。コミットされたら無効にする"""
+        pending = db.session.info.setdefault("cache_invalidations", {})
+        pending.setdefault(user_id, set()).update(names)
+
+
+cache = ReadThroughCache()
+
+
+@event.listens_for(RoutingSession, "before_commit")
+def _collect_changes(session):
+    # emit() したイベントは after_commit で配信されて消えるので、コミットの前に読む
+    pending = session.info.setdefault("cache_invalidations", {})
+    for user_id, type, _ in session.info.get("pending_changes", []):
+        pending.setdefault(user_id, set()).update(INVALIDATES.get(type, NAMES))
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _invalidate_pending(session):
+    for user_id, names in session.info.pop("cache_invalidations", {}).items():
+        cache.invalidate(user_id, names)
+
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def _discard_pending(session, previous_transaction):
+    session.info.pop("cache_invalidations", None)
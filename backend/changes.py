@@ -0,0 +1,248 @@
+"""
+ユーザーごとの変更フィード (Server-Sent Events)
+
+書き込み側は emit() でイベントを積み、コミットされたときだけ配信する。
+配信先はユーザーごとに長さの上限があるログで、Last-Event-ID からの再開に使う。
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from sqlalchemy import event
+from db import RoutingSession, db
+from resp import RespClient, RespError
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryChangeStore:
+    """プロセス内だけで共有するストア。開発・テスト用"""
+
+    def __init__(self, replay_size=1000):
+        self.replay_size = replay_size
+        self._logs = defaultdict(lambda: deque(maxlen=self.replay_size))
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    def parse_id(self, value):
+        return value if value and value.isdigit() else None
+
+    def append(self, user_id, change):
+        with self._cond:
+            self._last_id += 1
+            self._logs[user_id].append((self._last_id, change))
+            self._cond.notify_all()
+            return str(self._last_id)
+
+    def latest(self, user_id):
+        log = self._logs.get(user_id)
+        return str(log[-1][0]) if log else "0"
+
+    def truncated(self, user_id, last_id):
+        """last_id の直後のイベントがログから押し出されているかもしれない"""
+        log = self._logs.get(user_id)
+        return bool(log) and len(log) == log.maxlen and log[0][0] > int(last_id)
+
+    def _after(self, user_id, last_id):
+        log = self._logs.get(user_id) or ()
+        return [(str(id), change) for id, change in log if id > last_id]
+
+    def read(self, user_id, last_id, block=None):
+        """last_id より後のイベントを返す。無ければ最大 block 秒待つ"""
+        last_id = int(last_id)
+        with self._cond:
+            changes = self._after(user_id, last_id)
+            if not changes and block:
+                self._cond.wait(block)
+                changes = self._after(user_id, last_id)
+        return changes
+
+
+class RedisChangeStore:
+    """
+    Redis プロトコルのストア。プロセス間でイベントを配る
+
+    changes:<user_id> の stream に XADD MAXLEN で上限付きで積み、
+    購読側は XREAD BLOCK で新しいイベントを待つ。
+    """
+
+    ID_RE = re.compile(r"^\d+(-\d+)?$")
+
+    def __init__(self, url, replay_size=1000, block=15.0, prefix="changes"):
+        # XREAD BLOCK の間はソケットのタイムアウトで切れないようにする
+        self.client = RespClient(url, timeout=block + 1.0)
+        self.replay_size = replay_size
+        self.prefix = prefix
+
+    def _key(self, user_id):
+        return f"{self.prefix}:{user_id}"
+
+    def parse_id(self, value):
+        return value if value and self.ID_RE.match(value) else None
+
+    def append(self, user_id, change):
+        return self.client.execute(
+            "XADD",
+            self._key(user_id),
+            "MAXLEN",
+            self.replay_size,
+            "*",
+            "change",
+            json.dumps(change),
+        )
+
+    def latest(self, user_id):
+        entries = self.client.execute(
+            "XREVRANGE", self._key(user_id), "+", "-", "COUNT", 1
+        )
+        return entries[0][0] if entries else "0"
+
+    def truncated(self, user_id, last_id):
+        key = self._key(user_id)
+        length, first = self.client.pipeline(
+            [["XLEN", key], ["XRANGE", key, "-", "+", "COUNT", 1]]
+        )
+        if length < self.replay_size or not first:
+            return False
+        return _stream_id(first[0][0]) > _stream_id(last_id)
+
+    def read(self, user_id, last_id, block=None):
+        args = ["XREAD", "COUNT", 100]
+        if block:
+            # BLOCK 0 は無期限に待つ意味になるので、待たないときは付けない
+            args += ["BLOCK", max(1, int(block * 1000))]
+        reply = self.client.execute(*args, "STREAMS", self._key(user_id), last_id)
+        if not reply:
+            return []
+        _, entries = reply[0]
+        return [
+            (id, json.loads(dict(zip(f[::2], f[1::2]))["change"])) for id, f in entries
+        ]
+
+
+def _stream_id(value):
+    ms, _, seq = value.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def create_store(url, replay_size=1000, block=15.0):
+    if url.startswith("memory://"):
+        return InMemoryChangeStore(replay_size)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisChangeStore(url, replay_size, block)
+    raise ValueError(f"Unsupported change feed store: {url}")
+
+
+def _sse(id=None, data=None, comment=None):
+    lines = []
+    if comment is not None:
+        lines.append(f": {comment}")
+    if id is not None:
+        lines.append(f"id: {id}")
+    if data is not None:
+        lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class ChangeFeed:
+    """
+    todo / tag / タグ付けの変更をユーザーごとに配信する
+
+    クライアントは EventSource で購読し、切断されたら Last-Event-ID 付きで繋ぎ直す。
+    ログから押し出された分が欠けている場合は reset を送るので、一覧を取り直す。
+    1回の応答は max_duration 秒までで、その間に届いた分を返したら閉じる (long-poll)。
+    """
+
+    def __init__(self, app=None):
+        self.store = InMemoryChangeStore()
+        self.keepalive = 15.0
+        self.max_duration = 25.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "CHANGE_FEED_URL", os.getenv("CHANGE_FEED_URL", "memory://")
+        )
+        app.config.setdefault("CHANGE_FEED_REPLAY_SIZE", 1000)
+        app.config.setdefault("CHANGE_FEED_KEEPALIVE", 15.0)
+        # 1つの接続は gthread のスレッドを1本使い続けるので、短い long-poll の時間で
+        # 切ってクライアントに Last-Event-ID 付きで繋ぎ直させる
+        app.config.setdefault(
+            "CHANGE_FEED_MAX_DURATION",
+            float(os.getenv("CHANGE_FEED_MAX_DURATION", "25")),
+        )
+        self.keepalive = app.config["CHANGE_FEED_KEEPALIVE"]
+        self.max_duration = app.config["CHANGE_FEED_MAX_DURATION"]
+        self.store = create_store(
+            app.config["CHANGE_FEED_URL"],
+            app.config["CHANGE_FEED_REPLAY_SIZE"],
+            self.keepalive,
+        )
+        app.extensions["change_feed"] = self
+
+    def publish(self, user_id, type, data):
+        return self.store.append(user_id, {"type": type, "data": data})
+
+    def stream(self, user_id, last_event_id=None):
+        """SSE の本文を少しずつ返すジェネレーター"""
+        # 応答を閉じるたびにすぐ繋ぎ直してもらう
+        yield "retry: 1000\n\n"
+        last_id = self.store.parse_id(last_event_id)
+        if last_id is None:
+            last_id = self.store.latest(user_id)
+            yield _sse(last_id, {"type": "ready"})
+        elif self.store.truncated(user_id, last_id):
+            last_id = self.store.latest(user_id)
+            yield _sse(last_id, {"type": "reset"})
+        deadline = time.monotonic() + self.max_duration
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            changes = self.store.read(
+                user_id, last_id, block=min(self.keepalive, remaining)
+            )
+            for id, change in changes:
+                yield _sse(id, change)
+            if changes:
+                # 届いた分を返したら閉じてスレッドを空ける。続きは Last-Event-ID から
+                return
+            yield _sse(comment="keepalive")
+
+
+feed = ChangeFeed()
+
+
+def emit(user_id, type, data):
+    """変更イベントを積む。書き込みと同じトランザクションで呼び、コミットされたら配信する"""
+    db.session.info.setdefault("pending_changes", []).append((user_id, type, data))
+
+
+def todo_fields(todo):
+    deadline = todo.deadline.isoformat() if todo.deadline else None
+    return {
+        "id": todo.id,
+        "name": todo.name,
+        "deadline": deadline,
+        "is_done": todo.is_done,
+    }
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _publish_pending(session):
+    for user_id, type, data in session.info.pop("pending_changes", []):
+        try:
+            feed.publish(user_id, type, data)
+        except (OSError, RespError):
+            # 配信に失敗しても書き込み自体は成功している。クライアントは再接続で取り直す
+            logger.warning("failed to publish %s for user %s", type, user_id)
+
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def _discard_pending(session, previous_transaction):
+    session.info.pop("pending_changes", None)
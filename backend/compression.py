@@ -0,0 +1,271 @@
+"""
+レスポンスの圧縮
+
+Accept-Encoding に応じて br (brotli) / zstd (zstandard) / gzip で圧縮する。
+brotli と zstandard は任意の依存で、入っていなければ gzip だけを使う。
+
+- COMPRESSION_MIN_SIZE バイト未満の応答はそのまま返す (圧縮しても小さくならない)
+- ストリーミングの応答 (エクスポート) は少しずつ圧縮して流す
+- 変更フィード (text/event-stream) は1イベントずつ届ける必要があるので圧縮しない
+- 圧縮した応答の ETag は弱い ETag (W/"...") にする
+"""
+
+import hashlib
+import os
+import threading
+import zlib
+from flask import current_app, request
+from instrumentation import timer
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli は任意の依存
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard は任意の依存
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "text/csv",
+    "text/html",
+    "text/plain",
+    "text/css",
+)
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level):
+        self.level = level
+
+    def _compressobj(self):
+        # wbits=31 で gzip のヘッダーとトレーラーを付ける
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        c = self._compressobj()
+        return c.compress(data) + c.flush()
+
+    def stream(self):
+        c = self._compressobj()
+        return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def stream(self):
+        c = brotli.Compressor(quality=self.level)
+        return c.process, c.flush, c.finish
+
+
+class ZstdEncoder:
+    name = "zstd"
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def stream(self):
+        c = zstandard.ZstdCompressor(level=self.level).compressobj()
+        return (
+            c.compress,
+            lambda: c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+            c.flush,
+        )
+
+
+def available_encoders(levels):
+    """使える圧縮方式を優先する順に返す"""
+    encoders = []
+    if brotli is not None:
+        encoders.append(BrotliEncoder(levels["br"]))
+    if zstandard is not None:
+        encoders.append(ZstdEncoder(levels["zstd"]))
+    encoders.append(GzipEncoder(levels["gzip"]))
+    return encoders
+
+
+def _compressible(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or "Content-Encoding" in response.headers:
+        return False
+    if "no-transform" in response.headers.get("Cache-Control", ""):
+        return False
+    return response.mimetype in current_app.config["COMPRESSION_MIMETYPES"]
+
+
+class Compression:
+    def __init__(self, app=None):
+        self.encoders = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """instrumentation.init_app() の後に呼ぶ (圧縮の時間も Server-Timing に載る)"""
+        app.config.setdefault(
+            "COMPRESSION_ENABLED",
+            os.getenv("COMPRESSION_ENABLED", "1").lower()
+            not in ("0", "false", "no", "off"),
+        )
+        app.config.setdefault(
+            "COMPRESSION_MIN_SIZE", int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+        )
+        # 動的な応答なので速さを優先した圧縮率にする
+        app.config.setdefault("COMPRESSION_LEVELS", {"gzip": 6, "br": 4, "zstd": 3})
+        # ストリーミングではこのバイト数ごとに圧縮済みの分を送り出す
+        app.config.setdefault("COMPRESSION_STREAM_FLUSH_SIZE", 64 * 1024)
+        app.config.setdefault("COMPRESSION_MIMETYPES", COMPRESSIBLE_MIMETYPES)
+        # StaticAsset の Cache-Control: max-age。URL は変わらないので ETag で再検証させる
+        app.config.setdefault(
+            "STATIC_ASSET_MAX_AGE", int(os.getenv("STATIC_ASSET_MAX_AGE", "86400"))
+        )
+        self.encoders = {
+            encoder.name: encoder
+            for encoder in available_encoders(app.config["COMPRESSION_LEVELS"])
+        }
+        app.extensions["compression"] = self
+        if not app.config["COMPRESSION_ENABLED"]:
+            return
+        app.before_request(self._normalize_if_none_match)
+        app.after_request(self._after_request)
+
+    def negotiate(self):
+        """Accept-Encoding から圧縮方式を選ぶ。圧縮しないなら None"""
+        if not current_app.config["COMPRESSION_ENABLED"]:
+            return None
+        return request.accept_encodings.best_match(list(self.encoders))
+
+    def _normalize_if_none_match(self):
+        # If-None-Match は弱い比較なので、圧縮した応答の W/"..." も元の ETag と一致させる
+        # (flask-smorest は強い ETag としか比べない)
+        value = request.environ.get("HTTP_IF_NONE_MATCH")
+        if value and "W/" in value:
+            request.environ["HTTP_IF_NONE_MATCH"] = value.replace("W/", "")
+
+    def _after_request(self, response):
+        if not _compressible(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+        encoder = self.encoders[encoding]
+        if response.is_streamed:
+            # ジェネレーターはリクエストのコンテキストの外で回るので設定は先に読む
+            response.response = self._stream(
+                encoder,
+                response.response,
+                current_app.config["COMPRESSION_STREAM_FLUSH_SIZE"],
+            )
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < current_app.config["COMPRESSION_MIN_SIZE"]:
+                return response
+            with timer("compress"):
+                response.set_data(encoder.compress(data))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _stream(self, encoder, chunks, flush_size):
+        compress, flush, finish = encoder.stream()
+        pending = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                out = compress(chunk)
+                pending += len(chunk)
+                # 圧縮器の中に溜めたままにせず、一定量ごとにクライアントへ送る
+                if pending >= flush_size:
+                    out += flush()
+                    pending = 0
+                if out:
+                    yield out
+            yield finish()
+        finally:
+            # stream_with_context のコンテキストを確実に片付ける
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+
+compression = Compression()
+
+
+class StaticAsset:
+    """
+    一度だけ作って使い回す応答 (OpenAPI の JSON、GraphiQL の HTML)
+
+    圧縮した本文も方式ごとに1回だけ作る。ETag と Cache-Control を付け、
+    If-None-Match が一致すれば 304 を返す。
+    """
+
+    def __init__(self, build, mimetype):
+        self._build = build
+        self.mimetype = mimetype
+        self._lock = threading.Lock()
+        self._body = None
+        self._etag = None
+        self._encoded = {}
+
+    @property
+    def built(self):
+        return self._body is not None
+
+    def build(self):
+        """本文を作る。gunicorn の preload では fork の前に呼んでおく"""
+        if self._body is None:
+            with self._lock:
+                if self._body is None:
+                    body = self._build()
+                    if isinstance(body, str):
+                        body = body.encode("utf-8")
+                    self._etag = hashlib.sha256(body).hexdigest()[:32]
+                    self._body = body
+        return self._body, self._etag
+
+    def _encode(self, encoding, body):
+        encoded = self._encoded.get(encoding)
+        if encoded is None:
+            encoded = compression.encoders[encoding].compress(body)
+            self._encoded[encoding] = encoded
+        return encoded
+
+    def response(self):
+        body, etag = self.build()
+        encoding = None
+        if len(body) >= current_app.config["COMPRESSION_MIN_SIZE"]:
+            encoding = compression.negotiate()
+        response = current_app.response_class(mimetype=self.mimetype)
+        response.set_etag(etag, weak=encoding is not None)
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config["STATIC_ASSET_MAX_AGE"]
+        response.vary.add("Accept-Encoding")
+        if request.if_none_match.contains_weak(etag):
+            response.status_code = 304
+            return response
+        if encoding is not None:
+            response.set_data(self._encode(encoding, body))
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response.set_data(body)
+        return response
@@ -1,3 +1,24 @@
+from flask import current_app, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 
-db = SQLAlchemy()
+
+def using_replica():
+    """このリクエストの読み取りがリードレプリカに振り分けられているか"""
+    return (
+        has_app_context()
+        and g.get("db_use_replica", False)
+        and "db_replica" in current_app.extensions
+    )
+
+
+class RoutingSession(Session):
+    """読み取り専用のリクエストでは、設定があればリードレプリカに振り分ける"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and using_replica():
+            return current_app.extensions["db_replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
@@ -0,0 +1,106 @@
+import os
+from flask import g, request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from db import db
+
+READ_METHODS = ("GET", "HEAD")
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+def _is_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def configure_engine(app):
+    """
+    環境変数からエンジンの設定を組み立てる。db.init_app() より前に呼ぶこと
+
+    DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT / DB_POOL_RECYCLE / DB_POOL_PRE_PING
+    DATABASE_READ_URL: 指定するとリードレプリカとして使う
+    """
+    options = {
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    }
+    # メモリ上の SQLite は StaticPool なのでプールの大きさは指定できない
+    if not _is_memory_sqlite(app.config["SQLALCHEMY_DATABASE_URI"]):
+        options["pool_size"] = int(os.getenv("DB_POOL_SIZE", "10"))
+        options["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+        options["pool_timeout"] = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", options)
+
+    app.config.setdefault(
+        "SQLITE_BUSY_TIMEOUT_MS", int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    )
+    app.config.setdefault(
+        "SQLITE_MMAP_SIZE", int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    )
+
+    app.config.setdefault("DATABASE_READ_URL", os.getenv("DATABASE_READ_URL"))
+
+
+def _sqlite_pragmas(app, memory):
+    busy_timeout = app.config["SQLITE_BUSY_TIMEOUT_MS"]
+    mmap_size = app.config["SQLITE_MMAP_SIZE"]
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL にすると読み取りが書き込みを待たなくなる
+        if not memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.close()
+
+    return set_pragmas
+
+
+def init_app(app):
+    """db.init_app() の後に呼ぶ。SQLite の PRAGMA とレプリカへの振り分けを設定する"""
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    # レプリカはモデルの bind とは別に持ち、読み取りのときだけ RoutingSession が使う
+    read_url = app.config["DATABASE_READ_URL"]
+    if read_url:
+        options = dict(app.config["SQLALCHEMY_ENGINE_OPTIONS"])
+        if _is_memory_sqlite(read_url):
+            for key in ("pool_size", "max_overflow", "pool_timeout"):
+                options.pop(key, None)
+        replica = create_engine(read_url, **options)
+        app.extensions["db_replica"] = replica
+        engines.append(replica)
+
+    for engine in engines:
+        if engine.dialect.name == "sqlite":
+            memory = _is_memory_sqlite(engine.url)
+            event.listen(engine, "connect", _sqlite_pragmas(app, memory))
+
+    @app.before_request
+    def route_reads_to_replica():
+        g.db_use_replica = request.method in READ_METHODS
+
+
+def use_replica(enabled=True):
+    """GraphQL の query のように、POST でも読み取りだけのときに呼ぶ"""
+    g.db_use_replica = enabled
+
+
+def dispose_engines(app):
+    """
+    fork した子プロセスで呼ぶ。親のプールの接続を閉じずに手放し、子では新しく繋ぐ
+
+    (gunicorn の preload_app で親がアプリを読み込んだ場合)
+    """
+    with app.app_context():
+        engines = list(db.engines.values())
+    if "db_replica" in app.extensions:
+        engines.append(app.extensions["db_replica"])
+    for engine in engines:
+        engine.dispose(close=False)
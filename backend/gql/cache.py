@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from graphql import parse, validate
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("query", "document", "validation")
+
+    def __init__(self, query, document):
+        self.query = query
+        self.document = document
+        # ルールの組み合わせごとの検証結果
+        self.validation = {}
+
+
+class DocumentCache:
+    """
+    パース・検証済みの GraphQL ドキュメントを保持する LRU キャッシュ
+
+    キーはクエリ文字列の SHA-256 なので、persisted query のハッシュでも引ける。
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._by_document = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.persisted_not_found = 0
+
+    def get(self, sha256_hash):
+        with self._lock:
+            entry = self._entries.get(sha256_hash)
+            if entry is None:
+                self.persisted_not_found += 1
+                return None
+            self._entries.move_to_end(sha256_hash)
+            self.hits += 1
+            return entry
+
+    def get_or_parse(self, query):
+        key = query_hash(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # パースはロックの外で行う。失敗した場合はキャッシュしない
+        entry = _Entry(query, parse(query))
+        with self._lock:
+            self._entries[key] = entry
+            self._by_document[id(entry.document)] = entry
+            while len(self._entries) > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._by_document.pop(id(evicted.document), None)
+                self.evictions += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_document.clear()
+            self.hits = self.misses = self.evictions = self.persisted_not_found = 0
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "persisted_not_found": self.persisted_not_found,
+        }
+
+    # ariadne の query_parser / query_validator として渡す
+    def query_parser(self, context_value, data):
+        return self.get_or_parse(data["query"]).document
+
+    def query_validator(self, schema, document_ast, rules=None, **kwargs):
+        # リクエストごとに結果が変わるルール (変数を見るコスト計算など) はキャッシュしない
+        rules = tuple(rules or ())
+        per_request = tuple(r for r in rules if not getattr(r, "cacheable", True))
+        rules = tuple(r for r in rules if getattr(r, "cacheable", True))
+        errors = self._validate(schema, document_ast, rules or None, **kwargs)
+        if errors or not per_request:
+            return errors
+        return validate(schema, document_ast, rules=per_request, **kwargs)
+
+    def _validate(self, schema, document_ast, rules, **kwargs):
+        entry = self._by_document.get(id(document_ast))
+        if entry is None or entry.document is not document_ast:
+            return validate(schema, document_ast, rules=rules, **kwargs)
+        key = (id(schema), tuple(rules or ()))
+        errors = entry.validation.get(key)
+        if errors is None:
+            errors = validate(schema, document_ast, rules=rules, **kwargs)
+            entry.validation[key] = errors
+        return errors
+
+
+document_cache = DocumentCache(int(os.getenv("GRAPHQL_DOCUMENT_CACHE_SIZE", "256")))
@@ -0,0 +1,245 @@
+"""
+GraphQL クエリの深さとコストの見積もり
+
+リゾルバを実行する前 (検証の段階) に、フィールドの重みとリストの件数の見積もりから
+コストを計算し、上限を超えるクエリを拒否する。
+
+    コスト = 件数の見積もり × (フィールドの重み + 子フィールドのコスト)
+
+スカラーのフィールドは重み 0、オブジェクトを返すフィールドは重み 1 が基本。
+"""
+
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    OperationDefinitionNode,
+    OperationType,
+    Undefined,
+    get_named_type,
+    get_nullable_type,
+    is_composite_type,
+    value_from_ast,
+)
+from graphql.validation import ValidationRule
+
+# "型.フィールド" ごとの重み。ここに無いものは上の基本値
+FIELD_WEIGHTS = {
+    # 全文検索はインデックスを引くので通常の一覧より重い
+    "Query.searchTodos": 3,
+}
+
+# リストを返すフィールドの件数の見積もり。
+# 数値はそのまま、文字列はその名前の引数 (数値ならその値、リストなら長さ) を使う。
+# 関数 (リクエストごとの list_sizes で渡す) は実際の件数を返す
+LIST_SIZES = {
+    # 全件を返す。リクエストでは list_sizes でユーザーの todo の件数に置き換える
+    "Query.todos": 100,
+    "Query.searchTodos": "limit",
+    "Todo.tags": 5,
+    "TodoStats.tags": 20,
+    "TodoStats.histogram": 31,
+    "Calendar.days": 31,
+    "Mutation.createTodos": "todos",
+    "Mutation.updateTodos": "todos",
+    "Mutation.deleteTodos": "ids",
+    "Mutation.linkTags": "links",
+    "Mutation.unlinkTags": "links",
+}
+DEFAULT_LIST_SIZE = 10
+
+
+def _is_list(type_):
+    return isinstance(get_nullable_type(type_), GraphQLList)
+
+
+def _argument(field_node, field_def, name, variables):
+    arg_def = field_def.args.get(name)
+    if arg_def is None:
+        return None
+    for arg in field_node.arguments:
+        if arg.name.value == name:
+            value = value_from_ast(arg.value, arg_def.type, variables)
+            if value is not Undefined and value is not None:
+                return value
+    # 省略された場合 (変数が渡されなかった場合も) はスキーマのデフォルト値
+    default = arg_def.default_value
+    return None if default is Undefined else default
+
+
+class CostAnalysis:
+    """1つのドキュメントの深さとコストを求める"""
+
+    def __init__(self, schema, fragments, variables=None, list_sizes=None):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables or {}
+        self.list_sizes = {**LIST_SIZES, **(list_sizes or {})}
+        self._computed = {}
+
+    def list_size(self, key, field_node, field_def):
+        spec = self.list_sizes.get(key, DEFAULT_LIST_SIZE)
+        if callable(spec):
+            # クエリにそのフィールドがあるときだけ、1回だけ求める
+            if key not in self._computed:
+                self._computed[key] = spec()
+            return self._computed[key]
+        if isinstance(spec, int):
+            return spec
+        value = _argument(field_node, field_def, spec, self.variables)
+        if isinstance(value, (list, tuple)):
+            return len(value)
+        if isinstance(value, int):
+            return max(value, 0)
+        return DEFAULT_LIST_SIZE
+
+    def selection_set(self, parent_type, selection_set, visited=frozenset()):
+        """(深さ, コスト) を返す"""
+        depth, cost = 0, 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                d, c = self.field(parent_type, selection, visited)
+            else:
+                if isinstance(selection, FragmentSpreadNode):
+                    name = selection.name.value
+                    fragment = self.fragments.get(name)
+                    if fragment is None or name in visited:
+                        continue
+                    inner = visited | {name}
+                else:
+                    fragment, inner = selection, visited
+                type_condition = fragment.type_condition
+                fragment_type = (
+                    self.schema.get_type(type_condition.name.value)
+                    if type_condition
+                    else parent_type
+                )
+                d, c = self.selection_set(fragment_type, fragment.selection_set, inner)
+            depth = max(depth, d)
+            cost += c
+        return depth, cost
+
+    def field(self, parent_type, field_node, visited):
+        name = field_node.name.value
+        # __typename やイントロスペクションは数えない
+        if name.startswith("__"):
+            return 0, 0
+        field_def = parent_type.fields.get(name)
+        if field_def is None:
+            return 0, 0
+        key = f"{parent_type.name}.{name}"
+        named_type = get_named_type(field_def.type)
+        weight = FIELD_WEIGHTS.get(key, 1 if is_composite_type(named_type) else 0)
+        # 深さは選択セットの入れ子の数 ({ todos { id } } が 1)
+        depth, children = 0, 0
+        if field_node.selection_set:
+            depth, children = self.selection_set(
+                named_type, field_node.selection_set, visited
+            )
+            depth += 1
+        size = (
+            self.list_size(key, field_node, field_def)
+            if _is_list(field_def.type)
+            else 1
+        )
+        return depth, size * (weight + children)
+
+    def operation(self, operation):
+        root_type = {
+            OperationType.QUERY: self.schema.query_type,
+            OperationType.MUTATION: self.schema.mutation_type,
+            OperationType.SUBSCRIPTION: self.schema.subscription_type,
+        }[operation.operation]
+        if root_type is None:
+            return 0, 0
+        return self.selection_set(root_type, operation.selection_set)
+
+
+def analyze(schema, document, operation_name=None, variables=None, list_sizes=None):
+    """
+    実行されるオペレーションの (深さ, コスト) を返す
+
+    operation_name が無くオペレーションが複数ある場合は一番重いものを返す。
+    list_sizes はリクエストごとに LIST_SIZES を上書きする
+    """
+    fragments = {}
+    operations = []
+    for definition in document.definitions:
+        if isinstance(definition, OperationDefinitionNode):
+            if operation_name is None or (
+                definition.name and definition.name.value == operation_name
+            ):
+                operations.append(definition)
+        elif hasattr(definition, "type_condition"):
+            fragments[definition.name.value] = definition
+    analysis = CostAnalysis(schema, fragments, variables, list_sizes)
+    results = [analysis.operation(operation) for operation in operations]
+    if not results:
+        return 0, 0
+    return max(d for d, _ in results), max(c for _, c in results)
+
+
+class CostLimitRule(ValidationRule):
+    """
+    深さ・コストの上限を確認する検証ルール
+
+    変数によって結果が変わるので、リクエストごとに cost_limit_rule() で作る。
+    DocumentCache はこのルールの結果をキャッシュしない。
+    """
+
+    cacheable = False
+    max_depth = None
+    max_cost = None
+    operation_name = None
+    variables = None
+    list_sizes = None
+    report = None
+
+    def enter_document(self, node, *_):
+        depth, cost = analyze(
+            self.context.schema,
+            node,
+            self.operation_name,
+            self.variables,
+            self.list_sizes,
+        )
+        self.report.update(
+            depth=depth, cost=cost, maxDepth=self.max_depth, maxCost=self.max_cost
+        )
+        if self.max_depth is not None and depth > self.max_depth:
+            self.report_error(
+                GraphQLError(
+                    f"Query depth {depth} exceeds the maximum of {self.max_depth}.",
+                    extensions={"code": "QUERY_TOO_DEEP"},
+                )
+            )
+        if self.max_cost is not None and cost > self.max_cost:
+            self.report_error(
+                GraphQLError(
+                    f"Query cost {cost} exceeds the maximum of {self.max_cost}.",
+                    extensions={"code": "QUERY_TOO_COMPLEX"},
+                )
+            )
+        return self.SKIP
+
+
+def cost_limit_rule(max_depth, max_cost, data, report, list_sizes=None):
+    """
+    リクエスト1回分の CostLimitRule を作る
+
+    計算した深さとコストは report (dict) に書き込まれる
+    """
+    data = data if isinstance(data, dict) else {}
+    return type(
+        "CostLimitRule",
+        (CostLimitRule,),
+        {
+            "max_depth": max_depth,
+            "max_cost": max_cost,
+            "operation_name": data.get("operationName"),
+            "variables": data.get("variables") or {},
+            "list_sizes": list_sizes,
+            "report": report,
+        },
+    )
@@ -1,8 +1,29 @@
+import os
+from functools import lru_cache
 from ariadne import make_executable_schema, load_schema_from_path
-from gql.resolvers import query, todo
 
-# .graphqlファイルを読み込む
-type_defs = load_schema_from_path("gql/schema.graphql")
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema.graphql")
 
-# スキーマとリゾルバ(query)を結合して、実行可能な状態にする
-schema = make_executable_schema(type_defs, [query, todo])
+
+@lru_cache(maxsize=None)
+def get_schema():
+    """
+    実行可能なスキーマを最初に使われたときに作る
+
+    create_app() やテストのたびには作らない。gunicorn の preload では wsgi.py が
+    fork の前に呼ぶので、ワーカーは親で作ったものを共有する。
+    """
+    from gql.resolvers import query, todo, mutation
+
+    # .graphqlファイルを読み込む
+    type_defs = load_schema_from_path(SCHEMA_PATH)
+
+    # スキーマとリゾルバ(query)を結合して、実行可能な状態にする
+    return make_executable_schema(type_defs, [query, todo, mutation])
+
+
+def __getattr__(name):
+    # 以前の from gql.index import schema もそのまま使えるようにする
+    if name == "schema":
+        return get_schema()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,76 @@
+from collections import defaultdict
+from db import db
+from models import TagModel, TodoTags, UserModel
+
+IN_CHUNK_SIZE = 1000
+
+
+class DataLoader:
+    """
+    リクエスト単位でキーをまとめて1回のクエリで取得するローダー
+
+    graphql_sync は同期実行なので、リストを返すリゾルバで先に
+    prime_keys() しておき、最初の load() で溜まったキーをまとめて取得する。
+    """
+
+    def __init__(self, batch_fn, default=None):
+        self._batch_fn = batch_fn
+        self._default = default
+        self._cache = {}
+        self._pending = set()
+
+    def prime_keys(self, keys):
+        self._pending.update(key for key in keys if key not in self._cache)
+
+    def load(self, key):
+        if key not in self._cache:
+            self._pending.add(key)
+            keys = list(self._pending)
+            self._pending.clear()
+            results = self._batch_fn(keys)
+            for k in keys:
+                self._cache[k] = results.get(k, self._default)
+        value = self._cache[key]
+        return list(value) if isinstance(value, list) else value
+
+
+def _chunks(keys):
+    # バインド変数の上限 (SQLite は 32766) を超えないように分ける
+    for i in range(0, len(keys), IN_CHUNK_SIZE):
+        yield keys[i : i + IN_CHUNK_SIZE]
+
+
+def _batch_tags_by_todo(todo_ids):
+    rows = []
+    for chunk in _chunks(todo_ids):
+        rows += db.session.execute(
+            db.select(TodoTags.todo_id, TagModel)
+            .join(TagModel, TagModel.id == TodoTags.tag_id)
+            .where(TodoTags.todo_id.in_(chunk))
+        ).all()
+    tags = defaultdict(list)
+    # ORDER BY を付けると一時 B-tree でのソートになるので Python 側で並べる
+    for todo_id, tag in sorted(rows, key=lambda row: row[1].id):
+        tags[todo_id].append(tag)
+    return tags
+
+
+def _batch_users(user_ids):
+    users = []
+    for chunk in _chunks(user_ids):
+        users += db.session.scalars(
+            db.select(UserModel).where(UserModel.id.in_(chunk))
+        ).all()
+    return {user.id: user for user in users}
+
+
+class Loaders:
+    """1リクエスト分のローダー一式。context_value に入れて使う"""
+
+    def __init__(self):
+        self.tags_by_todo = DataLoader(_batch_tags_by_todo, default=[])
+        self.user_by_id = DataLoader(_batch_users)
+
+    def prime_todos(self, todos):
+        self.tags_by_todo.prime_keys(todo.id for todo in todos)
+        self.user_by_id.prime_keys(todo.user_id for todo in todos)
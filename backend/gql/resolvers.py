@@ -1,6 +1,14 @@
-from ariadne import ObjectType
+from datetime import date
+from ariadne import MutationType, ObjectType
+from flask import current_app
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from graphql import GraphQLError
+from bulk import apply_bulk
+from db import db
 from models import TodoModel
+from schema import CalendarQuerySchema, TodoBulkSchema
+from search import search_todos
+import stats
 
 
 query = ObjectType("Query")
@@ -16,7 +24,9 @@ def resolve_todos(_, info):
     try:
         verify_jwt_in_request()
         current_user_id = int(get_jwt_identity())
-        return TodoModel.query.filter_by(user_id=current_user_id).all()
+        todos = TodoModel.query.filter_by(user_id=current_user_id).all()
+        info.context["loaders"].prime_todos(todos)
+        return todos
     except Exception:
         return []
 
@@ -31,6 +41,62 @@ def resolve_todo(_, info, id):
         return None
 
 
+@query.field("searchTodos")
+def resolve_search_todos(_, info, query, limit=50):
+    try:
+        verify_jwt_in_request()
+        current_user_id = int(get_jwt_identity())
+        todos = search_todos(current_user_id, query, max(1, min(limit, 500)))
+        info.context["loaders"].prime_todos(todos)
+        return todos
+    except Exception:
+        return []
+
+
+@query.field("todoStats")
+def resolve_todo_stats(_, info, **args):
+    # from は Python の予約語なのでキーワード引数でまとめて受け取る
+    try:
+        verify_jwt_in_request()
+        current_user_id = int(get_jwt_identity())
+    except Exception:
+        return None
+    start, end = (
+        date.fromisoformat(args[key]) if args.get(key) else None
+        for key in ("from", "to")
+    )
+    tag_id = int(args["tag_id"]) if args.get("tag_id") else None
+    result = stats.summary(current_user_id, start, end, tag_id)
+    for bucket in result["histogram"]:
+        bucket["date"] = bucket["date"].isoformat()
+    return result
+
+
+@query.field("calendar")
+def resolve_calendar(_, info, **args):
+    try:
+        verify_jwt_in_request()
+        current_user_id = int(get_jwt_identity())
+    except Exception:
+        return None
+    # REST と同じ検証 (範囲の上限) をする。不正ならエラーとして返る
+    params = CalendarQuerySchema().load(
+        {
+            "from": args["from"],
+            "to": args["to"],
+            "tag_id": [int(id) for id in args.get("tag_ids") or []],
+            **({"is_done": args["is_done"]} if args.get("is_done") is not None else {}),
+        }
+    )
+    return stats.calendar(
+        current_user_id,
+        params["from_"],
+        params["to"],
+        tag_ids=params["tag_id"],
+        is_done=params.get("is_done"),
+    )
+
+
 todo = ObjectType("Todo")
 
 
@@ -51,3 +117,63 @@ def resolve_updated_at(obj, _):
 @todo.field("deadline")
 def resolve_deadline(obj, _):
     return format_datetime(obj.deadline)
+
+
+@todo.field("tags")
+def resolve_tags(obj, info):
+    return info.context["loaders"].tags_by_todo.load(obj.id)
+
+
+@todo.field("user")
+def resolve_user(obj, info):
+    return info.context["loaders"].user_by_id.load(obj.user_id)
+
+
+mutation = MutationType()
+
+
+def _run_bulk(operations, fresh=False):
+    verify_jwt_in_request(fresh=fresh)
+    current_user_id = int(get_jwt_identity())
+    # REST の一括操作と同じ検証 (明示的な null や件数の上限)。不正ならエラーとして返る
+    operations = TodoBulkSchema().load(operations)
+    size = sum(len(items) for items in operations.values())
+    threshold = current_app.config["BULK_ASYNC_THRESHOLD"]
+    if size > threshold:
+        # ワーカーで実行する大きな一括操作は 202 とジョブを返せる REST に任せる
+        raise GraphQLError(
+            f"Batches of more than {threshold} items must use POST /api/todos/bulk.",
+            extensions={"code": "BATCH_TOO_LARGE"},
+        )
+    try:
+        results = apply_bulk(current_user_id, operations)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return [item for items in results.values() for item in items]
+
+
+@mutation.field("createTodos")
+def resolve_create_todos(_, info, todos):
+    return _run_bulk({"create": todos})
+
+
+@mutation.field("updateTodos")
+def resolve_update_todos(_, info, todos):
+    return _run_bulk({"update": todos})
+
+
+@mutation.field("deleteTodos")
+def resolve_delete_todos(_, info, ids):
+    return _run_bulk({"delete": ids}, fresh=True)
+
+
+@mutation.field("linkTags")
+def resolve_link_tags(_, info, links):
+    return _run_bulk({"link": links})
+
+
+@mutation.field("unlinkTags")
+def resolve_unlink_tags(_, info, links):
+    return _run_bulk({"unlink": links})
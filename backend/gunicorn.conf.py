@@ -0,0 +1,61 @@
+"""
+gunicorn の設定 (本番用)
+
+    cd backend
+    gunicorn wsgi:app
+
+環境変数:
+    PORT / GUNICORN_BIND          待ち受けるアドレス (既定は 0.0.0.0:5000)
+    WEB_CONCURRENCY               ワーカープロセスの数 (既定は CPU 数 × 2 + 1、最大 8)
+    GUNICORN_THREADS              ワーカーごとのスレッド数 (既定 4)
+    GUNICORN_WORKER_CLASS         既定は gthread。ASGI では uvicorn_worker.UvicornWorker
+    GUNICORN_KEEPALIVE            keep-alive の秒数
+    GUNICORN_TIMEOUT / GUNICORN_GRACEFUL_TIMEOUT
+    GUNICORN_MAX_REQUESTS / GUNICORN_MAX_REQUESTS_JITTER
+    GUNICORN_PRELOAD              0 にすると各ワーカーがアプリを読み込む
+
+kill -HUP <master> で設定を読み直し、ワーカーを順に入れ替える (処理中のリクエストは
+graceful_timeout まで待つ)。preload_app ではコードは読み直されないので、コードの
+更新はプロセスごと入れ替えること。
+"""
+
+import gc
+import os
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min((os.cpu_count() or 1) * 2 + 1, 8))))
+# アプリはこの数を見て、プロセス間で共有できない memory:// のキャッシュを使わない
+os.environ["WEB_CONCURRENCY"] = str(workers)
+# 変更フィード (SSE) は接続ごとにスレッドを1つ、CHANGE_FEED_MAX_DURATION 秒まで使う
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+preload_app = _env_bool("GUNICORN_PRELOAD", True)
+accesslog = os.getenv("GUNICORN_ACCESSLOG", "-")
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+
+def when_ready(server):
+    # 親で読み込んだオブジェクトを GC の対象から外し、fork 後のコピーオンライトを減らす
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    # 親のプールの接続を子で共有しないようにする
+    import db_config
+
+    app = server.app.wsgi()
+    # ASGI モード (asgi.py) では Flask のアプリを包んでいる
+    db_config.dispose_engines(getattr(app, "flask_app", app))
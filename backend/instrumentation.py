@@ -0,0 +1,317 @@
+"""
+リクエストごとの計測
+
+- SQL の件数と時間 (before/after_cursor_execute)、シリアライズ・GraphQL の実行時間
+- Server-Timing ヘッダー
+- エンドポイントごとのレイテンシのヒストグラム (/metrics、Prometheus のテキスト形式)
+- 遅いクエリのログ (バインド変数は値を伏せる)
+- サンプリングした cProfile のダンプ
+
+INSTRUMENTATION_ENABLED が無効のときはイベントもフックも登録しないので、
+timer() の1回の確認以外にコストはかからない。
+"""
+
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from db import db
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+MAX_STATEMENT_LENGTH = 1000
+# GraphQL のドキュメントキャッシュの統計のうち、今の値を表すもの (他は回数)
+DOCUMENT_CACHE_GAUGES = ("size", "max_size")
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+class RequestStats:
+    __slots__ = ("started_at", "queries", "db_time", "timings", "_depth", "profile")
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.timings = defaultdict(float)
+        # 入れ子の timer() (Nested のスキーマなど) を二重に数えないため
+        self._depth = defaultdict(int)
+        self.profile = None
+
+
+class _Timer:
+    __slots__ = ("name", "stats", "started_at")
+
+    def __init__(self, name):
+        self.name = name
+        self.stats = g.get("request_stats") if has_request_context() else None
+
+    def __enter__(self):
+        stats = self.stats
+        if stats is not None:
+            stats._depth[self.name] += 1
+            if stats._depth[self.name] == 1:
+                self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stats = self.stats
+        if stats is not None:
+            stats._depth[self.name] -= 1
+            if stats._depth[self.name] == 0:
+                stats.timings[self.name] += time.perf_counter() - self.started_at
+        return False
+
+
+def timer(name):
+    """with timer("serialize"): ... の時間を Server-Timing に載せる。計測が無効なら何もしない"""
+    return _Timer(name)
+
+
+def redact(parameters):
+    """ログに値を残さないように、バインド変数を型名だけにする"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany はパラメータの組の数だけ出す
+            return f"<{len(parameters)} parameter sets>"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {cumulative}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _labels(**labels):
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+class Metrics:
+    """プロセス内のメトリクス。ワーカーが複数ある場合はプロセスごとの値になる"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.query_counts = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+        self.db_seconds = defaultdict(float)
+        self.requests = defaultdict(int)
+        self.slow_queries = 0
+
+    def observe(self, endpoint, method, status, elapsed, stats):
+        with self._lock:
+            self.latency[(endpoint, method)].observe(elapsed)
+            self.query_counts[(endpoint, method)].observe(stats.queries)
+            self.db_seconds[(endpoint, method)] += stats.db_time
+            self.requests[(endpoint, method, status)] += 1
+
+    def slow_query(self):
+        # gthread のワーカーでは複数のスレッドから呼ばれる
+        with self._lock:
+            self.slow_queries += 1
+
+    def render(self, extra=()):
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by endpoint.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                labels = _labels(endpoint=endpoint, method=method)
+                lines += histogram.lines("http_request_duration_seconds", labels)
+            lines += [
+                "# HELP http_request_db_queries SQL statements issued per request.",
+                "# TYPE http_request_db_queries histogram",
+            ]
+            for (endpoint, method), histogram in sorted(self.query_counts.items()):
+                labels = _labels(endpoint=endpoint, method=method)
+                lines += histogram.lines("http_request_db_queries", labels)
+            lines += [
+                "# HELP http_request_db_seconds_total Time spent in the database.",
+                "# TYPE http_request_db_seconds_total counter",
+            ]
+            for (endpoint, method), seconds in sorted(self.db_seconds.items()):
+                labels = _labels(endpoint=endpoint, method=method)
+                lines.append(f"http_request_db_seconds_total{{{labels}}} {seconds:.6f}")
+            lines += [
+                "# HELP http_requests_total Requests by endpoint and status.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                labels = _labels(endpoint=endpoint, method=method, status=status)
+                lines.append(f"http_requests_total{{{labels}}} {count}")
+            lines += [
+                "# HELP db_slow_queries_total Statements slower than SLOW_QUERY_MS.",
+                "# TYPE db_slow_queries_total counter",
+                f"db_slow_queries_total {self.slow_queries}",
+            ]
+        for name, help, type, value in extra:
+            lines += [
+                f"# HELP {name} {help}",
+                f"# TYPE {name} {type}",
+                f"{name} {value}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+class Instrumentation:
+    def __init__(self, app=None):
+        self.metrics = Metrics()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """db_config.init_app() の後に呼ぶ (レプリカのエンジンにもイベントを付ける)"""
+        app.config.setdefault(
+            "INSTRUMENTATION_ENABLED", _env_bool("INSTRUMENTATION_ENABLED", False)
+        )
+        app.config.setdefault("SLOW_QUERY_MS", float(os.getenv("SLOW_QUERY_MS", "200")))
+        app.config.setdefault(
+            "PROFILE_SAMPLE_RATE", float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        )
+        app.config.setdefault("PROFILE_DIR", os.getenv("PROFILE_DIR", "profiles"))
+        if not app.config["INSTRUMENTATION_ENABLED"]:
+            return
+        self.metrics = Metrics()
+        app.extensions["instrumentation"] = self
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        if "db_replica" in app.extensions:
+            engines.append(app.extensions["db_replica"])
+        slow_query_seconds = app.config["SLOW_QUERY_MS"] / 1000
+        for engine in engines:
+            self._listen(engine, slow_query_seconds)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule("/metrics", "metrics", self._metrics_view)
+
+    def _listen(self, engine, slow_query_seconds):
+        metrics = self.metrics
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+            conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+            elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+            stats = g.get("request_stats") if has_request_context() else None
+            if stats is not None:
+                stats.queries += 1
+                stats.db_time += elapsed
+            if elapsed >= slow_query_seconds:
+                metrics.slow_query()
+                logger.warning(
+                    "slow query (%.1f ms): %s parameters=%s",
+                    elapsed * 1000,
+                    statement[:MAX_STATEMENT_LENGTH],
+                    redact(parameters),
+                )
+
+    def _before_request(self):
+        stats = RequestStats()
+        g.request_stats = stats
+        rate = current_app.config["PROFILE_SAMPLE_RATE"]
+        if rate and random.random() < rate:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # 別のスレッドでプロファイル中 (3.12 以降は同時に1つまで)
+                return
+            stats.profile = profile
+
+    def _after_request(self, response):
+        stats = g.pop("request_stats", None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started_at
+        if stats.profile is not None:
+            stats.profile.disable()
+            self._dump_profile(stats.profile)
+        endpoint = request.url_rule.rule if request.url_rule else "<unmatched>"
+        self.metrics.observe(
+            endpoint, request.method, response.status_code, elapsed, stats
+        )
+        timings = [f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"']
+        timings += [
+            f"{name};dur={seconds * 1000:.2f}"
+            for name, seconds in sorted(stats.timings.items())
+        ]
+        timings.append(f"total;dur={elapsed * 1000:.2f}")
+        response.headers["Server-Timing"] = ", ".join(timings)
+        return response
+
+    def _teardown_request(self, exc):
+        # 例外で after_request が呼ばれなかった場合もプロファイラは止める
+        stats = g.pop("request_stats", None)
+        if stats is not None and stats.profile is not None:
+            stats.profile.disable()
+
+    def _dump_profile(self, profile):
+        directory = current_app.config["PROFILE_DIR"]
+        os.makedirs(directory, exist_ok=True)
+        name = (request.endpoint or "unmatched").replace(".", "-")
+        path = os.path.join(
+            directory,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{os.getpid()}-{id(profile):x}.prof",
+        )
+        profile.dump_stats(path)
+        logger.info("profile written to %s", path)
+
+    def _metrics_view(self):
+        from gql.cache import document_cache
+
+        extra = []
+        for key, value in document_cache.stats().items():
+            help = f"GraphQL document cache {key.replace('_', ' ')}."
+            if key in DOCUMENT_CACHE_GAUGES:
+                extra.append((f"graphql_document_cache_{key}", help, "gauge", value))
+            else:
+                # ヒット・ミス・追い出しの回数は増えるだけなので counter
+                extra.append(
+                    (f"graphql_document_cache_{key}_total", help, "counter", value)
+                )
+        return Response(
+            self.metrics.render(extra), mimetype="text/plain; version=0.0.4"
+        )
+
+
+instrumentation = Instrumentation()
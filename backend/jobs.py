@@ -0,0 +1,284 @@
+"""
+バックグラウンドの仕事 (ジョブ) のキュー
+
+重い処理はリクエストの中で実行せず、jobs テーブルに積んで 202 を返す。
+ワーカー (python worker.py / flask jobs-worker) がテーブルから取り出して実行する。
+
+- 取り出しは UPDATE ... WHERE status = 'queued' の件数で取り合うので、
+  ワーカーのプロセスを複数動かしても同じ仕事を2回実行しない
+- 失敗したら指数バックオフ (ジッター付き) で max_attempts 回まで試す
+- 実行中に落ちたワーカーの仕事は locked_until を過ぎたら拾い直す
+- 仕事の書き込みと状態の更新は1トランザクションでコミットする
+
+仕事の中身は @register("種類") で登録した関数 (user_id, payload) -> 結果 (JSON にできるもの)。
+"""
+
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+import click
+from sqlalchemy import and_, or_, select, update
+from db import db
+from models import JobModel
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def register(kind):
+    """仕事の種類と実行する関数を登録するデコレーター"""
+
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+
+    return decorator
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def enqueue(kind, payload=None, user_id=None, max_attempts=None):
+    """
+    仕事を積む。呼び出し側のトランザクションでコミットされたときに実行されるようになる
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = JobModel(
+        kind=kind,
+        user_id=user_id,
+        payload=json.dumps(payload or {}),
+        max_attempts=max_attempts or queue.max_attempts,
+        run_at=_now(),
+    )
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+
+def local_stores(config):
+    """
+    プロセス内だけのストア (memory://) の設定名
+
+    ワーカーの書き込みはこれらを通して Web のプロセスに伝わるので、共有できないと
+    Web のプロセスのキャッシュが古いまま残る
+    """
+    if config["CACHE_ENABLED"] and config["CACHE_URL"].startswith("memory://"):
+        yield "CACHE_URL"
+    # ワーカーで emit() した変更は Web のプロセスの購読者に届かないといけない
+    if config["CHANGE_FEED_URL"].startswith("memory://"):
+        yield "CHANGE_FEED_URL"
+
+
+def backoff(attempts, base, cap):
+    """attempts 回目に失敗した後、次に試すまでの秒数 (ジッター付きの指数バックオフ)"""
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class JobQueue:
+    def __init__(self, app=None):
+        self.max_attempts = 5
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "JOBS_CONCURRENCY", int(os.getenv("JOBS_CONCURRENCY", "4"))
+        )
+        app.config.setdefault(
+            "JOBS_POLL_INTERVAL", float(os.getenv("JOBS_POLL_INTERVAL", "1.0"))
+        )
+        app.config.setdefault(
+            "JOBS_MAX_ATTEMPTS", int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+        )
+        app.config.setdefault(
+            "JOBS_BACKOFF_BASE", float(os.getenv("JOBS_BACKOFF_BASE", "2.0"))
+        )
+        app.config.setdefault(
+            "JOBS_BACKOFF_MAX", float(os.getenv("JOBS_BACKOFF_MAX", "300"))
+        )
+        # 1回の実行にかかってよい時間。過ぎると他のワーカーが拾い直す
+        app.config.setdefault("JOBS_LEASE", float(os.getenv("JOBS_LEASE", "600")))
+        # 一括操作の件数がこれを超えたらワーカーで実行して 202 を返す
+        app.config.setdefault(
+            "BULK_ASYNC_THRESHOLD", int(os.getenv("BULK_ASYNC_THRESHOLD", "1000"))
+        )
+        self.max_attempts = app.config["JOBS_MAX_ATTEMPTS"]
+        app.extensions["job_queue"] = self
+
+        @app.cli.command("jobs-worker")
+        @click.option("--concurrency", type=int, default=None)
+        @click.option("--burst", is_flag=True, help="キューが空になったら終了する")
+        def jobs_worker_command(concurrency, burst):
+            """バックグラウンドの仕事を実行するワーカーを起動する"""
+            worker = Worker(app, concurrency)
+            if burst:
+                worker.check_stores()
+                click.echo(f"Processed {worker.run_pending()} jobs")
+            else:
+                worker.run()
+
+    def _claimable(self, now):
+        return or_(
+            and_(JobModel.status == "queued", JobModel.run_at <= now),
+            # 実行中のまま期限が切れた仕事 (ワーカーが落ちた)
+            and_(
+                JobModel.status == "running",
+                JobModel.locked_until < now,
+                JobModel.attempts < JobModel.max_attempts,
+            ),
+        )
+
+    def claim(self, worker_id, lease):
+        """次の仕事を1件取って running にする。無ければ None"""
+        now = _now()
+        self._fail_expired(now)
+        for _ in range(5):
+            job_id = db.session.execute(
+                select(JobModel.id)
+                .where(self._claimable(now))
+                .order_by(JobModel.run_at, JobModel.id)
+                .limit(1)
+            ).scalar()
+            if job_id is None:
+                db.session.commit()
+                return None
+            claimed = db.session.execute(
+                update(JobModel)
+                .where(JobModel.id == job_id, self._claimable(now))
+                .values(
+                    status="running",
+                    attempts=JobModel.attempts + 1,
+                    locked_until=now + timedelta(seconds=lease),
+                    locked_by=worker_id,
+                ),
+                execution_options={"synchronize_session": False},
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return job_id
+            # 他のワーカーが先に取ったので次を探す
+        return None
+
+    def _fail_expired(self, now):
+        db.session.execute(
+            update(JobModel)
+            .where(
+                JobModel.status == "running",
+                JobModel.locked_until < now,
+                JobModel.attempts >= JobModel.max_attempts,
+            )
+            .values(status="failed", last_error="lease expired", finished_at=now),
+            execution_options={"synchronize_session": False},
+        )
+
+    def execute(self, job_id, config):
+        """取った仕事を実行し、結果か次に試す時刻を書き込む"""
+        job = db.session.get(JobModel, job_id)
+        kind = job.kind
+        try:
+            handler = HANDLERS[kind]
+            result = handler(job.user_id, json.loads(job.payload))
+            job.status = "succeeded"
+            job.result = json.dumps(result)
+            job.last_error = None
+            job.finished_at = _now()
+            job.locked_until = None
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            logger.warning("job %s (%s) failed", job_id, kind, exc_info=True)
+            job = db.session.get(JobModel, job_id)
+            job.last_error = f"{type(error).__name__}: {error}"[:2000]
+            job.locked_until = None
+            if job.attempts >= job.max_attempts:
+                job.status = "failed"
+                job.finished_at = _now()
+            else:
+                job.status = "queued"
+                job.run_at = _now() + timedelta(
+                    seconds=backoff(
+                        job.attempts,
+                        config["JOBS_BACKOFF_BASE"],
+                        config["JOBS_BACKOFF_MAX"],
+                    )
+                )
+            db.session.commit()
+        return job.status
+
+
+queue = JobQueue()
+
+
+class Worker:
+    """
+    スレッドで仕事を並行に実行する。CPU を使う仕事が多ければワーカーのプロセスを増やす
+    """
+
+    def __init__(self, app, concurrency=None):
+        self.app = app
+        self.concurrency = concurrency or app.config["JOBS_CONCURRENCY"]
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.stopping = threading.Event()
+
+    def check_stores(self):
+        """別のプロセスとして動かすときに、Web のプロセスと共有できないストアがあれば止める"""
+        names = list(local_stores(self.app.config))
+        if names:
+            raise RuntimeError(
+                f"{', '.join(names)} must be a shared store (redis://...) "
+                "when the job worker runs in its own process"
+            )
+
+    def run_one(self):
+        """1件実行する。仕事が無ければ False"""
+        with self.app.app_context():
+            config = self.app.config
+            job_id = queue.claim(self.id, config["JOBS_LEASE"])
+            if job_id is None:
+                return False
+            queue.execute(job_id, config)
+            db.session.remove()
+            return True
+
+    def run_pending(self):
+        """今実行できる仕事が無くなるまで実行し、実行した件数を返す (テスト・cron 用)"""
+        count = 0
+        while self.run_one():
+            count += 1
+        return count
+
+    def _loop(self):
+        interval = self.app.config["JOBS_POLL_INTERVAL"]
+        while not self.stopping.is_set():
+            try:
+                if self.run_one():
+                    continue
+            except Exception:
+                logger.exception("job worker loop failed")
+            self.stopping.wait(interval)
+
+    def run(self):
+        """SIGTERM / SIGINT を受けたら実行中の仕事が終わるのを待って止まる"""
+        self.check_stores()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: self.stopping.set())
+        threads = [
+            threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info("job worker %s started with %d threads", self.id, len(threads))
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1.0)
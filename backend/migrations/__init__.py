@@ -0,0 +1,74 @@
+import importlib
+import pkgutil
+import click
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, select
+from db import db
+
+# マイグレーションの適用状況。モデルとは別の MetaData で管理する
+metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False, server_default=func.now()),
+)
+
+
+def available_versions():
+    """
+    migrations/versions/NNNN_xxx.py の {番号: モジュール名}
+
+    ファイル名の番号だけを見るので、モジュールは読み込まない
+    """
+    from migrations import versions
+
+    return {
+        int(info.name.split("_", 1)[0]): info.name
+        for info in pkgutil.iter_modules(versions.__path__)
+    }
+
+
+def load_migrations(versions=None):
+    """マイグレーションを番号順に読み込む。versions を指定するとその番号だけ"""
+    names = available_versions()
+    if versions is not None:
+        names = {version: names[version] for version in versions}
+    modules = [
+        importlib.import_module(f"migrations.versions.{name}")
+        for name in names.values()
+    ]
+    return sorted(modules, key=lambda module: module.version)
+
+
+def applied_versions(conn):
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def upgrade(engine=None):
+    """未適用のマイグレーションを順番に、それぞれ1トランザクションで適用する"""
+    engine = engine or db.engine
+    metadata.create_all(engine)
+    applied = []
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+    # 適用済みなら (起動時のほとんどの場合) マイグレーションのモジュールは読み込まない
+    pending = set(available_versions()) - done
+    for migration in load_migrations(pending):
+        with engine.begin() as conn:
+            migration.upgrade(conn)
+            conn.execute(
+                schema_migrations.insert().values(
+                    version=migration.version, description=migration.description
+                )
+            )
+        applied.append(migration)
+    return applied
+
+
+def init_app(app):
+    @app.cli.command("db-upgrade")
+    def db_upgrade_command():
+        """未適用のマイグレーションを適用する"""
+        for migration in upgrade():
+            click.echo(f"Applied {migration.version:04d} {migration.description}")
@@ -0,0 +1,55 @@
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+)
+
+version = 1
+description = "initial schema"
+
+# 最初のリリースのスキーマ。モデルは後のマイグレーションで変わるので使わない
+metadata = MetaData()
+Table(
+    "users",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("username", String(20), nullable=False, unique=True),
+    Column("password", String, nullable=False),
+)
+Table(
+    "todos",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(80), nullable=False),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+    Column("deadline", DateTime, nullable=True),
+    Column("is_done", Boolean, nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Index("ix_todos_user_id", "user_id"),
+)
+Table(
+    "tags",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(80), nullable=False, unique=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+)
+Table(
+    "todo_tags",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("tag_id", Integer, ForeignKey("tags.id"), nullable=False),
+    Column("todo_id", Integer, ForeignKey("todos.id"), nullable=False),
+)
+
+
+def upgrade(conn):
+    # 既存のデータベースではテーブルがあるので何もしない
+    metadata.create_all(conn)
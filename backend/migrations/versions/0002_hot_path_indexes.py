@@ -0,0 +1,29 @@
+from sqlalchemy import text
+
+version = 2
+description = "composite indexes for hot queries and unique todo_tags pairs"
+
+# このマイグレーションで作るインデックス。モデルは後で変わるので使わない
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_todos_user_id_created_at_id "
+    "ON todos (user_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_tags_user_id ON tags (user_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_todo_tags_todo_id_tag_id "
+    "ON todo_tags (todo_id, tag_id)",
+    "CREATE INDEX IF NOT EXISTS ix_todo_tags_tag_id_todo_id "
+    "ON todo_tags (tag_id, todo_id)",
+]
+
+
+def upgrade(conn):
+    # 一意インデックスを張る前に、重複したリンクを1件だけ残して消す
+    conn.execute(
+        text(
+            "DELETE FROM todo_tags WHERE id NOT IN "
+            "(SELECT MIN(id) FROM todo_tags GROUP BY todo_id, tag_id)"
+        )
+    )
+    # user_id 単独のインデックスは複合インデックスの先頭列で代用できる
+    conn.execute(text("DROP INDEX IF EXISTS ix_todos_user_id"))
+    for statement in INDEXES:
+        conn.execute(text(statement))
@@ -0,0 +1,43 @@
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    MetaData,
+    String,
+    Table,
+)
+
+version = 3
+description = "import job progress and source id mapping"
+
+# このマイグレーションで作るテーブル。モデルは後で変わるので使わない
+metadata = MetaData()
+# 外部キーの参照先 (既にある)
+Table("users", metadata, Column("id", Integer, primary_key=True))
+import_jobs = Table(
+    "import_jobs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False, index=True),
+    Column("status", String(20), nullable=False),
+    Column("processed", Integer, nullable=False),
+    Column("tags", Integer, nullable=False),
+    Column("todos", Integer, nullable=False),
+    Column("links", Integer, nullable=False),
+    Column("skipped", Integer, nullable=False),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+)
+import_id_map = Table(
+    "import_id_map",
+    metadata,
+    Column("job_id", Integer, ForeignKey("import_jobs.id"), primary_key=True),
+    Column("kind", String(10), primary_key=True),
+    Column("source_id", Integer, primary_key=True),
+    Column("target_id", Integer, nullable=False),
+)
+
+
+def upgrade(conn):
+    metadata.create_all(conn, tables=[import_jobs, import_id_map])
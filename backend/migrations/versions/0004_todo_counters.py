@@ -0,0 +1,84 @@
+from collections import Counter
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    Table,
+    insert,
+    select,
+)
+
+version = 4
+description = "per-day todo counters for statistics"
+
+# このマイグレーションで作るテーブル。モデルは後で変わるので使わない
+metadata = MetaData()
+# 外部キーの参照先と、件数を数えるために読む列 (どれも既にある)
+Table("users", metadata, Column("id", Integer, primary_key=True))
+todos = Table(
+    "todos",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer),
+    Column("deadline", DateTime),
+    Column("is_done", Boolean),
+)
+todo_tags = Table(
+    "todo_tags", metadata, Column("todo_id", Integer), Column("tag_id", Integer)
+)
+todo_counters = Table(
+    "todo_counters",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("tag_id", Integer, nullable=False),
+    # 期限の無い todo は NULL
+    Column("day", Date, nullable=True),
+    Column("total", Integer, nullable=False),
+    Column("done", Integer, nullable=False),
+    Index("ix_todo_counters_user_id_tag_id_day", "user_id", "tag_id", "day"),
+)
+
+
+def count_todos(conn, no_deadline):
+    """
+    既存の todo から (user_id, tag_id, day, total, done) の行を数える
+
+    tag_id 0 はユーザーの todo 全体。期限の無い todo の day は no_deadline
+    """
+    tags = {}
+    for todo_id, tag_id in conn.execute(
+        select(todo_tags.c.todo_id, todo_tags.c.tag_id)
+    ):
+        tags.setdefault(todo_id, []).append(tag_id)
+    counts = Counter()
+    for id, user_id, deadline, is_done in conn.execute(
+        select(todos.c.id, todos.c.user_id, todos.c.deadline, todos.c.is_done)
+    ):
+        day = deadline.date() if deadline is not None else no_deadline
+        for scope in (0, *tags.get(id, ())):
+            counts[user_id, scope, day, "total"] += 1
+            counts[user_id, scope, day, "done"] += int(bool(is_done))
+    return [
+        {
+            "user_id": user_id,
+            "tag_id": scope,
+            "day": day,
+            "total": total,
+            "done": counts[user_id, scope, day, "done"],
+        }
+        for (user_id, scope, day, column), total in counts.items()
+        if column == "total"
+    ]
+
+
+def upgrade(conn):
+    metadata.create_all(conn, tables=[todo_counters])
+    rows = count_todos(conn, None)
+    if rows:
+        conn.execute(insert(todo_counters), rows)
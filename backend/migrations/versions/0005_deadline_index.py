@@ -0,0 +1,13 @@
+from sqlalchemy import text
+
+version = 5
+description = "todos (user_id, deadline) index for calendar range queries"
+
+
+def upgrade(conn):
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_todos_user_id_deadline_id "
+            "ON todos (user_id, deadline, id)"
+        )
+    )
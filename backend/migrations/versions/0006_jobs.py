@@ -0,0 +1,31 @@
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, Text
+
+version = 6
+description = "background job queue"
+
+# このマイグレーションで作るテーブル。モデルは後で変わるので使わない
+metadata = MetaData()
+Table(
+    "jobs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("kind", String(50), nullable=False),
+    Column("user_id", Integer, nullable=True, index=True),
+    Column("payload", Text, nullable=False),
+    Column("status", String(20), nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("max_attempts", Integer, nullable=False),
+    Column("run_at", DateTime, nullable=False),
+    Column("locked_until", DateTime, nullable=True),
+    Column("locked_by", String(100), nullable=True),
+    Column("last_error", Text, nullable=True),
+    Column("result", Text, nullable=True),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+    Column("finished_at", DateTime, nullable=True),
+    Index("ix_jobs_status_run_at", "status", "run_at"),
+)
+
+
+def upgrade(conn):
+    metadata.create_all(conn)
@@ -0,0 +1,86 @@
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    inspect,
+    text,
+)
+
+version = 7
+description = "never reuse user ids, per-user token revocation, keep user_versions"
+
+# このマイグレーションの後のテーブル。モデルは後で変わるので使わない
+metadata = MetaData()
+users = Table(
+    "users",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("username", String(20), nullable=False, unique=True),
+    Column("password", String, nullable=False),
+    Column("tokens_valid_after", DateTime, nullable=True),
+    sqlite_autoincrement=True,
+)
+user_versions = Table(
+    "user_versions",
+    metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+
+
+def _rebuild(conn, table):
+    """SQLite は列の制約を ALTER TABLE で変えられないので、作り直して中身を移す"""
+    columns = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    copied = ", ".join(
+        column.name for column in table.columns if column.name in columns
+    )
+    new_table = table.to_metadata(MetaData(), name=f"{table.name}_new")
+    new_table.create(conn)
+    conn.execute(
+        text(
+            f"INSERT INTO {new_table.name} ({copied}) SELECT {copied} FROM {table.name}"
+        )
+    )
+    conn.execute(text(f"DROP TABLE {table.name}"))
+    conn.execute(text(f"ALTER TABLE {new_table.name} RENAME TO {table.name}"))
+
+
+def upgrade(conn):
+    # user_versions は 0001 の後に追加したので、無ければ外部キー無しで作る
+    user_versions.create(conn, checkfirst=True)
+    if conn.dialect.name == "sqlite":
+        # users は AUTOINCREMENT に、user_versions は users への外部キー無しにする
+        _rebuild(conn, users)
+        _rebuild(conn, user_versions)
+        # 既に削除されたユーザーの id も使わない (削除の仕事に user_id が残っている)
+        last_id = conn.execute(
+            text(
+                "SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM users "
+                "UNION ALL SELECT MAX(user_id) FROM jobs)"
+            )
+        ).scalar()
+        conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'users'"))
+        conn.execute(
+            text("INSERT INTO sqlite_sequence (name, seq) VALUES ('users', :seq)"),
+            {"seq": last_id or 0},
+        )
+        return
+    # 他のデータベースのシーケンスは元から id を再利用しない
+    inspector = inspect(conn)
+    if "tokens_valid_after" not in {
+        column["name"] for column in inspector.get_columns("users")
+    }:
+        column_type = users.c.tokens_valid_after.type
+        conn.execute(
+            text(
+                "ALTER TABLE users ADD COLUMN tokens_valid_after "
+                + column_type.compile(dialect=conn.dialect)
+            )
+        )
+    for foreign_key in inspector.get_foreign_keys("user_versions"):
+        conn.execute(
+            text(f"ALTER TABLE user_versions DROP CONSTRAINT {foreign_key['name']}")
+        )
@@ -0,0 +1,47 @@
+from datetime import date
+from sqlalchemy import (
+    Column,
+    Date,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    Table,
+    insert,
+)
+from migrations import load_migrations
+
+version = 8
+description = "unique todo_counters rows for single-statement upserts"
+
+# 期限の無い todo の day (NULL は一意インデックスで重複とみなされないので使わない)
+NO_DEADLINE = date.min
+
+# このマイグレーションで作り直すテーブル。モデルは後で変わるので使わない
+metadata = MetaData()
+# 外部キーの参照先 (既にある)
+Table("users", metadata, Column("id", Integer, primary_key=True))
+todo_counters = Table(
+    "todo_counters",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("tag_id", Integer, nullable=False),
+    Column("day", Date, nullable=False),
+    Column("total", Integer, nullable=False),
+    Column("done", Integer, nullable=False),
+    Index(
+        "ix_todo_counters_user_id_tag_id_day", "user_id", "tag_id", "day", unique=True
+    ),
+)
+
+
+def upgrade(conn):
+    # 期限の無い行を NULL から NO_DEADLINE にして重複をまとめるので、作り直して数え直す
+    todo_counters.drop(conn, checkfirst=True)
+    metadata.create_all(conn, tables=[todo_counters])
+    # 数え方は 0004 と同じ (マイグレーションの中のものを使い、アプリのコードは使わない)
+    (counters,) = load_migrations([4])
+    rows = counters.count_todos(conn, NO_DEADLINE)
+    if rows:
+        conn.execute(insert(todo_counters), rows)
@@ -0,0 +1,51 @@
+from sqlalchemy import bindparam, text
+from search import index_tokens
+
+version = 9
+description = "user_id in the search index and backfill from existing todos"
+
+# このマイグレーションで作るテーブル。search.py の定義は後で変わるので使わない
+SCHEMA = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE todo_search USING fts5(tokens, user_id UNINDEXED)"
+    ],
+    "postgresql": [
+        "CREATE TABLE todo_search ("
+        "todo_id INTEGER PRIMARY KEY REFERENCES todos(id) ON DELETE CASCADE, "
+        "user_id INTEGER NOT NULL, "
+        "tokens tsvector NOT NULL)",
+        "CREATE INDEX ix_todo_search_tokens ON todo_search USING GIN (tokens)",
+        "CREATE INDEX ix_todo_search_user_id ON todo_search (user_id)",
+    ],
+}
+INSERT = {
+    "sqlite": "INSERT INTO todo_search (rowid, user_id, tokens) "
+    "VALUES (:todo_id, :user_id, :tokens)",
+    "postgresql": "INSERT INTO todo_search (todo_id, user_id, tokens) "
+    "VALUES (:todo_id, :user_id, to_tsvector('simple', :tokens))",
+}
+BATCH_SIZE = 1000
+
+
+def upgrade(conn):
+    # FTS5 の仮想テーブルには列を足せないので作り直し、既存の todo から入れ直す
+    conn.execute(text("DROP TABLE IF EXISTS todo_search"))
+    for statement in SCHEMA[conn.dialect.name]:
+        conn.execute(text(statement))
+    # トークンの分け方は検索する側 (今のアプリ) と同じでないといけないので search.py を使う
+    select_batch = text(
+        "SELECT id, user_id, name FROM todos WHERE id > :last_id ORDER BY id LIMIT :n"
+    ).bindparams(bindparam("n", BATCH_SIZE))
+    last_id = 0
+    while True:
+        rows = conn.execute(select_batch, {"last_id": last_id}).all()
+        if not rows:
+            break
+        conn.execute(
+            text(INSERT[conn.dialect.name]),
+            [
+                {"todo_id": id, "user_id": user_id, "tokens": index_tokens(name)}
+                for id, user_id, name in rows
+            ],
+        )
+        last_id = rows[-1][0]
@@ -2,3 +2,7 @@ from models.todo import TodoModel
 from models.tag import TagModel
 from models.todo_tags import TodoTags
 from models.user import UserModel
+from models.user_version import UserVersionModel
+from models.import_job import ImportJobModel, ImportIdMapModel
+from models.todo_counter import TodoCounterModel
+from models.job import JobModel
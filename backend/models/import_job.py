@@ -0,0 +1,30 @@
+from db import db
+from sqlalchemy.sql import func
+
+
+class ImportJobModel(db.Model):
+    __tablename__ = "import_jobs"
+
+    # 取り込みの進み具合。切断されてもここから再開できる
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id"), nullable=False, index=True
+    )
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    tags = db.Column(db.Integer, nullable=False, default=0)
+    todos = db.Column(db.Integer, nullable=False, default=0)
+    links = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=func.now())
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+
+
+class ImportIdMapModel(db.Model):
+    __tablename__ = "import_id_map"
+
+    # エクスポート元の id -> 取り込み先の id。リンクの付け替えに使う
+    job_id = db.Column(db.Integer, db.ForeignKey("import_jobs.id"), primary_key=True)
+    kind = db.Column(db.String(10), primary_key=True)
+    source_id = db.Column(db.Integer, primary_key=True)
+    target_id = db.Column(db.Integer, nullable=False)
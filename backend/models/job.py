@@ -0,0 +1,30 @@
+from db import db
+from sqlalchemy.sql import func
+
+
+class JobModel(db.Model):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # ワーカーが次の仕事を探す WHERE status = ? AND run_at <= ? ORDER BY run_at
+        db.Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
+
+    # バックグラウンドで実行する仕事のキュー
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    # アカウントの削除の後も状態を残すので外部キーにはしない
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    payload = db.Column(db.Text, nullable=False, default="{}")
+    # queued -> running -> succeeded / failed (失敗してもまだ試せるなら queued に戻る)
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=func.now())
+    # 実行中のワーカーが落ちたら、この時刻を過ぎた仕事を別のワーカーが拾い直す
+    locked_until = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=func.now())
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+    finished_at = db.Column(db.DateTime, nullable=True)
@@ -4,6 +4,12 @@ from sqlalchemy.sql import func
 
 class TodoModel(db.Model):
     __tablename__ = "todos"
+    __table_args__ = (
+        # 一覧の WHERE user_id = ? ORDER BY created_at DESC, id DESC をそのまま辿る
+        db.Index("ix_todos_user_id_created_at_id", "user_id", "created_at", "id"),
+        # カレンダーの WHERE user_id = ? AND deadline >= ? AND deadline < ? を範囲で辿る
+        db.Index("ix_todos_user_id_deadline_id", "user_id", "deadline", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
@@ -11,9 +17,7 @@ class TodoModel(db.Model):
     updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
     deadline = db.Column(db.DateTime, nullable=True)
     is_done = db.Column(db.Boolean, default=False, nullable=False)
-    user_id = db.Column(
-        db.Integer, db.ForeignKey("users.id"), nullable=False, index=True
-    )
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     tags = db.relationship("TagModel", back_populates="todos", secondary="todo_tags")
     # 以下いらないかも
     user = db.relationship("UserModel", back_populates="todos")
@@ -0,0 +1,28 @@
+from datetime import date
+from db import db
+
+# 期限の無い todo の day。一意インデックスで NULL 同士は重複とみなされないので NULL にしない
+NO_DEADLINE = date.min
+
+
+class TodoCounterModel(db.Model):
+    __tablename__ = "todo_counters"
+    __table_args__ = (
+        db.Index(
+            "ix_todo_counters_user_id_tag_id_day",
+            "user_id",
+            "tag_id",
+            "day",
+            unique=True,
+        ),
+    )
+
+    # ユーザー (とタグ) と期限の日ごとの todo の件数。書き込みのたびに差分だけ足し込む
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    # 0 はタグに関係なくユーザーの todo 全体
+    tag_id = db.Column(db.Integer, nullable=False, default=0)
+    # 期限の無い todo は NO_DEADLINE
+    day = db.Column(db.Date, nullable=False, default=NO_DEADLINE)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    done = db.Column(db.Integer, nullable=False, default=0)
@@ -3,6 +3,11 @@ from db import db
 
 class TodoTags(db.Model):
     __tablename__ = "todo_tags"
+    __table_args__ = (
+        # 同じ組み合わせのリンクを重複させない。todo 側からの検索にも使う
+        db.Index("uq_todo_tags_todo_id_tag_id", "todo_id", "tag_id", unique=True),
+        db.Index("ix_todo_tags_tag_id_todo_id", "tag_id", "todo_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     tag_id = db.Column(db.Integer, db.ForeignKey("tags.id"), nullable=False)
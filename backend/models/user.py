@@ -1,15 +1,27 @@
+from datetime import timezone
 from db import db
 
 
 class UserModel(db.Model):
     __tablename__ = "users"
+    # 削除したユーザーの id を再利用しない (古いトークンや ETag が新しいユーザーに通らないように)
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(20), nullable=False, unique=True)
     password = db.Column(db.String, nullable=False)
+    # これより前に発行されたトークンはすべて失効している (UTC)
+    tokens_valid_after = db.Column(db.DateTime, nullable=True)
     todos = db.relation(
         "TodoModel", back_populates="user", lazy="dynamic", cascade="all, delete"
     )
     tags = db.relationship(
         "TagModel", back_populates="user", lazy="dynamic", cascade="all,delete"
     )
+
+    def token_revoked(self, issued_at):
+        """issued_at (JWT の iat, UNIX 時刻) に発行されたトークンが失効しているか"""
+        if self.tokens_valid_after is None:
+            return False
+        valid_after = self.tokens_valid_after.replace(tzinfo=timezone.utc)
+        return issued_at < valid_after.timestamp()
@@ -0,0 +1,10 @@
+from db import db
+
+
+class UserVersionModel(db.Model):
+    __tablename__ = "user_versions"
+
+    # ユーザーの todo / tag が変わるたびに増えるカウンタ (ETag 用)
+    # ユーザーを削除しても行を残す (id が再利用されても古い ETag と一致しないように)
+    user_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
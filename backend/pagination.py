@@ -0,0 +1,29 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+
+# (created_at, id) をクライアントから中身の見えない文字列にする
+def encode_cursor(created_at, todo_id):
+    raw = json.dumps([created_at.isoformat(), todo_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """カーソル文字列を (created_at, id) に戻す。不正な値なら ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, todo_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(todo_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def keyset_after(created_at_col, id_col, cursor):
+    """ORDER BY created_at DESC, id DESC で cursor より後ろの行を取る条件"""
+    created_at, todo_id = decode_cursor(cursor)
+    return or_(
+        created_at_col < created_at,
+        and_(created_at_col == created_at, id_col < todo_id),
+    )
@@ -0,0 +1,103 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from flask import current_app
+from passlib.context import CryptContext
+
+# 既存ユーザーのハッシュはこの方式で保存されているので、常に検証できるようにしておく
+LEGACY_SCHEMES = ["pbkdf2_sha256"]
+
+
+@lru_cache(maxsize=None)
+def _context(scheme, rounds):
+    schemes = [scheme] + [s for s in LEGACY_SCHEMES if s != scheme]
+    settings = {}
+    if rounds:
+        # min_rounds も揃えておくと、古いコストのハッシュが needs_update になる
+        settings[f"{scheme}__default_rounds"] = rounds
+        settings[f"{scheme}__min_rounds"] = rounds
+    return CryptContext(schemes=schemes, deprecated="auto", **settings)
+
+
+# 以下はワーカープロセスで実行されるので、pickle できる引数だけを受け取る
+def _hash(scheme, rounds, password):
+    return _context(scheme, rounds).hash(password)
+
+
+def _verify_and_update(scheme, rounds, password, stored_hash):
+    return _context(scheme, rounds).verify_and_update(password, stored_hash)
+
+
+class PasswordHasher:
+    """
+    パスワードのハッシュ化を担当するサービス
+
+    KDF は CPU を占有するので、PASSWORD_HASH_WORKERS 個のプロセスプールで実行する。
+    0 を指定するとリクエストスレッド上でそのまま計算する。
+    """
+
+    def __init__(self, app=None):
+        self._executors = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "PASSWORD_HASH_SCHEME", os.getenv("PASSWORD_HASH_SCHEME", "pbkdf2_sha256")
+        )
+        app.config.setdefault(
+            "PASSWORD_HASH_ROUNDS", int(os.getenv("PASSWORD_HASH_ROUNDS", "0")) or None
+        )
+        app.config.setdefault(
+            "PASSWORD_HASH_WORKERS",
+            int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1))),
+        )
+        app.extensions["password_hasher"] = self
+
+    def _settings(self):
+        config = current_app.config
+        return config["PASSWORD_HASH_SCHEME"], config["PASSWORD_HASH_ROUNDS"]
+
+    def _executor(self):
+        workers = current_app.config["PASSWORD_HASH_WORKERS"]
+        if not workers:
+            return None
+        # fork 後の子プロセスでは親のプールを使えないので pid ごとに持つ
+        key = (os.getpid(), workers)
+        executor = self._executors.get(key)
+        if executor is None:
+            # 最初のリクエストが同時に来てもプールは1つだけ作る
+            with self._lock:
+                executor = self._executors.get(key)
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                    self._executors[key] = executor
+        return executor
+
+    def _run(self, fn, *args):
+        executor = self._executor()
+        if executor is None:
+            return fn(*args)
+        return executor.submit(fn, *args).result()
+
+    def hash(self, password):
+        return self._run(_hash, *self._settings(), password)
+
+    def verify_and_update(self, password, stored_hash):
+        """
+        (検証結果, 新しいハッシュ) を返す。
+        設定が変わっていて再ハッシュが必要な場合だけ新しいハッシュが入る
+        """
+        return self._run(_verify_and_update, *self._settings(), password, stored_hash)
+
+    def shutdown(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors.clear()
+
+
+hasher = PasswordHasher()
+atexit.register(hasher.shutdown)
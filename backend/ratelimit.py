@@ -0,0 +1,268 @@
+"""
+レート制限 (GCRA)
+
+ルートごとに、ユーザー (JWT)・IP・ログインのユーザー名をキーにして制限する。
+before_request で判定するので、超えたリクエストは KDF や DB のクエリの前に 429 で返す。
+
+制限は "回数/期間[:バースト]" で書く (例: "10/minute:5" は1分に10回、連続は5回まで)。
+GCRA では各キーについて「理論上の到着時刻 (TAT)」だけを保存すればよい。
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+from flask import current_app, g, request
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.config import config
+from flask_smorest import abort
+from resp import RespClient, RespError
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# エンドポイントごとの制限: (設定のキー, 何をキーにするか)
+RULES = {
+    "users.UserLogin": [
+        ("RATELIMIT_LOGIN_IP", "ip"),
+        # 1つのアカウントへの総当たりは IP を変えても止める
+        ("RATELIMIT_LOGIN_USERNAME", "username"),
+    ],
+    "users.UserRegister": [("RATELIMIT_REGISTER_IP", "ip")],
+    "graphql.graphql_server": [("RATELIMIT_GRAPHQL", "user")],
+}
+# RULES に無いエンドポイントに使う制限 (ユーザーか IP とエンドポイントごと)
+DEFAULT_RULE = ("RATELIMIT_DEFAULT", "user")
+# 制限しないエンドポイント
+EXEMPT_PREFIXES = ("health.", "api-docs.", "static", "metrics")
+
+Decision = namedtuple("Decision", "allowed tat remaining reset retry_after")
+
+
+class Limit:
+    def __init__(self, count, period, burst=None):
+        self.count = count
+        self.period = period
+        self.burst = burst or count
+        # 1回分のトークンが戻るまでの時間
+        self.interval = period / count
+
+    @classmethod
+    def parse(cls, value):
+        rate, _, burst = value.partition(":")
+        count, _, period = rate.partition("/")
+        return cls(int(count), PERIODS[period.strip()], int(burst) if burst else None)
+
+    @property
+    def policy(self):
+        """RateLimit-Policy ヘッダーの値"""
+        return f"{self.count};w={self.period};burst={self.burst}"
+
+    def evaluate(self, tat, now):
+        """保存されている TAT (無ければ None) から判定する"""
+        tat = max(tat or now, now)
+        new_tat = tat + self.interval
+        allow_at = new_tat - self.burst * self.interval
+        if now < allow_at:
+            return Decision(False, tat, 0, tat - now, allow_at - now)
+        remaining = int((now - allow_at) / self.interval + 1e-9)
+        return Decision(True, new_tat, remaining, new_tat - now, 0.0)
+
+
+class InMemoryRateLimitStore:
+    """プロセス内だけの TAT。ワーカーが複数あればそれぞれで数える"""
+
+    MAX_KEYS = 100_000
+
+    def __init__(self):
+        self._tats = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, now):
+        with self._lock:
+            decision = limit.evaluate(self._tats.get(key), now)
+            if decision.allowed:
+                if len(self._tats) >= self.MAX_KEYS:
+                    self._prune(now)
+                self._tats[key] = decision.tat
+        return decision
+
+    def _prune(self, now):
+        # TAT が過ぎたキーはバケツが満杯なので、消しても結果は変わらない
+        for key, tat in list(self._tats.items()):
+            if tat <= now:
+                del self._tats[key]
+
+
+class RedisRateLimitStore:
+    """
+    Redis プロトコルのストア。プロセス間で TAT を共有する
+
+    WATCH / MULTI / EXEC で読んで書くまでを楽観的に排他する。
+    キーは TAT を過ぎたら不要なので PX で期限を付ける。
+    """
+
+    MAX_RETRIES = 5
+
+    def __init__(self, url, prefix="ratelimit"):
+        self.client = RespClient(url)
+        self.prefix = prefix
+
+    def hit(self, key, limit, now):
+        key = f"{self.prefix}:{key}"
+        decision = None
+        for _ in range(self.MAX_RETRIES):
+            self.client.execute("WATCH", key)
+            tat = self.client.execute("GET", key)
+            decision = limit.evaluate(float(tat) if tat else None, now)
+            if not decision.allowed:
+                self.client.execute("UNWATCH")
+                return decision
+            ttl_ms = max(1, math.ceil((decision.tat - now) * 1000))
+            *_, result = self.client.pipeline(
+                [["MULTI"], ["SET", key, repr(decision.tat), "PX", ttl_ms], ["EXEC"]]
+            )
+            if result is not None:
+                return decision
+            # 他のプロセスが先に書き込んだのでやり直す
+            now = time.time()
+        logger.warning("rate limit update for %s kept conflicting", key)
+        return decision
+
+
+def create_store(url):
+    if url.startswith("memory://"):
+        return InMemoryRateLimitStore()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisRateLimitStore(url)
+    raise ValueError(f"Unsupported rate limit store: {url}")
+
+
+def _client_ip():
+    # リバースプロキシの後ろでは PROXY_FIX_X_FOR を設定して X-Forwarded-For を使う
+    return request.remote_addr or "unknown"
+
+
+def _identity(kind):
+    if kind == "ip":
+        return f"ip:{_client_ip()}"
+    if kind == "username":
+        data = request.get_json(silent=True)
+        username = data.get("username") if isinstance(data, dict) else None
+        if not isinstance(username, str) or not username:
+            return None
+        return f"username:{username[:80]}"
+    # ログインしていればユーザー、していなければ IP。
+    # Cookie のトークンの署名と期限だけを確かめ、失効やユーザーの確認 (DB を引くローダー) は
+    # 呼ばない。制限を超えたリクエストは DB に触れずに 429 で返す
+    user_id = None
+    token = request.cookies.get(config.access_cookie_name)
+    if token:
+        try:
+            payload = decode_token(token)
+            if payload.get("type") == "access":
+                user_id = payload.get(config.identity_claim_key)
+        except Exception:
+            user_id = None
+    return f"user:{user_id}" if user_id is not None else f"ip:{_client_ip()}"
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.store = InMemoryRateLimitStore()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "RATELIMIT_ENABLED",
+            os.getenv("RATELIMIT_ENABLED", "1").lower()
+            not in ("0", "false", "no", "off"),
+        )
+        app.config.setdefault(
+            "RATELIMIT_STORAGE_URL", os.getenv("RATELIMIT_STORAGE_URL", "memory://")
+        )
+        app.config.setdefault(
+            "RATELIMIT_LOGIN_IP", os.getenv("RATELIMIT_LOGIN_IP", "60/minute:20")
+        )
+        app.config.setdefault(
+            "RATELIMIT_LOGIN_USERNAME",
+            os.getenv("RATELIMIT_LOGIN_USERNAME", "10/minute:5"),
+        )
+        app.config.setdefault(
+            "RATELIMIT_REGISTER_IP", os.getenv("RATELIMIT_REGISTER_IP", "20/hour:10")
+        )
+        app.config.setdefault(
+            "RATELIMIT_GRAPHQL", os.getenv("RATELIMIT_GRAPHQL", "120/minute:60")
+        )
+        app.config.setdefault(
+            "RATELIMIT_DEFAULT", os.getenv("RATELIMIT_DEFAULT", "600/minute:200")
+        )
+        self.store = create_store(app.config["RATELIMIT_STORAGE_URL"])
+        app.extensions["rate_limiter"] = self
+        if not app.config["RATELIMIT_ENABLED"]:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _rules(self):
+        endpoint = request.endpoint
+        if endpoint is None or endpoint.startswith(EXEMPT_PREFIXES):
+            return []
+        rules = RULES.get(endpoint)
+        if rules is not None:
+            return [(name, kind, name) for name, kind in rules]
+        name, kind = DEFAULT_RULE
+        return [(name, kind, f"{name}:{endpoint}")]
+
+    def _before_request(self):
+        now = time.time()
+        tightest = None
+        for config_key, kind, scope in self._rules():
+            value = current_app.config.get(config_key)
+            identity = _identity(kind) if value else None
+            if identity is None:
+                continue
+            limit = Limit.parse(value)
+            try:
+                decision = self.store.hit(f"{scope}:{identity}", limit, now)
+            except (OSError, RespError):
+                # ストアが落ちていても API は止めない
+                logger.warning("rate limit store is unavailable", exc_info=True)
+                continue
+            if decision is None:
+                continue
+            if not decision.allowed:
+                retry_after = max(1, math.ceil(decision.retry_after))
+                abort(
+                    429,
+                    message="Too many requests. Please retry later.",
+                    headers={
+                        **_headers(limit, decision),
+                        "Retry-After": str(retry_after),
+                    },
+                )
+            if tightest is None or decision.remaining < tightest[1].remaining:
+                tightest = (limit, decision)
+        g.rate_limit = tightest
+
+    def _after_request(self, response):
+        tightest = g.pop("rate_limit", None)
+        if tightest is not None:
+            response.headers.update(_headers(*tightest))
+        return response
+
+
+def _headers(limit, decision):
+    return {
+        "RateLimit-Limit": str(limit.burst),
+        "RateLimit-Remaining": str(decision.remaining),
+        "RateLimit-Reset": str(max(0, math.ceil(decision.reset))),
+        "RateLimit-Policy": limit.policy,
+    }
+
+
+limiter = RateLimiter()
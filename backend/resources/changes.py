@@ -0,0 +1,26 @@
+from flask import Response, request, stream_with_context
+from flask.views import MethodView
+from flask_smorest import Blueprint
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from changes import feed
+
+blp = Blueprint(
+    "changes", __name__, description="server-sent change events", url_prefix="/api"
+)
+
+
+@blp.route("/changes")
+class Changes(MethodView):
+    @jwt_required()
+    @blp.response(200)
+    def get(self):
+        access_user = int(get_jwt_identity())
+        # EventSource は再接続時に最後に受け取った id を Last-Event-ID で送ってくる
+        last_event_id = request.headers.get("Last-Event-ID") or request.args.get(
+            "last_event_id"
+        )
+        return Response(
+            stream_with_context(feed.stream(access_user, last_event_id)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
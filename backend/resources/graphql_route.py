@@ -1,23 +1,147 @@
 from flask import Blueprint, request, jsonify, current_app
 from ariadne import graphql_sync
 from ariadne.explorer import ExplorerGraphiQL
-from gql.index import schema
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import func, select
+from db import db
+from gql.index import get_schema
+from gql.cache import document_cache, query_hash
+from gql.cost import cost_limit_rule
+from gql.loaders import Loaders
+from graphql import GraphQLError, OperationType, get_operation_ast
+from db_config import use_replica
+from instrumentation import timer
+from compression import StaticAsset
+from models import TodoModel
 
 blp = Blueprint("graphql", __name__)
 
-explorer_html = ExplorerGraphiQL().html(None)
+# GraphiQL の HTML は最初の GET /graphql で1回だけ作る
+explorer = StaticAsset(lambda: ExplorerGraphiQL().html(None), "text/html")
+
+
+def _persisted_query_error(message, code):
+    return jsonify({"errors": [{"message": message, "extensions": {"code": code}}]})
+
+
+def _is_query(document, operation_name):
+    """mutation を含まない query ならリードレプリカで実行できる"""
+    if document is None:
+        return False
+    operation = get_operation_ast(document, operation_name)
+    return operation is not None and operation.operation == OperationType.QUERY
+
+
+def _todo_count():
+    """Query.todos が返す件数 (ログインしているユーザーの todo の数)"""
+    try:
+        verify_jwt_in_request()
+        user_id = int(get_jwt_identity())
+    except Exception:
+        # リゾルバも空のリストを返す
+        return 0
+    return db.session.scalar(
+        select(func.count()).select_from(TodoModel).where(TodoModel.user_id == user_id)
+    )
 
 
 @blp.route("/graphql", methods=["GET"])
 def graphql_playground():
-    return explorer_html, 200
+    # 本番では GRAPHQL_EXPLORER=0 で無効にできる
+    if not current_app.config["GRAPHQL_EXPLORER"]:
+        return "", 404
+    return explorer.response()
 
 
-@blp.route("/graphql", methods=["POST"])
-def graphql_server():
-    data = request.get_json()
-    success, result = graphql_sync(
-        schema, data, context_value=request, debug=current_app.debug
+def prepare_request(data):
+    """
+    persisted query の解決・レプリカの選択・深さとコストのルールの用意をする
+
+    (data, options, cost, None) を返す。実行せずにそのまま返す応答があるときは
+    (None, None, None, 応答) を返す。options は graphql_sync / graphql の引数
+    """
+    query_document = None
+
+    # Apollo 互換の persisted query: クエリ本文の代わりに SHA-256 だけ送られてくる
+    persisted = None
+    if isinstance(data, dict):
+        persisted = (data.get("extensions") or {}).get("persistedQuery")
+    if isinstance(persisted, dict) and persisted.get("sha256Hash"):
+        sha256_hash = persisted["sha256Hash"]
+        if data.get("query"):
+            if query_hash(data["query"]) != sha256_hash:
+                return (
+                    None,
+                    None,
+                    None,
+                    (
+                        _persisted_query_error(
+                            "provided sha does not match query", "BAD_USER_INPUT"
+                        ),
+                        400,
+                    ),
+                )
+        else:
+            entry = document_cache.get(sha256_hash)
+            if entry is None:
+                # クライアントはクエリ本文を付けて再送する
+                return (
+                    None,
+                    None,
+                    None,
+                    (
+                        _persisted_query_error(
+                            "PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND"
+                        ),
+                        200,
+                    ),
+                )
+            data = {**data, "query": entry.query}
+            query_document = entry.document
+
+    if query_document is None and isinstance(data, dict):
+        try:
+            query_document = document_cache.get_or_parse(data["query"]).document
+        except (GraphQLError, KeyError, TypeError):
+            # エラーの応答は ariadne に任せる
+            pass
+    if isinstance(data, dict):
+        use_replica(_is_query(query_document, data.get("operationName")))
+    # 深さとコストは検証の段階で計算し、上限を超えたらリゾルバを実行しない
+    cost = {}
+    cost_rule = cost_limit_rule(
+        current_app.config["GRAPHQL_MAX_DEPTH"],
+        current_app.config["GRAPHQL_MAX_COST"],
+        data,
+        cost,
+        # todos は全件を返すので、見積もりではなく実際の件数でコストを計算する
+        list_sizes={"Query.todos": _todo_count},
     )
+    options = {
+        "context_value": {"request": request, "loaders": Loaders()},
+        "query_parser": document_cache.query_parser,
+        "query_validator": document_cache.query_validator,
+        "query_document": query_document,
+        "validation_rules": [cost_rule],
+        "debug": current_app.debug,
+    }
+    return data, options, cost, None
+
+
+def finish_request(success, result, cost):
+    if cost:
+        result.setdefault("extensions", {})["cost"] = cost
     status_code = 200 if success else 400
-    return jsonify(result), status_code
+    with timer("serialize"):
+        response = jsonify(result)
+    return response, status_code
+
+
+@blp.route("/graphql", methods=["POST"])
+def graphql_server():
+    data, options, cost, response = prepare_request(request.get_json())
+    if response is not None:
+        return response
+    with timer("graphql"):
+        success, result = graphql_sync(get_schema(), data, **options)
+    return finish_request(success, result, cost)
@@ -0,0 +1,58 @@
+import logging
+from flask import Blueprint, current_app
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from db import db
+from blocklist import blocklist
+from changes import feed
+from resp import RespError
+
+logger = logging.getLogger(__name__)
+
+blp = Blueprint("health", __name__)
+
+
+def _check_engine(engine):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+def _checks():
+    """readiness で確認する依存先。(名前, 確認する関数) のリスト"""
+    checks = [("database", lambda: _check_engine(db.engine))]
+    replica = current_app.extensions.get("db_replica")
+    if replica is not None:
+        checks.append(("database_replica", lambda: _check_engine(replica)))
+    # Redis プロトコルのストアを使っている場合だけ確認する
+    for name, store in (
+        ("token_blocklist", blocklist.store),
+        ("change_feed", feed.store),
+    ):
+        client = getattr(store, "client", None)
+        if client is not None:
+            checks.append((name, lambda client=client: client.execute("PING")))
+    return checks
+
+
+@blp.route("/healthz", methods=["GET"])
+def healthz():
+    """liveness: プロセスが応答できるか。依存先は見ない"""
+    return {"status": "ok"}, 200
+
+
+@blp.route("/readyz", methods=["GET"])
+def readyz():
+    """readiness: DB などの依存先に繋がるか。繋がらなければ 503 で振り分けから外してもらう"""
+    results = {}
+    for name, check in _checks():
+        try:
+            check()
+            results[name] = "ok"
+        except (OSError, RespError, SQLAlchemyError) as e:
+            logger.warning("readiness check %s failed: %s", name, e)
+            results[name] = "unavailable"
+    ready = all(result == "ok" for result in results.values())
+    return (
+        {"status": "ready" if ready else "unavailable", "checks": results},
+        200 if ready else 503,
+    )
@@ -0,0 +1,30 @@
+from flask import url_for
+from flask.views import MethodView
+from flask_smorest import Blueprint, abort
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import JobModel
+from schema import JobSchema
+import serializers
+
+blp = Blueprint("jobs", __name__, description="background jobs", url_prefix="/api")
+
+
+def accepted(job):
+    """仕事を積んだリクエストの応答。Location の URL で状態を確認できる"""
+    return serializers.json_response(
+        JobSchema().dump(job),
+        status=202,
+        headers={"Location": url_for("jobs.Job", job_id=job.id)},
+    )
+
+
+@blp.route("/jobs/<int:job_id>")
+class Job(MethodView):
+    @jwt_required()
+    @blp.response(200, JobSchema)
+    def get(self, job_id):
+        access_user = int(get_jwt_identity())
+        job = JobModel.query.get_or_404(job_id)
+        if job.user_id != access_user:
+            abort(403, message="Invalid credentials")
+        return job
@@ -0,0 +1,55 @@
+from flask.views import MethodView
+from flask_smorest import Blueprint
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from schema import (
+    CalendarQuerySchema,
+    CalendarSchema,
+    StatsQuerySchema,
+    TodoStatsSchema,
+)
+import serializers
+import stats
+from versions import etag_data
+
+blp = Blueprint("stats", __name__, description="todo statistics", url_prefix="/api")
+
+
+@blp.route("/stats")
+class TodoStats(MethodView):
+    @jwt_required()
+    @blp.etag
+    @blp.arguments(StatsQuerySchema, location="query")
+    @blp.response(200, TodoStatsSchema)
+    def get(self, args):
+        access_user = int(get_jwt_identity())
+        today = stats.today()
+        # 期限切れの件数は日付が変わると変わる
+        blp.set_etag({**etag_data(access_user), "today": today.isoformat()})
+        return stats.summary(
+            access_user,
+            start=args.get("from_"),
+            end=args.get("to"),
+            tag_id=args.get("tag_id"),
+            on=today,
+        )
+
+
+@blp.route("/calendar")
+class Calendar(MethodView):
+    @jwt_required()
+    @blp.etag
+    @blp.arguments(CalendarQuerySchema, location="query")
+    @blp.response(200, CalendarSchema)
+    def get(self, args):
+        access_user = int(get_jwt_identity())
+        blp.set_etag(etag_data(access_user))
+        # 日付と日時は文字列にしてあるので、スキーマを通さずにそのまま返す
+        return serializers.json_response(
+            stats.calendar(
+                access_user,
+                args["from_"],
+                args["to"],
+                tag_ids=args.get("tag_id"),
+                is_done=args.get("is_done"),
+            )
+        )
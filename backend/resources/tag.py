@@ -2,9 +2,15 @@ from flask.views import MethodView
 from flask_smorest import Blueprint, abort
 from sqlalchemy.exc import SQLAlchemyError
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from cache import cache
+from changes import emit
 from db import db
 from models import TagModel, TodoModel
-from schema import TagSchema, PlainTagSchema
+from schema import TagSchema, PlainTagSchema, TagIdsSchema
+import serializers
+import stats
+import tag_links
+from versions import bump_version, etag_data
 
 blp = Blueprint("Tags", "tags", description="Operation on tags", url_prefix="/api")
 
@@ -12,9 +18,18 @@ blp = Blueprint("Tags", "tags", description="Operation on tags", url_prefix="/ap
 @blp.route("/tags")
 class Tags(MethodView):
     @jwt_required()
+    @blp.etag
     @blp.response(200, PlainTagSchema(many=True))
     def get(self):
         access_user = int(get_jwt_identity())
+        blp.set_etag(etag_data(access_user))
+        if serializers.enabled():
+            body = cache.get_or_set(
+                "tags",
+                access_user,
+                lambda: serializers.dumps(serializers.user_tags(access_user)),
+            )
+            return serializers.body_response(body)
         return TagModel.query.filter(TagModel.user_id == access_user).all()
 
     @jwt_required()
@@ -25,6 +40,9 @@ class Tags(MethodView):
         tag = TagModel(**tag_data, user_id=access_user)
         try:
             db.session.add(tag)
+            db.session.flush()
+            bump_version(access_user)
+            emit(access_user, "tag.created", {"id": tag.id, "name": tag.name})
             db.session.commit()
         except SQLAlchemyError:
             db.session.rollback()
@@ -35,9 +53,11 @@ class Tags(MethodView):
 @blp.route("/tags/<int:tag_id>")
 class Tag(MethodView):
     @jwt_required()
+    @blp.etag
     @blp.response(200, TagSchema)
     def get(self, tag_id):
         access_user = int(get_jwt_identity())
+        blp.set_etag(etag_data(access_user))
         tag = TagModel.query.get_or_404(tag_id)
         if access_user != tag.user_id:
             abort(403, message="Invalid credentials")
@@ -50,9 +70,12 @@ class Tag(MethodView):
         tag = TagModel.query.get_or_404(tag_id)
         if access_user != tag.user_id:
             abort(403, message="Invalid credetials")
-        if not tag.todos:
+        if not tag_links.tag_in_use(tag_id):
             try:
                 db.session.delete(tag)
+                stats.drop_tag(access_user, tag_id)
+                bump_version(access_user)
+                emit(access_user, "tag.deleted", {"id": tag_id})
                 db.session.commit()
             except SQLAlchemyError:
                 db.session.rollback()
@@ -67,14 +90,41 @@ class Tag(MethodView):
 @blp.route("/todos/<int:todo_id>/tag")
 class TagsInTodo(MethodView):
     @jwt_required()
+    @blp.etag
     @blp.response(200, PlainTagSchema(many=True))
     def get(self, todo_id):
         access_user = int(get_jwt_identity())
+        blp.set_etag(etag_data(access_user))
         todo = TodoModel.query.get_or_404(todo_id)
         if access_user != todo.user_id:
             abort(403, message="Invalid credentials")
         return todo.tags
 
+    @jwt_required()
+    @blp.arguments(TagIdsSchema)
+    @blp.response(200, PlainTagSchema(many=True))
+    def put(self, tag_data, todo_id):
+        access_user = int(get_jwt_identity())
+        tag_ids = tag_data["tag_ids"]
+        status, message = tag_links.ownership_error(access_user, todo_id, tag_ids)
+        if status:
+            abort(status, message=message)
+        try:
+            with stats.track(access_user, [todo_id]):
+                replaced = tag_links.replace_tags(access_user, todo_id, tag_ids)
+            if replaced:
+                bump_version(access_user)
+                emit(
+                    access_user,
+                    "todo.tags_replaced",
+                    {"todo_id": todo_id, "tag_ids": sorted(set(tag_ids))},
+                )
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while replacing the tags.")
+        return tag_links.tags_of(todo_id)
+
 
 @blp.route("/todos/<int:todo_id>/tag/<int:tag_id>")
 class LinkTagsToItem(MethodView):
@@ -82,34 +132,41 @@ class LinkTagsToItem(MethodView):
     @blp.response(204)
     def post(self, todo_id, tag_id):
         access_user = int(get_jwt_identity())
-        todo = TodoModel.query.get_or_404(todo_id)
-        tag = TagModel.query.get_or_404(tag_id)
-        if access_user != tag.user_id or access_user != todo.user_id:
-            abort(403, message="Invalid credentials")
-        if tag not in todo.tags:
-            todo.tags.append(tag)
-            try:
-                db.session.add(todo)
-                db.session.commit()
-            except SQLAlchemyError:
-                db.session.rollback()
-                abort(500, message="An error occurred while inserting the tag.")
+        try:
+            linked = tag_links.link(access_user, todo_id, tag_id)
+            if linked:
+                stats.tag_linked(access_user, todo_id, tag_id)
+                bump_version(access_user)
+                emit(access_user, "tag.linked", {"todo_id": todo_id, "tag_id": tag_id})
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while inserting the tag.")
+        if not linked:
+            # 0件のときだけ、既にリンク済みか権限が無いかを調べる
+            status, message = tag_links.ownership_error(access_user, todo_id, [tag_id])
+            if status:
+                abort(status, message=message)
         return ""
 
     @jwt_required()
     @blp.response(204)
     def delete(self, todo_id, tag_id):
         access_user = int(get_jwt_identity())
-        todo = TodoModel.query.get_or_404(todo_id)
-        tag = TagModel.query.get_or_404(tag_id)
-        if access_user != tag.user_id or access_user != todo.user_id:
-            abort(403, message="Invalid credentials")
-        if tag in todo.tags:
-            todo.tags.remove(tag)
-            try:
-                db.session.add(todo)
-                db.session.commit()
-            except SQLAlchemyError:
-                db.session.rollback()
-                abort(500, message="An error occurred while deleting the tag.")
+        try:
+            unlinked = tag_links.unlink(access_user, todo_id, tag_id)
+            if unlinked:
+                stats.tag_linked(access_user, todo_id, tag_id, sign=-1)
+                bump_version(access_user)
+                emit(
+                    access_user, "tag.unlinked", {"todo_id": todo_id, "tag_id": tag_id}
+                )
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while deleting the tag.")
+        if not unlinked:
+            status, message = tag_links.ownership_error(access_user, todo_id, [tag_id])
+            if status:
+                abort(status, message=message)
         return ""
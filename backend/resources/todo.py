@@ -1,12 +1,30 @@
-from flask import request
+import json
+from flask import current_app, request
 from flask_smorest import abort, Blueprint
 from flask.views import MethodView
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import joinedload
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from bulk import apply_bulk
+from changes import emit, todo_fields
 from db import db
-from models import TodoModel
-from schema import TodoSchema, TodoUpdateSchema
+from jobs import enqueue
+from resources.jobs import accepted
+import serializers
+from models import TodoModel, TodoTags
+from pagination import encode_cursor, keyset_after
+from search import index_todos, name_filter, remove_todos
+from stats import todo_changed
+from schema import (
+    TodoSchema,
+    TodoUpdateSchema,
+    TodoListQuerySchema,
+    TodoBulkSchema,
+    TodoBulkResultSchema,
+    JobSchema,
+)
+from versions import bump_version, etag_data
 
 blp = Blueprint("todo", __name__, description="operation on todos", url_prefix="/api")
 
@@ -14,9 +32,11 @@ blp = Blueprint("todo", __name__, description="operation on todos", url_prefix="
 @blp.route("/todos/<int:todo_id>")
 class Todo(MethodView):
     @jwt_required()
+    @blp.etag
     @blp.response(200, TodoSchema)
     def get(self, todo_id):
         access_user = int(get_jwt_identity())
+        blp.set_etag(etag_data(access_user))
         todo = TodoModel.query.get_or_404(todo_id)
         if access_user != todo.user_id:
             abort(403, message="Invalid credentials")
@@ -29,7 +49,12 @@ class Todo(MethodView):
         if access_user != todo.user_id:
             abort(403, message="Invalid credentials")
         try:
+            # タグ付けが消える前に集計から引く
+            todo_changed(access_user, todo.id, before=(todo.deadline, todo.is_done))
             db.session.delete(todo)
+            remove_todos([todo.id])
+            bump_version(access_user)
+            emit(access_user, "todo.deleted", {"id": todo.id})
             db.session.commit()
         except SQLAlchemyError:
             db.session.rollback()
@@ -43,10 +68,19 @@ class Todo(MethodView):
         todo = TodoModel.query.get_or_404(todo_id)
         if access_user != todo.user_id:
             abort(403, message="Invalid credentials")
-        todo.name = todo_data.get("name", todo.name)
-        todo.deadline = todo_data.get("deadline", todo.deadline)
-        todo.is_done = todo_data.get("is_done", todo.is_done)
+        before = (todo.deadline, todo.is_done)
         try:
+            todo.name = todo_data.get("name", todo.name)
+            todo.deadline = todo_data.get("deadline", todo.deadline)
+            todo.is_done = todo_data.get("is_done", todo.is_done)
+            # 期限の日と完了が変わらなければ何もしない
+            todo_changed(
+                access_user, todo.id, before, after=(todo.deadline, todo.is_done)
+            )
+            if "name" in todo_data:
+                index_todos(todo.user_id, [(todo.id, todo.name)])
+            bump_version(access_user)
+            emit(access_user, "todo.updated", todo_fields(todo))
             db.session.commit()
         except SQLAlchemyError:
             db.session.rollback()
@@ -57,25 +91,62 @@ class Todo(MethodView):
 @blp.route("/todos")
 class TodoList(MethodView):
     @jwt_required()
+    @blp.etag
+    @blp.arguments(TodoListQuerySchema, location="query")
     @blp.response(200, TodoSchema(many=True))
-    def get(self):
+    def get(self, args):
         access_user = int(get_jwt_identity())
-        name = request.args.get("name")
-        if name:
-            return (
-                TodoModel.query.filter(
-                    TodoModel.user_id == access_user, TodoModel.name.contains(name)
+        blp.set_etag(etag_data(access_user))
+        query = TodoModel.query.filter(TodoModel.user_id == access_user)
+        if args.get("name"):
+            query = query.filter(name_filter(args["name"], access_user))
+        if "is_done" in args:
+            query = query.filter(TodoModel.is_done == args["is_done"])
+        if "deadline_from" in args:
+            query = query.filter(TodoModel.deadline >= args["deadline_from"])
+        if "deadline_to" in args:
+            query = query.filter(TodoModel.deadline < args["deadline_to"])
+        if args.get("tag_id"):
+            query = query.filter(
+                TodoModel.id.in_(
+                    select(TodoTags.todo_id).where(TodoTags.tag_id.in_(args["tag_id"]))
                 )
-                .options(joinedload(TodoModel.tags))
-                .order_by(TodoModel.created_at.desc(), TodoModel.id.desc())
-                .all()
             )
-        return (
-            TodoModel.query.filter(TodoModel.user_id == access_user)
-            .options(joinedload(TodoModel.tags))
-            .order_by(TodoModel.created_at.desc(), TodoModel.id.desc())
-            .all()
-        )
+        if "cursor" in args:
+            try:
+                query = query.filter(
+                    keyset_after(TodoModel.created_at, TodoModel.id, args["cursor"])
+                )
+            except ValueError:
+                abort(400, message="Invalid cursor")
+        query = query.order_by(TodoModel.created_at.desc(), TodoModel.id.desc())
+        fast = serializers.enabled()
+        if fast:
+            # ORM オブジェクトを作らず、必要な列だけを取る
+            query = query.with_entities(*serializers.TODO_COLUMNS)
+        else:
+            query = query.options(selectinload(TodoModel.tags))
+
+        # limit が無い場合は従来通り全件を返す
+        limit = args.get("limit")
+        headers = {}
+        if limit is None:
+            todos = query.all()
+        else:
+            # 1件多く取って次のページがあるかを判定する
+            todos = query.limit(limit + 1).all()
+            next_cursor = None
+            if len(todos) > limit:
+                todos = todos[:limit]
+                next_cursor = encode_cursor(todos[-1].created_at, todos[-1].id)
+            pagination = {"limit": limit, "next_cursor": next_cursor}
+            headers["X-Pagination"] = json.dumps(pagination)
+
+        if fast:
+            return serializers.json_response(
+                serializers.todos_with_tags(todos), headers=headers
+            )
+        return todos, headers
 
     @jwt_required()
     @blp.arguments(TodoSchema)
@@ -85,7 +156,45 @@ class TodoList(MethodView):
         todo = TodoModel(**todo_data, user_id=access_user)
         try:
             db.session.add(todo)
+            db.session.flush()
+            todo_changed(access_user, todo.id, after=(todo.deadline, todo.is_done))
+            index_todos(todo.user_id, [(todo.id, todo.name)])
+            bump_version(access_user)
+            emit(access_user, "todo.created", todo_fields(todo))
             db.session.commit()
         except SQLAlchemyError:
             abort(500, message="an error occured while inserting the todo")
         return todo
+
+
+@blp.route("/todos/bulk")
+class TodoBulk(MethodView):
+    @jwt_required()
+    @blp.arguments(TodoBulkSchema)
+    @blp.response(200, TodoBulkResultSchema)
+    @blp.alt_response(202, schema=JobSchema)
+    def post(self, bulk_data):
+        # 単体の削除と同じく、削除を含む場合は fresh なトークンを要求する
+        if bulk_data.get("delete"):
+            verify_jwt_in_request(fresh=True)
+        access_user = int(get_jwt_identity())
+        size = sum(len(items) for items in bulk_data.values())
+        if size > current_app.config["BULK_ASYNC_THRESHOLD"]:
+            # 件数が多いときはワーカーに任せ、結果は /api/jobs/<id> の result で返す
+            try:
+                # 検証済みの本文をそのまま渡し、ワーカーで TodoBulkSchema から読み直す
+                job = enqueue("todos.bulk", request.get_json(), user_id=access_user)
+                db.session.commit()
+            except SQLAlchemyError:
+                db.session.rollback()
+                abort(
+                    500, message="An error occurred while queueing the bulk operations"
+                )
+            return accepted(job)
+        try:
+            results = apply_bulk(access_user, bulk_data)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while applying the bulk operations")
+        return results
@@ -0,0 +1,114 @@
+from flask import Response, current_app, request, stream_with_context
+from flask.views import MethodView
+from flask_smorest import Blueprint, abort
+from sqlalchemy.exc import SQLAlchemyError
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from db import db
+from models import ImportJobModel
+from schema import ExportQuerySchema, ImportQuerySchema, ImportJobSchema
+from transfer import (
+    TransferFormatError,
+    csv_lines,
+    import_records,
+    ndjson_lines,
+    read_records,
+    start_export,
+)
+
+blp = Blueprint(
+    "transfer",
+    __name__,
+    description="export and import of user data",
+    url_prefix="/api",
+)
+
+EXPORT_FORMATS = {
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+    "csv": (csv_lines, "text/csv"),
+}
+
+
+def _get_job(job_id):
+    access_user = int(get_jwt_identity())
+    job = ImportJobModel.query.get_or_404(job_id)
+    if access_user != job.user_id:
+        abort(403, message="Invalid credentials")
+    return job
+
+
+@blp.route("/export")
+class Export(MethodView):
+    @jwt_required()
+    @blp.arguments(ExportQuerySchema, location="query")
+    @blp.response(200)
+    def get(self, args):
+        access_user = int(get_jwt_identity())
+        try:
+            total, done, records = start_export(
+                access_user,
+                args.get("after"),
+                batch_size=current_app.config.get("EXPORT_BATCH_SIZE", 1000),
+                progress_every=current_app.config.get("EXPORT_PROGRESS_INTERVAL", 1000),
+            )
+        except ValueError:
+            abort(400, message="Invalid resume position")
+        to_lines, mimetype = EXPORT_FORMATS[args["format"]]
+        # 全件を組み立てずに、カーソルから読んだ分だけ順に送る
+        return Response(
+            stream_with_context(to_lines(records)),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=export.{args['format']}",
+                "X-Export-Total": str(total),
+                "X-Export-Offset": str(done),
+            },
+        )
+
+
+@blp.route("/imports")
+class ImportJobs(MethodView):
+    @jwt_required()
+    @blp.response(201, ImportJobSchema)
+    def post(self):
+        job = ImportJobModel(user_id=int(get_jwt_identity()))
+        try:
+            db.session.add(job)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while creating the import")
+        return job
+
+
+@blp.route("/imports/<int:job_id>")
+class ImportJob(MethodView):
+    @jwt_required()
+    @blp.response(200, ImportJobSchema)
+    def get(self, job_id):
+        return _get_job(job_id)
+
+    @jwt_required()
+    @blp.arguments(ImportQuerySchema, location="query")
+    @blp.response(200, ImportJobSchema)
+    def put(self, args, job_id):
+        job = _get_job(job_id)
+        if job.status == "done":
+            abort(409, message="The import has already finished")
+        if args["offset"] > job.processed:
+            abort(409, message=f"Resume from offset {job.processed}")
+        records = read_records(request.stream, request.mimetype)
+        try:
+            import_records(
+                job,
+                records,
+                args["offset"],
+                batch_size=current_app.config.get("IMPORT_BATCH_SIZE", 500),
+            )
+        except TransferFormatError as e:
+            # それまでのバッチはコミット済み。processed から送り直せる
+            db.session.rollback()
+            abort(400, message=f"{e} (processed {job.processed})")
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while importing")
+        return job
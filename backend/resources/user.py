@@ -1,28 +1,40 @@
+from datetime import datetime, timezone
 from flask import make_response
-from passlib.hash import pbkdf2_sha256
 from flask.views import MethodView
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
+    decode_token,
     set_access_cookies,
     set_refresh_cookies,
     unset_jwt_cookies,
     jwt_required,
+    get_jwt,
     get_jwt_identity,
 )
 from flask_smorest import Blueprint, abort
 from sqlalchemy.exc import SQLAlchemyError
+from cache import cache
 from db import db
 from models import UserModel
-from schema import UserSchema
+from passwords import hasher
+from blocklist import blocklist
+from jobs import enqueue
+from resources.jobs import accepted
+from schema import JobSchema, UserSchema
+import serializers
+import accounts  # noqa: F401  (account.delete の仕事を登録する)
 
 blp = Blueprint("users", "users", description="Operation on users", url_prefix="/api")
 
 
+def refresh_claims(refresh_token):
+    """ログアウトでリフレッシュトークンも失効させるために、アクセストークンに入れる"""
+    return {"refresh_jti": refresh_token["jti"], "refresh_exp": refresh_token["exp"]}
+
+
 @blp.route("/register")
 class UserRegister(MethodView):
-    @blp.arguments(UserSchema)
-    @blp.doc(security=[])
     @blp.arguments(UserSchema)
     @blp.doc(security=[])
     def post(self, user_data):
@@ -31,7 +43,7 @@ class UserRegister(MethodView):
 
         user = UserModel(
             username=user_data["username"],
-            password=pbkdf2_sha256.hash(user_data["password"]),
+            password=hasher.hash(user_data["password"]),
         )
         try:
             db.session.add(user)
@@ -49,10 +61,26 @@ class UserLogin(MethodView):
         user = UserModel.query.filter(
             UserModel.username == user_data["username"]
         ).first()
-        if user and pbkdf2_sha256.verify(user_data["password"], user.password):
+        verified, new_hash = False, None
+        if user:
+            verified, new_hash = hasher.verify_and_update(
+                user_data["password"], user.password
+            )
+        if verified:
+            # 古い設定のハッシュなら、ログイン成功時に新しい設定で保存し直す
+            if new_hash:
+                user.password = new_hash
+                try:
+                    db.session.commit()
+                except SQLAlchemyError:
+                    db.session.rollback()
             response = make_response()
-            access_token = create_access_token(identity=str(user.id), fresh=True)
             refresh_token = create_refresh_token(identity=str(user.id))
+            access_token = create_access_token(
+                identity=str(user.id),
+                fresh=True,
+                additional_claims=refresh_claims(decode_token(refresh_token)),
+            )
             set_access_cookies(response, access_token)
             set_refresh_cookies(response, refresh_token)
             return response, 204
@@ -64,7 +92,9 @@ class TokenRefresh(MethodView):
     @jwt_required(refresh=True)
     def post(self):
         user_id = get_jwt_identity()
-        new_token = create_access_token(identity=user_id, fresh=False)
+        new_token = create_access_token(
+            identity=user_id, fresh=False, additional_claims=refresh_claims(get_jwt())
+        )
         response = make_response()
         set_access_cookies(response, new_token)
         return response, 204
@@ -74,6 +104,12 @@ class TokenRefresh(MethodView):
 class UserLogout(MethodView):
     @jwt_required()
     def post(self):
+        jwt_payload = get_jwt()
+        blocklist.revoke(jwt_payload["jti"], jwt_payload["exp"])
+        # リフレッシュトークンの Cookie は /api/refresh にしか送られないので、
+        # アクセストークンに入れておいた jti で一緒に失効させる
+        if "refresh_jti" in jwt_payload:
+            blocklist.revoke(jwt_payload["refresh_jti"], jwt_payload["refresh_exp"])
         response = make_response()
         unset_jwt_cookies(response)
         return response, 204
@@ -85,7 +121,33 @@ class UserDetails(MethodView):
     @blp.response(200, UserSchema)
     def get(self):
         user_id = get_jwt_identity()
+        if serializers.enabled():
+            body = cache.get_or_set(
+                "profile",
+                int(user_id),
+                lambda: serializers.dumps(
+                    serializers.user_profile(UserModel.query.get_or_404(user_id))
+                ),
+            )
+            return serializers.body_response(body)
         return UserModel.query.get_or_404(user_id)
 
-
-# 後でredisにblocklist
+    @jwt_required(fresh=True)
+    @blp.alt_response(202, schema=JobSchema)
+    def delete(self):
+        """
+        アカウントを削除する。削除はワーカーで行い、このリクエストではログアウトだけする
+        """
+        user_id = int(get_jwt_identity())
+        user = UserModel.query.get_or_404(user_id)
+        try:
+            # 削除が終わるまでの間も、他の端末のトークンを含めてすべて使えなくする
+            user.tokens_valid_after = datetime.now(timezone.utc).replace(tzinfo=None)
+            job = enqueue("account.delete", user_id=user_id)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while deleting the account")
+        response = accepted(job)
+        unset_jwt_cookies(response)
+        return response
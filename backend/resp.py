@@ -0,0 +1,112 @@
+import socket
+import threading
+from urllib.parse import urlparse
+
+
+class RespError(Exception):
+    """Redis がエラー応答 (-ERR ...) を返したとき"""
+
+
+def _encode(args):
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        else:
+            data = str(arg).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+def _read_reply(f):
+    line = f.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    prefix, rest = line[:1], line[1:-2]
+    if prefix == b"+":
+        return rest.decode()
+    if prefix == b"-":
+        raise RespError(rest.decode())
+    if prefix == b":":
+        return int(rest)
+    if prefix == b"$":
+        length = int(rest)
+        if length == -1:
+            return None
+        data = f.read(length + 2)
+        return data[:-2].decode()
+    if prefix == b"*":
+        length = int(rest)
+        if length == -1:
+            return None
+        return [_read_reply(f) for _ in range(length)]
+    raise ConnectionError(f"Unexpected reply: {line!r}")
+
+
+class RespClient:
+    """
+    Redis プロトコル (RESP2) を話す最小限のクライアント
+
+    redis-py に依存しないように、必要なコマンドだけを execute() で送る。
+    接続はスレッドごとに持つ。
+    """
+
+    def __init__(self, url, timeout=1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        f = sock.makefile("rb")
+        self._local.conn = (sock, f)
+        if self.password:
+            self._send(["AUTH", self.password])
+        if self.db:
+            self._send(["SELECT", self.db])
+        return self._local.conn
+
+    def _send(self, args):
+        sock, f = self._local.conn
+        sock.sendall(_encode(args))
+        return _read_reply(f)
+
+    def execute(self, *args):
+        if getattr(self._local, "conn", None) is None:
+            self._connect()
+        try:
+            return self._send(args)
+        except (ConnectionError, OSError):
+            # 切断されていたら1回だけ繋ぎ直す
+            self.close()
+            self._connect()
+            return self._send(args)
+
+    def pipeline(self, commands):
+        """複数のコマンドを1往復で送る"""
+        if getattr(self._local, "conn", None) is None:
+            self._connect()
+        sock, f = self._local.conn
+        sock.sendall(b"".join(_encode(args) for args in commands))
+        results = []
+        for _ in commands:
+            try:
+                results.append(_read_reply(f))
+            except RespError as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            sock, f = conn
+            try:
+                f.close()
+                sock.close()
+            except OSError:
+                pass
+            self._local.conn = None
@@ -1,4 +1,15 @@
-from marshmallow import Schema, fields
+import json
+import marshmallow
+from marshmallow import ValidationError, fields, validate, validates_schema
+from instrumentation import timer
+
+
+class Schema(marshmallow.Schema):
+    """dump にかかった時間を Server-Timing の serialize に載せる"""
+
+    def dump(self, obj, *, many=None):
+        with timer("serialize"):
+            return super().dump(obj, many=many)
 
 
 class PlainTodoSchema(Schema):
@@ -35,3 +46,166 @@ class TodoSchema(PlainTodoSchema):
 
 class TagSchema(PlainTagSchema):
     todos = fields.List(fields.Nested(PlainTodoSchema), dump_only=True)
+
+
+class TodoListQuerySchema(Schema):
+    name = fields.Str()
+    is_done = fields.Bool()
+    deadline_from = fields.DateTime()
+    deadline_to = fields.DateTime()
+    tag_id = fields.List(fields.Int())
+    limit = fields.Int(validate=validate.Range(min=1, max=500))
+    cursor = fields.Str()
+
+
+class TodoBulkUpdateSchema(TodoUpdateSchema):
+    id = fields.Int(required=True)
+
+
+class TagLinkSchema(Schema):
+    todo_id = fields.Int(required=True)
+    tag_id = fields.Int(required=True)
+
+
+class TodoBulkSchema(Schema):
+    create = fields.List(
+        fields.Nested(PlainTodoSchema), validate=validate.Length(max=10000)
+    )
+    update = fields.List(
+        fields.Nested(TodoBulkUpdateSchema), validate=validate.Length(max=10000)
+    )
+    delete = fields.List(fields.Int(), validate=validate.Length(max=10000))
+    link = fields.List(
+        fields.Nested(TagLinkSchema), validate=validate.Length(max=10000)
+    )
+    unlink = fields.List(
+        fields.Nested(TagLinkSchema), validate=validate.Length(max=10000)
+    )
+
+
+class BulkItemResultSchema(Schema):
+    index = fields.Int()
+    id = fields.Int(allow_none=True)
+    status = fields.Int()
+    message = fields.Str()
+
+
+class TodoBulkResultSchema(Schema):
+    create = fields.List(fields.Nested(BulkItemResultSchema))
+    update = fields.List(fields.Nested(BulkItemResultSchema))
+    delete = fields.List(fields.Nested(BulkItemResultSchema))
+    link = fields.List(fields.Nested(BulkItemResultSchema))
+    unlink = fields.List(fields.Nested(BulkItemResultSchema))
+
+
+class TagIdsSchema(Schema):
+    tag_ids = fields.List(fields.Int(), required=True)
+
+
+class ExportQuerySchema(Schema):
+    format = fields.Str(
+        load_default="ndjson", validate=validate.OneOf(["ndjson", "csv"])
+    )
+    # 途切れたエクスポートを再開する位置。最後に受け取った行の "<type>:<id>"
+    after = fields.Str()
+
+
+class ImportQuerySchema(Schema):
+    # 送る本文の先頭がデータの何件目からか。処理済みの分は読み飛ばす
+    offset = fields.Int(load_default=0, validate=validate.Range(min=0))
+
+
+class ImportJobSchema(Schema):
+    id = fields.Int(dump_only=True)
+    status = fields.Str(dump_only=True)
+    processed = fields.Int(dump_only=True)
+    tags = fields.Int(dump_only=True)
+    todos = fields.Int(dump_only=True)
+    links = fields.Int(dump_only=True)
+    skipped = fields.Int(dump_only=True)
+    created_at = fields.DateTime(dump_only=True)
+    updated_at = fields.DateTime(dump_only=True)
+
+
+class StatsQuerySchema(Schema):
+    # histogram に含める期限の日の範囲 [from, to)
+    from_ = fields.Date(data_key="from")
+    to = fields.Date()
+    # histogram をこのタグの todo だけにする
+    tag_id = fields.Int()
+
+
+class TodoCountsSchema(Schema):
+    total = fields.Int()
+    done = fields.Int()
+    open = fields.Int()
+    overdue = fields.Int()
+    due_this_week = fields.Int()
+
+
+class TagCountsSchema(TodoCountsSchema):
+    tag_id = fields.Int()
+    name = fields.Str()
+
+
+class DayCountSchema(Schema):
+    date = fields.Date()
+    total = fields.Int()
+    done = fields.Int()
+
+
+class TodoStatsSchema(TodoCountsSchema):
+    tags = fields.List(fields.Nested(TagCountsSchema))
+    histogram = fields.List(fields.Nested(DayCountSchema))
+
+
+class CalendarQuerySchema(Schema):
+    # 期限の日の範囲 [from, to)。1回に取れるのは MAX_DAYS 日まで
+    MAX_DAYS = 366
+
+    from_ = fields.Date(data_key="from", required=True)
+    to = fields.Date(required=True)
+    tag_id = fields.List(fields.Int())
+    is_done = fields.Bool()
+
+    @validates_schema
+    def validate_range(self, data, **kwargs):
+        days = (data["to"] - data["from_"]).days
+        if not 0 < days <= self.MAX_DAYS:
+            raise ValidationError(
+                f"'to' must be after 'from' and within {self.MAX_DAYS} days", "to"
+            )
+
+
+class CalendarTodoSchema(Schema):
+    id = fields.Int()
+    name = fields.Str()
+    deadline = fields.DateTime()
+    is_done = fields.Bool()
+
+
+class CalendarDaySchema(DayCountSchema):
+    todos = fields.List(fields.Nested(CalendarTodoSchema))
+
+
+class CalendarSchema(Schema):
+    from_ = fields.Date(data_key="from")
+    to = fields.Date()
+    total = fields.Int()
+    days = fields.List(fields.Nested(CalendarDaySchema))
+
+
+class JobSchema(Schema):
+    id = fields.Int(dump_only=True)
+    kind = fields.Str(dump_only=True)
+    status = fields.Str(dump_only=True)
+    attempts = fields.Int(dump_only=True)
+    max_attempts = fields.Int(dump_only=True)
+    run_at = fields.DateTime(dump_only=True)
+    last_error = fields.Str(dump_only=True, allow_none=True)
+    # 成功したときの結果 (一括操作なら TodoBulkResultSchema と同じ形)
+    result = fields.Function(
+        lambda job: json.loads(job.result) if job.result else None, dump_only=True
+    )
+    created_at = fields.DateTime(dump_only=True)
+    finished_at = fields.DateTime(dump_only=True, allow_none=True)
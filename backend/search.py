@@ -0,0 +1,236 @@
+import re
+import unicodedata
+import click
+from sqlalchemy import DDL, Float, Integer, bindparam, event, select, text
+from db import db
+from models import TodoModel
+
+# ひらがな・カタカナ・CJK 統合漢字・ハングル
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(rf"([{_CJK}]+)|([^\W_{_CJK}]+)")
+
+
+# SQLite は FTS5、Postgres は tsvector + GIN で todo 名の全文検索インデックスを持つ。
+# 検索はユーザーの中だけなので、user_id も持って一致を探す段階で絞り込む
+SCHEMA = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS todo_search "
+        "USING fts5(tokens, user_id UNINDEXED)"
+    ],
+    "postgresql": [
+        "CREATE TABLE IF NOT EXISTS todo_search ("
+        "todo_id INTEGER PRIMARY KEY REFERENCES todos(id) ON DELETE CASCADE, "
+        "user_id INTEGER NOT NULL, "
+        "tokens tsvector NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_todo_search_tokens "
+        "ON todo_search USING GIN (tokens)",
+        "CREATE INDEX IF NOT EXISTS ix_todo_search_user_id ON todo_search (user_id)",
+    ],
+}
+for _dialect_name, _statements in SCHEMA.items():
+    for _statement in _statements:
+        event.listen(
+            db.metadata,
+            "after_create",
+            DDL(_statement).execute_if(dialect=_dialect_name),
+        )
+event.listen(db.metadata, "before_drop", DDL("DROP TABLE IF EXISTS todo_search"))
+
+
+def create_index_table(conn):
+    """マイグレーション用。conn の DB に todo_search を作る"""
+    for statement in SCHEMA.get(conn.dialect.name, ()):
+        conn.execute(text(statement))
+
+
+def _runs(value):
+    value = unicodedata.normalize("NFKC", value or "").lower()
+    for match in _TOKEN_RE.finditer(value):
+        cjk, word = match.groups()
+        yield cjk, word
+
+
+def index_tokens(value):
+    """
+    インデックスに入れるトークン列
+
+    日本語などは分かち書きされないので 2-gram に分解し、
+    1文字でも前方一致で引けるように末尾の1文字も入れる。
+    """
+    tokens = []
+    for cjk, word in _runs(value):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i : i + 2] for i in range(len(cjk) - 1))
+            tokens.append(cjk[-1])
+    return " ".join(tokens)
+
+
+def _query_terms(value):
+    """(トークンのリスト, 前方一致か) の組を返す"""
+    for cjk, word in _runs(value):
+        if word:
+            yield [word], True
+        elif len(cjk) == 1:
+            yield [cjk], True
+        else:
+            yield [cjk[i : i + 2] for i in range(len(cjk) - 1)], False
+
+
+def _fts5_query(value):
+    clauses = []
+    for tokens, prefix in _query_terms(value):
+        phrase = '"' + " ".join(tokens) + '"'
+        clauses.append(phrase + "*" if prefix else phrase)
+    return " AND ".join(clauses) or None
+
+
+def _tsquery(value):
+    clauses = []
+    for tokens, prefix in _query_terms(value):
+        phrase = " <-> ".join(f"'{token}'" for token in tokens)
+        clauses.append(phrase + ":*" if prefix else f"({phrase})")
+    return " & ".join(clauses) or None
+
+
+def _dialect(conn=None):
+    if conn is not None:
+        return conn.dialect.name
+    return db.session.get_bind().dialect.name
+
+
+def _store(params, conn=None):
+    """{todo_id, user_id, tokens} の行を書き込む (SQLite では既存の行は先に消しておく)"""
+    executor = conn if conn is not None else db.session
+    if _dialect(conn) == "postgresql":
+        executor.execute(
+            text(
+                "INSERT INTO todo_search (todo_id, user_id, tokens) "
+                "VALUES (:todo_id, :user_id, to_tsvector('simple', :tokens)) "
+                "ON CONFLICT (todo_id) DO UPDATE SET tokens = EXCLUDED.tokens"
+            ),
+            params,
+        )
+    else:
+        executor.execute(
+            text(
+                "INSERT INTO todo_search (rowid, user_id, tokens) "
+                "VALUES (:todo_id, :user_id, :tokens)"
+            ),
+            params,
+        )
+
+
+def index_todos(user_id, rows):
+    """user_id の todo の (todo_id, name) の組をインデックスに登録・更新する"""
+    params = [
+        {"todo_id": todo_id, "user_id": user_id, "tokens": index_tokens(name)}
+        for todo_id, name in rows
+    ]
+    if not params:
+        return
+    if _dialect() != "postgresql":
+        remove_todos([p["todo_id"] for p in params])
+    _store(params)
+
+
+def remove_todos(todo_ids):
+    if not todo_ids:
+        return
+    column = "todo_id" if _dialect() == "postgresql" else "rowid"
+    db.session.execute(
+        text(f"DELETE FROM todo_search WHERE {column} IN :ids").bindparams(
+            bindparam("ids", expanding=True)
+        ),
+        {"ids": list(todo_ids)},
+    )
+
+
+def _matches(value, user_id):
+    """user_id の todo のうち検索語に一致する todo_id と順位 (小さいほど上位) のサブクエリ"""
+    if _dialect() == "postgresql":
+        expression = _tsquery(value)
+        if expression is None:
+            return None
+        sql = text(
+            "SELECT todo_id, -ts_rank(tokens, to_tsquery('simple', :q)) AS rank "
+            "FROM todo_search "
+            "WHERE user_id = :user_id AND tokens @@ to_tsquery('simple', :q)"
+        )
+    else:
+        expression = _fts5_query(value)
+        if expression is None:
+            return None
+        sql = text(
+            "SELECT rowid AS todo_id, bm25(todo_search) AS rank "
+            "FROM todo_search WHERE todo_search MATCH :q AND user_id = :user_id"
+        )
+    return (
+        sql.bindparams(q=expression, user_id=user_id)
+        .columns(todo_id=Integer, rank=Float)
+        .subquery()
+    )
+
+
+def name_filter(value, user_id):
+    """user_id の todo の一覧で TodoModel.query.filter() に渡す検索条件"""
+    matches = _matches(value, user_id)
+    if matches is None:
+        # 記号だけの検索語などはトークンにならないので従来の部分一致にする
+        return TodoModel.name.contains(value)
+    return TodoModel.id.in_(select(matches.c.todo_id))
+
+
+def search_todos(user_id, value, limit=50):
+    """関連度順に todo を返す"""
+    matches = _matches(value, user_id)
+    if matches is None:
+        return []
+    return (
+        TodoModel.query.join(matches, matches.c.todo_id == TodoModel.id)
+        .filter(TodoModel.user_id == user_id)
+        .order_by(matches.c.rank, TodoModel.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def rebuild_index(conn=None, batch_size=1000):
+    """
+    既存の todo からインデックスを作り直す
+
+    conn を渡すとその接続で実行し、コミットは呼び出し側 (マイグレーション) に任せる
+    """
+    executor = conn if conn is not None else db.session
+    executor.execute(text("DELETE FROM todo_search"))
+    last_id = 0
+    while True:
+        rows = executor.execute(
+            select(TodoModel.id, TodoModel.user_id, TodoModel.name)
+            .where(TodoModel.id > last_id)
+            .order_by(TodoModel.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        _store(
+            [
+                {"todo_id": id, "user_id": user_id, "tokens": index_tokens(name)}
+                for id, user_id, name in rows
+            ],
+            conn,
+        )
+        last_id = rows[-1][0]
+    if conn is None:
+        db.session.commit()
+
+
+def init_app(app):
+    @app.cli.command("reindex-search")
+    def reindex_search_command():
+        """既存の todo から全文検索インデックスを作り直す"""
+        rebuild_index()
+        click.echo("Search index rebuilt.")
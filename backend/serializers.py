@@ -0,0 +1,111 @@
+"""
+一覧系エンドポイント用の軽量なシリアライズ
+
+ORM オブジェクトを作らずに必要な列だけをタプルで取り、そのまま JSON にする。
+出力は schema.py の marshmallow スキーマと同じ形にしている
+(OpenAPI のドキュメントは引き続きそちらから生成される)。
+"""
+
+import json
+from collections import defaultdict
+from flask import Response, current_app
+from sqlalchemy import select
+from db import db
+from instrumentation import timer
+from models import TagModel, TodoModel, TodoTags
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson は任意の依存
+    orjson = None
+
+IN_CHUNK_SIZE = 1000
+
+TODO_COLUMNS = (
+    TodoModel.id,
+    TodoModel.name,
+    TodoModel.created_at,
+    TodoModel.updated_at,
+    TodoModel.deadline,
+    TodoModel.is_done,
+)
+
+
+def enabled():
+    return current_app.config.get("API_FAST_SERIALIZATION", True)
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(data, sort_keys=True, ensure_ascii=False)
+
+
+def json_response(data, status=200, headers=None):
+    with timer("serialize"):
+        body = dumps(data)
+    return body_response(body, status, headers)
+
+
+def body_response(body, status=200, headers=None):
+    """シリアライズ済みの JSON (キャッシュした本文など) をそのまま返す"""
+    return Response(body, status=status, headers=headers, mimetype="application/json")
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def plain_todo(row):
+    return {
+        "id": row.id,
+        "name": row.name,
+        "created_at": _iso(row.created_at),
+        "updated_at": _iso(row.updated_at),
+        "deadline": _iso(row.deadline),
+        "is_done": row.is_done,
+    }
+
+
+def tags_for_todos(todo_ids):
+    """todo_id -> [{"id", "name"}] を1回のクエリで取る"""
+    tags = defaultdict(list)
+    if not todo_ids:
+        return tags
+    rows = []
+    # バインド変数の上限 (SQLite は 32766) を超えないように分けて取る
+    for i in range(0, len(todo_ids), IN_CHUNK_SIZE):
+        rows += db.session.execute(
+            select(TodoTags.todo_id, TagModel.id, TagModel.name)
+            .join(TagModel, TagModel.id == TodoTags.tag_id)
+            .where(TodoTags.todo_id.in_(todo_ids[i : i + IN_CHUNK_SIZE]))
+        ).all()
+    for todo_id, tag_id, name in sorted(rows, key=lambda row: row[1]):
+        tags[todo_id].append({"id": tag_id, "name": name})
+    return tags
+
+
+def todos_with_tags(rows):
+    """TodoSchema(many=True) と同じ形"""
+    tags = tags_for_todos([row.id for row in rows])
+    return [{**plain_todo(row), "tags": tags.get(row.id, [])} for row in rows]
+
+
+def user_tags(user_id):
+    rows = db.session.execute(
+        select(TagModel.id, TagModel.name).where(TagModel.user_id == user_id)
+    ).all()
+    return [{"id": tag_id, "name": name} for tag_id, name in rows]
+
+
+def user_profile(user):
+    """UserSchema と同じ形。todo は PlainTodoSchema なのでタグを含まない"""
+    todos = db.session.execute(
+        select(*TODO_COLUMNS).where(TodoModel.user_id == user.id)
+    ).all()
+    return {
+        "id": user.id,
+        "username": user.username,
+        "tags": user_tags(user.id),
+        "todos": [plain_todo(row) for row in todos],
+    }
@@ -0,0 +1,354 @@
+"""
+todo の集計 (件数・完了・期限切れ・今週が期限・期限の日ごとの件数)
+
+todo_counters にユーザー (とタグ) と期限の日ごとの total / done を持っておき、
+書き込みのたびに変わった分だけ足し込む。
+集計の API はこの表だけを読むので、todo の件数が増えても重くならない。
+
+足し込みは (user_id, tag_id, day) の一意インデックスへの UPSERT 1文で、行は読まない。
+1件ずつの書き込みでは、呼び出し側が知っている変更の前後から増減を決める:
+
+    todo_changed(user_id, todo.id, before=(期限, 完了), after=(期限, 完了))
+    tag_linked(user_id, todo_id, tag_id)  # 外したときは sign=-1
+
+一括操作や取り込みのように多くの todo が変わるときは、前後の状態を読んで差を取る:
+
+    with track(user_id, todo_ids) as tracked:
+        ... todo やタグ付けを変更する ...
+        tracked.created(new_ids)
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta, timezone
+from sqlalchemy import (
+    Date,
+    case,
+    cast,
+    delete,
+    func,
+    literal,
+    select,
+    true,
+    union_all,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from db import db
+from models import TagModel, TodoCounterModel, TodoModel, TodoTags
+from models.todo_counter import NO_DEADLINE
+
+# ユーザーの todo 全体を表す tag_id
+ALL = 0
+IN_CHUNK_SIZE = 1000
+# 複数行の INSERT 1文あたりの行数 (5列なのでバインド変数は 2500 個まで)
+UPSERT_CHUNK_SIZE = 500
+COLUMNS = ["user_id", "tag_id", "day", "total", "done"]
+
+
+def _day(deadline):
+    return deadline.date() if deadline is not None else NO_DEADLINE
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def _day_of(deadline):
+    """SQL の中で期限の日時を集計の day にする"""
+    if _dialect() == "postgresql":
+        day = cast(deadline, Date)
+    else:
+        # SQLite の Date 列は 'YYYY-MM-DD' の文字列
+        day = func.date(deadline)
+    return func.coalesce(day, literal(NO_DEADLINE, Date))
+
+
+def _upsert(statement):
+    """同じ (user_id, tag_id, day) の行があれば、読まずに total / done に足す"""
+    return statement.on_conflict_do_update(
+        index_elements=["user_id", "tag_id", "day"],
+        set_={
+            "total": TodoCounterModel.total + statement.excluded.total,
+            "done": TodoCounterModel.done + statement.excluded.done,
+        },
+    )
+
+
+def _insert():
+    dialect = postgresql if _dialect() == "postgresql" else sqlite
+    return dialect.insert(TodoCounterModel)
+
+
+def contributions(deadline, is_done, tag_ids):
+    """1件の todo が数えられる (tag_id, 日) と (total, done) の増分"""
+    day = _day(deadline)
+    for scope in (ALL, *tag_ids):
+        yield (scope, day), (1, int(bool(is_done)))
+
+
+def todo_changed(user_id, todo_id, before=None, after=None):
+    """
+    1件の todo の期限か完了が変わった (作成は before=None、削除は after=None)
+
+    before / after は (期限, 完了)。全体の行と、todo_tags にある todo のタグの行に
+    1文で足し込む。期限の日も完了も変わらなければ何もしない。
+    削除のときはタグ付けが消える前に呼ぶこと
+    """
+    days = {}
+    for sign, state in ((-1, before), (1, after)):
+        if state is not None:
+            deadline, is_done = state
+            change = days.setdefault(_day(deadline), [0, 0])
+            change[0] += sign
+            change[1] += sign * int(bool(is_done))
+    changes = [
+        select(
+            literal(day, Date).label("day"),
+            literal(total).label("total"),
+            literal(done).label("done"),
+        )
+        for day, (total, done) in days.items()
+        if total or done
+    ]
+    if not changes:
+        return
+    changes = (union_all(*changes) if len(changes) > 1 else changes[0]).subquery()
+    scopes = union_all(
+        select(literal(ALL).label("tag_id")),
+        select(TodoTags.tag_id).where(TodoTags.todo_id == todo_id),
+    ).subquery()
+    source = (
+        select(
+            literal(user_id),
+            scopes.c.tag_id,
+            changes.c.day,
+            changes.c.total,
+            changes.c.done,
+        ).join_from(scopes, changes, true())
+        # SQLite の INSERT ... SELECT ... ON CONFLICT は WHERE が無いと構文が曖昧になる
+        .where(true())
+    )
+    db.session.execute(_upsert(_insert().from_select(COLUMNS, source)))
+
+
+def tag_linked(user_id, todo_id, tag_id, sign=1):
+    """
+    todo に tag_id を付けた (sign=-1 で外した)
+
+    todo の今の期限と完了で、タグの行に1文で足し込む
+    """
+    source = select(
+        literal(user_id),
+        literal(tag_id),
+        _day_of(TodoModel.deadline),
+        literal(sign),
+        case((TodoModel.is_done, sign), else_=0),
+    ).where(TodoModel.id == todo_id, TodoModel.user_id == user_id)
+    db.session.execute(_upsert(_insert().from_select(COLUMNS, source)))
+
+
+def snapshot(user_id, todo_ids):
+    """todo_id -> (期限, 完了, タグの id) 。他のユーザーの todo は含めない"""
+    todo_ids = list(set(todo_ids))
+    states, tags = {}, {}
+    for i in range(0, len(todo_ids), IN_CHUNK_SIZE):
+        chunk = todo_ids[i : i + IN_CHUNK_SIZE]
+        states.update(
+            (id, (deadline, is_done))
+            for id, deadline, is_done in db.session.execute(
+                select(TodoModel.id, TodoModel.deadline, TodoModel.is_done).where(
+                    TodoModel.id.in_(chunk), TodoModel.user_id == user_id
+                )
+            )
+        )
+        for todo_id, tag_id in db.session.execute(
+            select(TodoTags.todo_id, TodoTags.tag_id).where(TodoTags.todo_id.in_(chunk))
+        ):
+            tags.setdefault(todo_id, []).append(tag_id)
+    return {
+        id: (deadline, is_done, tuple(tags.get(id, ())))
+        for id, (deadline, is_done) in states.items()
+    }
+
+
+class Tracker:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._before = {}
+
+    def watch(self, todo_ids):
+        """これから変更する既存の todo の今の状態を覚えておく"""
+        new_ids = [id for id in set(todo_ids) if id not in self._before]
+        if new_ids:
+            current = snapshot(self.user_id, new_ids)
+            for id in new_ids:
+                self._before[id] = current.get(id)
+
+    def created(self, todo_ids):
+        """新しく作った todo (変更前は存在しない)"""
+        for id in todo_ids:
+            self._before.setdefault(id, None)
+
+    def apply(self):
+        after = snapshot(self.user_id, self._before)
+        deltas = Counter()
+        for id, before in self._before.items():
+            if before is not None:
+                for key, (total, done) in contributions(*before):
+                    deltas[key, "total"] -= total
+                    deltas[key, "done"] -= done
+            if id in after:
+                for key, (total, done) in contributions(*after[id]):
+                    deltas[key, "total"] += total
+                    deltas[key, "done"] += done
+        apply_deltas(self.user_id, deltas)
+        self._before = {}
+
+
+@contextmanager
+def track(user_id, todo_ids=()):
+    """ブロックの中の変更を集計に反映する。例外のときは何もしない (ロールバックされる)"""
+    tracker = Tracker(user_id)
+    tracker.watch(todo_ids)
+    yield tracker
+    tracker.apply()
+
+
+def apply_deltas(user_id, deltas):
+    """
+    {((tag_id, 日), "total" | "done"): 増減} を todo_counters に足す
+
+    複数行の UPSERT で足し込むので、既存の行は読まない。
+    0件になった行は消さずに残す (集計では読み飛ばす)
+    """
+    rows = {}
+    for ((scope, day), column), value in deltas.items():
+        if value:
+            row = rows.setdefault(
+                (scope, day),
+                {
+                    "user_id": user_id,
+                    "tag_id": scope,
+                    "day": day,
+                    "total": 0,
+                    "done": 0,
+                },
+            )
+            row[column] = value
+    rows = list(rows.values())
+    for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        db.session.execute(_upsert(_insert().values(rows[i : i + UPSERT_CHUNK_SIZE])))
+
+
+def drop_tag(user_id, tag_id):
+    """タグを消したときに、そのタグの行を消す (使われていないタグなので件数は0)"""
+    db.session.execute(
+        delete(TodoCounterModel).where(
+            TodoCounterModel.user_id == user_id, TodoCounterModel.tag_id == tag_id
+        )
+    )
+
+
+def today():
+    return datetime.now(timezone.utc).date()
+
+
+def _counts():
+    return {"total": 0, "done": 0, "open": 0, "overdue": 0, "due_this_week": 0}
+
+
+def summary(user_id, start=None, end=None, tag_id=None, on=None):
+    """
+    集計を返す
+
+    - overdue: 期限の日が今日より前で未完了
+    - due_this_week: 期限の日が今日から今週の日曜日までで未完了
+    - histogram: [start, end) の期限の日ごとの件数 (tag_id を指定するとそのタグだけ)
+    """
+    on = on or today()
+    week_end = on + timedelta(days=7 - on.weekday())
+    rows = db.session.execute(
+        select(
+            TodoCounterModel.tag_id,
+            TodoCounterModel.day,
+            func.sum(TodoCounterModel.total),
+            func.sum(TodoCounterModel.done),
+        )
+        .where(TodoCounterModel.user_id == user_id)
+        .group_by(TodoCounterModel.tag_id, TodoCounterModel.day)
+    ).all()
+    names = dict(
+        db.session.execute(
+            select(TagModel.id, TagModel.name).where(TagModel.user_id == user_id)
+        ).all()
+    )
+    scopes = {ALL: _counts(), **{id: _counts() for id in names}}
+    histogram = []
+    for scope, day, total, done in rows:
+        counts = scopes.get(scope)
+        if counts is None or not total:
+            continue
+        counts["total"] += total
+        counts["done"] += done
+        counts["open"] += total - done
+        if day != NO_DEADLINE and day < on:
+            counts["overdue"] += total - done
+        elif day != NO_DEADLINE and day < week_end:
+            counts["due_this_week"] += total - done
+        if (
+            scope == (tag_id or ALL)
+            and day != NO_DEADLINE
+            and (start is None or day >= start)
+            and (end is None or day < end)
+        ):
+            histogram.append({"date": day, "total": total, "done": done})
+    return {
+        **scopes.pop(ALL),
+        "tags": [
+            {"tag_id": id, "name": names[id], **counts}
+            for id, counts in sorted(scopes.items())
+        ],
+        "histogram": sorted(histogram, key=lambda bucket: bucket["date"]),
+    }
+
+
+def calendar(user_id, start, end, tag_ids=None, is_done=None):
+    """
+    期限が [start, end) の todo を日ごとにまとめて返す
+
+    (user_id, deadline, id) のインデックスを範囲で1回辿るだけで、並べ替えもしない
+    """
+    query = (
+        select(TodoModel.id, TodoModel.name, TodoModel.deadline, TodoModel.is_done)
+        .where(
+            TodoModel.user_id == user_id,
+            TodoModel.deadline >= datetime.combine(start, time.min),
+            TodoModel.deadline < datetime.combine(end, time.min),
+        )
+        .order_by(TodoModel.deadline, TodoModel.id)
+    )
+    if is_done is not None:
+        query = query.where(TodoModel.is_done == is_done)
+    if tag_ids:
+        query = query.where(
+            TodoModel.id.in_(
+                select(TodoTags.todo_id).where(TodoTags.tag_id.in_(tag_ids))
+            )
+        )
+    days = []
+    for id, name, deadline, done in db.session.execute(query):
+        day = deadline.date().isoformat()
+        if not days or days[-1]["date"] != day:
+            days.append({"date": day, "total": 0, "done": 0, "todos": []})
+        bucket = days[-1]
+        bucket["total"] += 1
+        bucket["done"] += int(done)
+        bucket["todos"].append(
+            {"id": id, "name": name, "deadline": deadline.isoformat(), "is_done": done}
+        )
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "total": sum(bucket["total"] for bucket in days),
+        "days": days,
+    }
@@ -0,0 +1,120 @@
+from sqlalchemy import delete, exists, insert, select, true
+from db import db
+from models import TagModel, TodoModel, TodoTags
+
+
+def _owned_todo(user_id, todo_id):
+    return select(TodoModel.id).where(
+        TodoModel.id == todo_id, TodoModel.user_id == user_id
+    )
+
+
+def _owned_tags(user_id, tag_ids):
+    return select(TagModel.id).where(
+        TagModel.id.in_(tag_ids), TagModel.user_id == user_id
+    )
+
+
+def _pairs():
+    """(todo_id, tag_id) の組。条件は呼び出し側の WHERE で絞る (直積の警告を出さない)"""
+    return (
+        select(TodoModel.id, TagModel.id).select_from(TodoModel).join(TagModel, true())
+    )
+
+
+def ownership_error(user_id, todo_id, tag_ids=()):
+    """
+    todo とタグの所有者を確認して (ステータス, メッセージ) を返す。問題なければ (None, None)
+
+    書き込みが0件だったときに、理由を調べるためだけに使う
+    """
+    todo_owner = db.session.execute(
+        select(TodoModel.user_id).where(TodoModel.id == todo_id)
+    ).scalar()
+    tag_owners = dict(
+        db.session.execute(
+            select(TagModel.id, TagModel.user_id).where(TagModel.id.in_(tag_ids))
+        ).all()
+    )
+    if todo_owner is None or len(tag_owners) != len(set(tag_ids)):
+        return 404, "Not found"
+    if todo_owner != user_id or any(o != user_id for o in tag_owners.values()):
+        return 403, "Invalid credentials"
+    return None, None
+
+
+def link(user_id, todo_id, tag_id):
+    """
+    所有者の確認・重複の確認・INSERT を1文で行う。追加した件数を返す
+
+    INSERT INTO todo_tags SELECT ... WHERE 所有者が一致 AND NOT EXISTS (既存のリンク)
+    """
+    source = _pairs().where(
+        TodoModel.id == todo_id,
+        TodoModel.user_id == user_id,
+        TagModel.id == tag_id,
+        TagModel.user_id == user_id,
+        ~exists().where(TodoTags.todo_id == todo_id, TodoTags.tag_id == tag_id),
+    )
+    result = db.session.execute(
+        insert(TodoTags).from_select(["todo_id", "tag_id"], source)
+    )
+    return result.rowcount
+
+
+def unlink(user_id, todo_id, tag_id):
+    """所有者を確認しながら1文で削除する。削除した件数を返す"""
+    result = db.session.execute(
+        delete(TodoTags).where(
+            TodoTags.todo_id == todo_id,
+            TodoTags.tag_id == tag_id,
+            TodoTags.todo_id.in_(_owned_todo(user_id, todo_id)),
+            TodoTags.tag_id.in_(_owned_tags(user_id, [tag_id])),
+        )
+    )
+    return result.rowcount
+
+
+def replace_tags(user_id, todo_id, tag_ids):
+    """
+    todo のタグを tag_ids にまとめて置き換える。変更した件数を返す
+
+    呼び出し前に ownership_error() で todo とタグの所有者を確認しておくこと
+    """
+    tag_ids = set(tag_ids)
+    removed = db.session.execute(
+        delete(TodoTags).where(
+            TodoTags.todo_id == todo_id, TodoTags.tag_id.not_in(tag_ids)
+        )
+    ).rowcount
+    added = 0
+    if tag_ids:
+        source = _pairs().where(
+            TodoModel.id == todo_id,
+            TodoModel.user_id == user_id,
+            TagModel.id.in_(tag_ids),
+            TagModel.user_id == user_id,
+            ~exists().where(
+                TodoTags.todo_id == todo_id, TodoTags.tag_id == TagModel.id
+            ),
+        )
+        added = db.session.execute(
+            insert(TodoTags).from_select(["todo_id", "tag_id"], source)
+        ).rowcount
+    return removed + added
+
+
+def tag_in_use(tag_id):
+    """タグが1件でも todo に付いているか (EXISTS)"""
+    return db.session.execute(
+        select(exists().where(TodoTags.tag_id == tag_id))
+    ).scalar()
+
+
+def tags_of(todo_id):
+    tags = (
+        TagModel.query.join(TodoTags, TodoTags.tag_id == TagModel.id)
+        .filter(TodoTags.todo_id == todo_id)
+        .all()
+    )
+    return sorted(tags, key=lambda tag: tag.id)
@@ -1,6 +1,7 @@
 import pytest
 from app import create_app
 from db import db
+from resp_stub import RespStubServer
 
 
 # テスト用のアプリ設定
@@ -42,3 +43,11 @@ def auth_client(client):
         return client
 
     return _auth_client
+
+
+# Redis プロトコルのバックエンド用のスタブサーバー
+@pytest.fixture
+def resp_server():
+    server = RespStubServer().start()
+    yield server
+    server.stop()
@@ -0,0 +1,272 @@
+"""
+テスト用の Redis 代わりのサーバー
+
+本物の Redis を立てずに Redis プロトコルのバックエンドを試すためのもの。
+使うコマンドだけを実装している。
+"""
+
+import copy
+import socketserver
+import threading
+import time
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    data = value if isinstance(value, bytes) else str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def _array(values):
+    return b"*%d\r\n" % len(values) + b"".join(_bulk(v) for v in values)
+
+
+def _reply(value):
+    """入れ子の配列も含めて応答を組み立てる"""
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_reply(v) for v in value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    return _bulk(value)
+
+
+def _stream_id(value):
+    ms, _, seq = value.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _score(value):
+    # "-inf" / "+inf" も float() でそのまま解釈できる
+    return float(value)
+
+
+class RespStubServer:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.RLock()
+        # XREAD BLOCK で待っている接続を XADD で起こす
+        self.cond = threading.Condition(self.lock)
+        self.commands = []
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    args = self._read_command()
+                    if args is None:
+                        return
+                    stub.commands.append(args[0].upper())
+                    self.wfile.write(stub.dispatch(args, self))
+
+            def _read_command(self):
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                count = int(line[1:-2])
+                args = []
+                for _ in range(count):
+                    length = int(self.rfile.readline()[1:-2])
+                    args.append(self.rfile.read(length + 2)[:-2].decode())
+                return args
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = "redis://127.0.0.1:%d/0" % self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _get(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def dispatch(self, args, handler):
+        name = args[0].upper()
+        if name in ("WATCH", "UNWATCH", "MULTI", "EXEC", "DISCARD"):
+            with self.lock:
+                return self._transaction(name, args[1:], handler)
+        if getattr(handler, "queue", None) is not None:
+            handler.queue.append(args)
+            return b"+QUEUED\r\n"
+        method = getattr(self, f"cmd_{name.lower()}", None)
+        if method is None:
+            return b"-ERR unknown command '%s'\r\n" % name.encode()
+        with self.lock:
+            return method(*args[1:])
+
+    def _transaction(self, name, args, handler):
+        """
+        WATCH / MULTI / EXEC は接続ごとの状態を持つ
+
+        WATCH したキーは値で比べる (本物の Redis は書き込みがあったかで判定する)
+        """
+        if name == "WATCH":
+            watched = getattr(handler, "watched", {})
+            for key in args:
+                watched[key] = copy.deepcopy(self._get(key))
+            handler.watched = watched
+            return b"+OK\r\n"
+        if name == "MULTI":
+            handler.queue = []
+            return b"+OK\r\n"
+        queue = getattr(handler, "queue", None)
+        watched = getattr(handler, "watched", {})
+        handler.queue, handler.watched = None, {}
+        if name != "EXEC":
+            return b"+OK\r\n"
+        if queue is None:
+            return b"-ERR EXEC without MULTI\r\n"
+        if any(self._get(key) != value for key, value in watched.items()):
+            return b"*-1\r\n"
+        replies = [self.dispatch(args, handler) for args in queue]
+        return b"*%d\r\n" % len(replies) + b"".join(replies)
+
+    def cmd_ping(self):
+        return b"+PONG\r\n"
+
+    def cmd_auth(self, *args):
+        return b"+OK\r\n"
+
+    def cmd_select(self, db):
+        return b"+OK\r\n"
+
+    def cmd_get(self, key):
+        return _bulk(self._get(key))
+
+    def cmd_set(self, key, value, *options):
+        options = [o.upper() for o in options]
+        if "NX" in options and self._get(key) is not None:
+            return _bulk(None)
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if "EX" in options:
+            self.expires[key] = time.time() + int(options[options.index("EX") + 1])
+        if "PX" in options:
+            self.expires[key] = (
+                time.time() + int(options[options.index("PX") + 1]) / 1000
+            )
+        return b"+OK\r\n"
+
+    def cmd_del(self, *keys):
+        count = 0
+        for key in keys:
+            if self._get(key) is not None:
+                count += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return b":%d\r\n" % count
+
+    def cmd_exists(self, *keys):
+        return b":%d\r\n" % sum(self._get(key) is not None for key in keys)
+
+    def cmd_incr(self, key):
+        value = int(self._get(key) or 0) + 1
+        self.data[key] = str(value)
+        return b":%d\r\n" % value
+
+    def cmd_expire(self, key, seconds):
+        if self._get(key) is None:
+            return b":0\r\n"
+        self.expires[key] = time.time() + int(seconds)
+        return b":1\r\n"
+
+    def cmd_zadd(self, key, *pairs):
+        zset = self.data.setdefault(key, {})
+        added = 0
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            added += member not in zset
+            zset[member] = float(score)
+        return b":%d\r\n" % added
+
+    def cmd_zrangebyscore(self, key, low, high):
+        zset = self._get(key) or {}
+        members = sorted(
+            (score, m)
+            for m, score in zset.items()
+            if _score(low) <= score <= _score(high)
+        )
+        return _array([m for _, m in members])
+
+    def cmd_zremrangebyscore(self, key, low, high):
+        zset = self._get(key) or {}
+        removed = [m for m, s in zset.items() if _score(low) <= s <= _score(high)]
+        for m in removed:
+            del zset[m]
+        return b":%d\r\n" % len(removed)
+
+    def _entries(self, key, low, high):
+        return [
+            [id, fields]
+            for id, fields in self._get(key) or []
+            if low <= _stream_id(id) <= high
+        ]
+
+    def cmd_xadd(self, key, *args):
+        args = list(args)
+        maxlen = None
+        if args[0].upper() == "MAXLEN":
+            args.pop(0)
+            if args[0] in ("~", "="):
+                args.pop(0)
+            maxlen = int(args.pop(0))
+        stream = self.data.setdefault(key, [])
+        id = args.pop(0)
+        if id == "*":
+            ms = int(time.time() * 1000)
+            last = _stream_id(stream[-1][0]) if stream else (0, 0)
+            seq = last[1] + 1 if ms <= last[0] else 0
+            id = "%d-%d" % (max(ms, last[0]), seq)
+        stream.append((id, args))
+        if maxlen is not None:
+            del stream[: max(0, len(stream) - maxlen)]
+        self.cond.notify_all()
+        return _bulk(id)
+
+    def cmd_xlen(self, key):
+        return b":%d\r\n" % len(self._get(key) or [])
+
+    def cmd_xrange(self, key, start, end, *options):
+        low = (0, 0) if start == "-" else _stream_id(start)
+        high = (float("inf"), 0) if end == "+" else _stream_id(end)
+        entries = self._entries(key, low, high)
+        if options:
+            entries = entries[: int(options[1])]
+        return _reply(entries)
+
+    def cmd_xrevrange(self, key, end, start, *options):
+        low = (0, 0) if start == "-" else _stream_id(start)
+        high = (float("inf"), 0) if end == "+" else _stream_id(end)
+        entries = self._entries(key, low, high)[::-1]
+        if options:
+            entries = entries[: int(options[1])]
+        return _reply(entries)
+
+    def cmd_xread(self, *args):
+        options = [a.upper() for a in args]
+        count = int(args[options.index("COUNT") + 1]) if "COUNT" in options else None
+        block = int(args[options.index("BLOCK") + 1]) if "BLOCK" in options else None
+        key, last_id = args[options.index("STREAMS") + 1 :]
+        low = _stream_id(last_id)
+        low = (low[0], low[1] + 1)
+
+        def pending():
+            return self._entries(key, low, (float("inf"), 0))[:count]
+
+        entries = pending()
+        if not entries and block is not None:
+            self.cond.wait_for(pending, timeout=block / 1000)
+            entries = pending()
+        if not entries:
+            return b"*-1\r\n"
+        return _reply([[key, entries]])
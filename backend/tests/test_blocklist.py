@@ -0,0 +1,108 @@
+import time
+import pytest
+from blocklist import BloomFilter, RedisBlocklistStore, TokenBlocklist
+
+
+def test_logout_revokes_access_token(client, auth_client):
+    """
+    ログアウトしたトークンは、Cookie を再送しても使えないこと
+    """
+    client = auth_client()
+    access_cookie = client.get_cookie("access_token_cookie").value
+
+    res = client.post("/api/logout")
+    assert res.status_code == 204
+
+    # ログアウト前のトークンを再利用しようとする
+    client.set_cookie("access_token_cookie", access_cookie)
+    res = client.get("/api/todos")
+    assert res.status_code == 401
+    assert res.get_json()["error"] == "token_revoked"
+
+
+def test_logout_revokes_refresh_token(client, auth_client):
+    """
+    ログアウトすると、/api/refresh にしか送られないリフレッシュトークンも使えなくなること
+    """
+    client = auth_client()
+    refresh_cookie = client.get_cookie("refresh_token_cookie", path="/api/refresh")
+    assert client.post("/api/refresh").status_code == 204
+
+    assert client.post("/api/logout").status_code == 204
+
+    client.set_cookie("refresh_token_cookie", refresh_cookie.value, path="/api/refresh")
+    res = client.post("/api/refresh")
+    assert res.status_code == 401
+    assert res.get_json()["error"] == "token_revoked"
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000)
+    jtis = [f"jti-{i}" for i in range(1000)]
+    for jti in jtis:
+        bloom.add(jti)
+    assert all(jti in bloom for jti in jtis)
+
+
+@pytest.fixture
+def redis_blocklist(app, resp_server):
+    app.config["TOKEN_BLOCKLIST_URL"] = resp_server.url
+    app.config["TOKEN_BLOCKLIST_SYNC_INTERVAL"] = 0
+    blocklist = TokenBlocklist()
+    blocklist.init_app(app)
+    return blocklist
+
+
+def test_unrevoked_tokens_skip_the_store(redis_blocklist, resp_server):
+    """
+    失効していないトークンの確認ではストアの EXISTS を呼ばないこと
+    """
+    redis_blocklist.revoke("revoked", time.time() + 60)
+    assert redis_blocklist.is_revoked("revoked")
+    resp_server.commands.clear()
+
+    for i in range(100):
+        assert not redis_blocklist.is_revoked(f"fresh-{i}")
+    assert "EXISTS" not in resp_server.commands
+
+
+def test_revocation_is_shared_between_processes(app, redis_blocklist, resp_server):
+    """
+    別プロセス (別インスタンス) の失効も同期で取り込まれること
+    """
+    other = TokenBlocklist()
+    other.init_app(app)
+
+    redis_blocklist.revoke("shared", time.time() + 60)
+    assert other.is_revoked("shared")
+    assert RedisBlocklistStore(resp_server.url).contains("shared")
+
+
+def test_sync_reads_only_new_revocations(app, redis_blocklist, resp_server):
+    """
+    2回目からの同期は失効の記録を前回から読むだけで、全件を読み直さないこと
+    """
+    other = TokenBlocklist()
+    other.init_app(app)
+    redis_blocklist.revoke("first", time.time() + 60)
+    assert other.is_revoked("first")
+
+    redis_blocklist.revoke("second", time.time() + 60)
+    resp_server.commands.clear()
+    assert other.is_revoked("second")
+    assert other.is_revoked("first")
+    assert "ZRANGEBYSCORE" in resp_server.commands
+    assert "ZREMRANGEBYSCORE" not in resp_server.commands
+
+
+def test_store_outage_uses_last_synced_filter(redis_blocklist, resp_server):
+    """
+    ストアが落ちても 500 にせず、最後に同期したフィルタで判定すること
+    """
+    redis_blocklist.revoke("revoked", time.time() + 60)
+    assert not redis_blocklist.is_revoked("fresh")
+    redis_blocklist._cache.clear()
+    resp_server.stop()
+
+    assert not redis_blocklist.is_revoked("fresh")
+    assert redis_blocklist.is_revoked("revoked")
@@ -0,0 +1,125 @@
+def test_bulk_create_update_delete_and_link(auth_client):
+    """
+    一括操作が1回のリクエストで反映され、項目ごとの結果が返ること
+    """
+    client = auth_client()
+    client.post("/api/tags", json={"name": "bulk-tag"})
+
+    res = client.post(
+        "/api/todos/bulk",
+        json={"create": [{"name": f"import-{i}"} for i in range(5)]},
+    )
+    assert res.status_code == 200
+    created = res.get_json()["create"]
+    assert [r["status"] for r in created] == [201] * 5
+    ids = [r["id"] for r in created]
+
+    res = client.post(
+        "/api/todos/bulk",
+        json={
+            "update": [{"id": ids[0], "is_done": True, "name": "renamed"}],
+            "delete": [ids[1]],
+            "link": [
+                {"todo_id": ids[2], "tag_id": 1},
+                {"todo_id": ids[2], "tag_id": 1},
+            ],
+        },
+    )
+    body = res.get_json()
+    assert body["update"][0]["status"] == 204
+    assert body["delete"][0]["status"] == 204
+    assert [r["status"] for r in body["link"]] == [204, 204]
+
+    todos = {t["id"]: t for t in client.get("/api/todos").get_json()}
+    assert len(todos) == 4
+    assert todos[ids[0]]["name"] == "renamed"
+    assert todos[ids[0]]["is_done"] is True
+    assert [t["name"] for t in todos[ids[2]]["tags"]] == ["bulk-tag"]
+
+    res = client.post(
+        "/api/todos/bulk", json={"unlink": [{"todo_id": ids[2], "tag_id": 1}]}
+    )
+    assert res.get_json()["unlink"][0]["status"] == 204
+    assert client.get(f"/api/todos/{ids[2]}").get_json()["tags"] == []
+
+
+def test_bulk_reports_other_users_items(client, auth_client):
+    """
+    他人の todo・存在しない todo は項目ごとにエラーとして返り、他の項目は反映されること
+    """
+    client_a = auth_client(username="bulk_a", password="pw")
+    client_a.post("/api/todos", json={"name": "A のタスク"})
+    client.delete_cookie("access_token_cookie")
+
+    client_b = auth_client(username="bulk_b", password="pw")
+    client_b.post("/api/todos", json={"name": "B のタスク"})
+    res = client_b.post(
+        "/api/todos/bulk",
+        json={
+            "update": [
+                {"id": 1, "is_done": True},
+                {"id": 2, "is_done": True},
+                {"id": 99},
+            ]
+        },
+    )
+    assert [r["status"] for r in res.get_json()["update"]] == [403, 204, 404]
+
+
+def test_graphql_batch_mutations(auth_client):
+    client = auth_client()
+    res = client.post(
+        "/graphql",
+        json={
+            "query": """
+                mutation {
+                  createTodos(todos: [{name: "gql-1"}, {name: "gql-2", deadline: "2025-03-01T00:00:00"}]) {
+                    id status
+                  }
+                }
+            """
+        },
+    )
+    assert res.status_code == 200
+    assert [r["status"] for r in res.get_json()["data"]["createTodos"]] == [201, 201]
+
+    res = client.post(
+        "/graphql",
+        json={
+            "query": 'mutation { updateTodos(todos: [{id: "1", is_done: true}]) { status } }'
+        },
+    )
+    assert res.get_json()["data"]["updateTodos"][0]["status"] == 204
+    assert client.get("/api/todos/1").get_json()["is_done"] is True
+
+
+def test_graphql_batch_mutations_share_rest_validation(app, auth_client):
+    """
+    GraphQL の一括操作も REST と同じ検証をし、大きな一括操作は REST に任せること
+    """
+    client = auth_client()
+    client.post(
+        "/graphql",
+        json={"query": 'mutation { createTodos(todos: [{name: "a"}]) { id } }'},
+    )
+
+    # 更新での明示的な null は REST と同じく拒否する
+    res = client.post(
+        "/graphql",
+        json={
+            "query": 'mutation { updateTodos(todos: [{id: "1", name: null}]) { status } }'
+        },
+    )
+    assert res.get_json()["data"] is None
+    assert client.get("/api/todos/1").get_json()["name"] == "a"
+
+    app.config["BULK_ASYNC_THRESHOLD"] = 1
+    res = client.post(
+        "/graphql",
+        json={
+            "query": 'mutation { createTodos(todos: [{name: "b"}, {name: "c"}]) { id } }'
+        },
+    )
+    (error,) = res.get_json()["errors"]
+    assert error["extensions"]["code"] == "BATCH_TOO_LARGE"
+    assert len(client.get("/api/todos").get_json()) == 1
@@ -0,0 +1,114 @@
+import pytest
+from sqlalchemy import event
+from app import create_app
+from cache import InMemoryCache, RedisCache, cache
+from db import db
+from jobs import Worker
+
+
+def _statements(client, *paths):
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, *args):
+        # 認証のたびにトークンのユーザーを1回読むのはキャッシュと関係ないので数えない
+        if not statement.startswith("SELECT users.id AS users_id"):
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        bodies = [client.get(path).get_json() for path in paths]
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _before_cursor_execute)
+    return bodies, statements
+
+
+def test_repeated_reads_skip_sql(auth_client):
+    """
+    /api/tags と /api/me は2回目から ETag のバージョン番号しか読まないこと
+    """
+    client = auth_client()
+    client.post("/api/todos", json={"name": "cached"})
+    client.post("/api/tags", json={"name": "work"})
+
+    first, statements = _statements(client, "/api/tags", "/api/me")
+    assert statements
+    second, statements = _statements(client, "/api/tags", "/api/me")
+    assert all("user_versions" in s for s in statements)
+    assert second == first
+    assert second[1]["tags"] == [{"id": 1, "name": "work"}]
+
+
+def test_writes_invalidate_only_affected_entries(auth_client):
+    """
+    todo の書き込みは /api/me だけ、タグの書き込みは両方を無効にし、
+    タグ付けはどちらの本文も無効にしないこと
+    """
+    client = auth_client()
+    client.post("/api/todos", json={"name": "first"})
+    client.post("/api/tags", json={"name": "work"})
+    _statements(client, "/api/tags", "/api/me")
+
+    client.post("/api/todos", json={"name": "second"})
+    # /api/tags は ETag のバージョン番号だけを読み直す
+    _, statements = _statements(client, "/api/tags")
+    assert len(statements) == 1
+    assert "user_versions" in statements[0]
+    (me,), _ = _statements(client, "/api/me")
+    assert [todo["name"] for todo in me["todos"]] == ["first", "second"]
+
+    client.post("/api/todos/1/tag/1")
+    _, statements = _statements(client, "/api/tags", "/api/me")
+    assert all("user_versions" in s for s in statements)
+
+    client.post("/api/tags", json={"name": "home"})
+    (tags, me), _ = _statements(client, "/api/tags", "/api/me")
+    assert [tag["name"] for tag in tags] == ["work", "home"]
+    assert me["tags"] == tags
+
+
+def test_stores_evict_and_share_generations(resp_server):
+    """
+    プロセス内の LRU は上限を超えると古いものから消え、
+    Redis のストアでは別のプロセスの無効化が見えること
+    """
+    local = InMemoryCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        local.set(key, key.encode(), 60)
+    assert local.get("a") is None
+    assert local.get("c") == b"c"
+
+    first = RedisCache(resp_server.url)
+    second = RedisCache(resp_server.url)
+    first.set("tags:1:0", '["タグ"]'.encode(), 60)
+    assert second.get("tags:1:0") == '["タグ"]'.encode()
+    first.bump("tags:1")
+    assert second.generation("tags:1") == 1
+
+
+def test_memory_cache_is_not_used_when_it_cannot_be_invalidated(
+    tmp_path, monkeypatch, resp_server
+):
+    """
+    レプリカから読んだ内容は保存せず、memory:// は Web のワーカーが複数あるときと
+    別プロセスのジョブワーカーでは使わないこと
+    """
+    monkeypatch.setenv("DATABASE_READ_URL", f"sqlite:///{tmp_path / 'replica.db'}")
+    app = create_app(f"sqlite:///{tmp_path / 'primary.db'}")
+    app.config["JWT_COOKIE_CSRF_PROTECT"] = False
+    with app.app_context():
+        db.metadata.create_all(app.extensions["db_replica"])
+    client = app.test_client()
+    client.post("/api/register", json={"username": "replica", "password": "pw"})
+    client.post("/api/login", json={"username": "replica", "password": "pw"})
+    client.post("/api/tags", json={"name": "work"})
+    # レプリカにはまだ複製されていないので見えないが、キャッシュには残さない
+    assert client.get("/api/tags").get_json() == []
+    assert len(cache.store._entries) == 0
+    with pytest.raises(RuntimeError, match="CACHE_URL"):
+        Worker(app).check_stores()
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    monkeypatch.setenv("CHANGE_FEED_URL", resp_server.url)
+    app = create_app("sqlite://")
+    assert cache.enabled is False
+    Worker(app).check_stores()
@@ -0,0 +1,94 @@
+from sqlalchemy import event
+from db import db
+
+
+def _seed(client):
+    client.post("/api/tags", json={"name": "work"})
+    for name, deadline in [
+        ("before", "2025-02-28T23:59:59"),
+        ("first", "2025-03-01T00:00:00"),
+        ("second", "2025-03-01T18:30:00"),
+        ("middle", "2025-03-15T09:00:00"),
+        ("after", "2025-04-01T00:00:00"),
+    ]:
+        client.post("/api/todos", json={"name": name, "deadline": deadline})
+    client.post("/api/todos", json={"name": "no deadline"})
+    client.post("/api/todos/3/tag/1")
+    client.patch("/api/todos/4", json={"is_done": True})
+
+
+def test_month_is_bucketed_by_day(auth_client):
+    """
+    [from, to) の todo だけが日ごとにまとまり、タグと完了で絞れること
+    """
+    client = auth_client()
+    _seed(client)
+
+    res = client.get("/api/calendar?from=2025-03-01&to=2025-04-01")
+    assert res.status_code == 200
+    body = res.get_json()
+    assert (body["from"], body["to"], body["total"]) == ("2025-03-01", "2025-04-01", 3)
+    assert [(d["date"], d["total"], d["done"]) for d in body["days"]] == [
+        ("2025-03-01", 2, 0),
+        ("2025-03-15", 1, 1),
+    ]
+    assert body["days"][0]["todos"] == [
+        {"id": 2, "name": "first", "deadline": "2025-03-01T00:00:00", "is_done": False},
+        {
+            "id": 3,
+            "name": "second",
+            "deadline": "2025-03-01T18:30:00",
+            "is_done": False,
+        },
+    ]
+
+    res = client.get("/api/calendar?from=2025-03-01&to=2025-04-01&tag_id=1")
+    assert [t["name"] for d in res.get_json()["days"] for t in d["todos"]] == ["second"]
+    res = client.get("/api/calendar?from=2025-03-01&to=2025-04-01&is_done=true")
+    assert [t["name"] for d in res.get_json()["days"] for t in d["todos"]] == ["middle"]
+
+    # 逆順や長すぎる範囲は受け付けない
+    assert client.get("/api/calendar?from=2025-04-01&to=2025-03-01").status_code == 422
+    assert client.get("/api/calendar?from=2025-01-01&to=2026-06-01").status_code == 422
+
+    query = """
+    { calendar(from: "2025-03-01", to: "2025-04-01", is_done: false) {
+        total days { date todos { name } } } }
+    """
+    data = client.post("/graphql", json={"query": query}).get_json()["data"]
+    assert data["calendar"] == {
+        "total": 2,
+        "days": [
+            {"date": "2025-03-01", "todos": [{"name": "first"}, {"name": "second"}]}
+        ],
+    }
+
+
+def test_month_view_is_one_range_scan(auth_client):
+    """
+    月の表示は (user_id, deadline) のインデックスの範囲を1回読むだけであること
+    """
+    client = auth_client()
+    _seed(client)
+
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, *args):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        client.get("/api/calendar?from=2025-03-01&to=2025-04-01")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _before_cursor_execute)
+    # ETag のバージョン番号とトークンのユーザー以外は todos の1回だけ
+    statements = [s for s in statements if "FROM todos" in s[0]]
+    assert len(statements) == 1
+    statement, parameters = statements[0]
+    with db.engine.connect() as conn:
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        details = [row[-1] for row in plan]
+    assert details == [
+        "SEARCH todos USING INDEX ix_todos_user_id_deadline_id "
+        "(user_id=? AND deadline>? AND deadline<?)"
+    ]
@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+import pytest
+from changes import RedisChangeStore, emit, feed
+from db import db
+from models import UserModel
+
+
+@pytest.fixture
+def short_feed():
+    # テストでは待ち時間を短くして、すぐにストリームを閉じる
+    feed.keepalive = 0.05
+    feed.max_duration = 0.2
+    return feed
+
+
+def _events(res):
+    events = []
+    for block in res.get_data(as_text=True).split("\n\n"):
+        fields = dict(
+            line.split(": ", 1) for line in block.splitlines() if ": " in line
+        )
+        if "data" in fields:
+            events.append((fields.get("id"), json.loads(fields["data"])))
+    return events
+
+
+def test_change_feed_replays_from_last_event_id(auth_client, short_feed):
+    """
+    書き込みのたびにイベントが積まれ、Last-Event-ID の続きから受け取れること
+    """
+    client = auth_client()
+    res = client.get("/api/changes")
+    assert res.mimetype == "text/event-stream"
+    ((ready_id, ready),) = _events(res)
+    assert ready == {"type": "ready"}
+
+    client.post("/api/tags", json={"name": "feed-tag"})
+    client.post("/api/todos", json={"name": "feed todo"})
+    client.post("/api/todos/1/tag/1")
+    client.patch("/api/todos/1", json={"is_done": True})
+    client.post("/api/todos/bulk", json={"create": [{"name": "bulk"}]})
+    # 失敗した書き込みはイベントにならない
+    client.post("/api/todos/99/tag/1")
+
+    events = _events(client.get("/api/changes", headers={"Last-Event-ID": ready_id}))
+    assert [e["type"] for _, e in events] == [
+        "tag.created",
+        "todo.created",
+        "tag.linked",
+        "todo.updated",
+        "todos.bulk",
+    ]
+    assert events[0][1]["data"] == {"id": 1, "name": "feed-tag"}
+    assert events[3][1]["data"]["is_done"] is True
+    assert events[4][1]["data"]["create"] == [2]
+
+    # 途中まで受け取ったところから再開する
+    resumed = _events(
+        client.get("/api/changes", headers={"Last-Event-ID": events[2][0]})
+    )
+    assert resumed == events[3:]
+
+
+def test_change_feed_is_per_user(client, auth_client, short_feed):
+    client_a = auth_client(username="feed_a", password="pw")
+    client_a.post("/api/todos", json={"name": "A のタスク"})
+    client.delete_cookie("access_token_cookie")
+
+    client_b = auth_client(username="feed_b", password="pw")
+    assert _events(client_b.get("/api/changes?last_event_id=0")) == []
+
+
+def test_change_feed_reset_after_truncation(app, auth_client, short_feed):
+    """
+    再開位置がログから押し出されていたら reset を送ること
+    """
+    feed.store.replay_size = 2
+    client = auth_client()
+    for i in range(3):
+        client.post("/api/todos", json={"name": f"todo {i}"})
+
+    events = _events(client.get("/api/changes", headers={"Last-Event-ID": "0"}))
+    assert [e["type"] for _, e in events] == ["reset"]
+
+
+def test_change_feed_closes_after_delivering(app, auth_client, short_feed):
+    """
+    long-poll の時間が長くても、届いたイベントを返したらすぐに応答を閉じること
+    """
+    client = auth_client()
+    ((ready_id, _),) = _events(client.get("/api/changes"))
+    client.post("/api/todos", json={"name": "long poll"})
+
+    feed.keepalive = feed.max_duration = 30.0
+    started = time.monotonic()
+    res = client.get("/api/changes", headers={"Last-Event-ID": ready_id})
+    assert [e["type"] for _, e in _events(res)] == ["todo.created"]
+    assert time.monotonic() - started < 5
+    assert app.config["CHANGE_FEED_MAX_DURATION"] == 25.0
+
+
+def test_rolled_back_changes_are_discarded(app, short_feed):
+    db.session.add(UserModel(username="rollback", password="x"))
+    db.session.flush()
+    emit(1, "todo.created", {"id": 1})
+    db.session.rollback()
+    db.session.commit()
+    assert feed.store.read(1, "0") == []
+
+
+def test_redis_change_store(resp_server):
+    store = RedisChangeStore(resp_server.url, replay_size=3, block=1.0)
+    assert store.latest(1) == "0"
+    first = store.append(1, {"type": "todo.created", "data": {"id": 1}})
+    store.append(2, {"type": "todo.created", "data": {"id": 2}})
+    assert store.latest(1) == first
+    assert store.read(1, "0") == [(first, {"type": "todo.created", "data": {"id": 1}})]
+    assert store.read(1, first) == []
+
+    # 別プロセスからの書き込みを XREAD BLOCK で待つ
+    publisher = RedisChangeStore(resp_server.url)
+    timer = threading.Timer(
+        0.1, publisher.append, (1, {"type": "tag.created", "data": {"id": 5}})
+    )
+    timer.start()
+    ((_, change),) = store.read(1, first, block=1.0)
+    assert change["type"] == "tag.created"
+    timer.join()
+
+    for i in range(3):
+        store.append(1, {"type": "todo.updated", "data": {"id": i}})
+    assert store.truncated(1, first)
+    assert not store.truncated(1, store.latest(1))
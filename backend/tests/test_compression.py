@@ -0,0 +1,75 @@
+import gzip
+import json
+
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+def test_large_json_is_gzipped_with_weak_etag(auth_client):
+    """
+    閾値を超える JSON は Accept-Encoding に応じて圧縮され、弱い ETag で 304 になること
+    """
+    client = auth_client()
+    client.post("/api/todos", json={"name": "small"})
+
+    # 小さい応答と Accept-Encoding の無いリクエストは圧縮しない
+    res = client.get("/api/todos", headers=GZIP)
+    assert "Content-Encoding" not in res.headers
+    assert "Accept-Encoding" in res.headers["Vary"]
+
+    for i in range(30):
+        client.post("/api/todos", json={"name": f"compressed todo {i}"})
+    plain = client.get("/api/todos")
+    assert "Content-Encoding" not in plain.headers
+
+    res = client.get("/api/todos", headers=GZIP)
+    assert res.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(res.data) == plain.data
+    assert len(res.data) < len(plain.data)
+    etag = res.headers["ETag"]
+    assert etag == f"W/{plain.headers['ETag']}"
+
+    res = client.get("/api/todos", headers={**GZIP, "If-None-Match": etag})
+    assert res.status_code == 304
+
+
+def test_streamed_export_is_compressed(app, auth_client):
+    """
+    ストリーミングの応答も圧縮して流せること
+    """
+    app.config["COMPRESSION_STREAM_FLUSH_SIZE"] = 100
+    client = auth_client()
+    for i in range(5):
+        client.post("/api/todos", json={"name": f"export {i}"})
+
+    res = client.get("/api/export", headers=GZIP)
+    assert res.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in res.headers
+    records = [json.loads(line) for line in gzip.decompress(res.data).splitlines()]
+    assert records[-1] == {"type": "end", "done": 5, "total": 5}
+
+
+def test_openapi_json_is_cached_with_etag(app, client):
+    """
+    OpenAPI の JSON は1回だけ作られ、キャッシュのヘッダーと ETag が付くこと
+    """
+    res = client.get("/openapi.json")
+    assert res.status_code == 200
+    assert res.get_json()["info"]["title"] == "TodoApp REST API"
+    assert res.headers["Cache-Control"] == "public, max-age=86400"
+    etag = res.headers["ETag"]
+
+    res = client.get("/openapi.json", headers=GZIP)
+    assert res.headers["Content-Encoding"] == "gzip"
+    assert res.headers["ETag"] == f"W/{etag}"
+    assert json.loads(gzip.decompress(res.data))["info"]["title"] == "TodoApp REST API"
+
+    for if_none_match in (etag, f"W/{etag}"):
+        res = client.get("/openapi.json", headers={"If-None-Match": if_none_match})
+        assert res.status_code == 304
+        assert res.data == b""
+
+    # GraphiQL の HTML も同じ扱い
+    res = client.get(
+        "/graphql", headers={"If-None-Match": client.get("/graphql").headers["ETag"]}
+    )
+    assert res.status_code == 304
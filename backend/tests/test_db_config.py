@@ -0,0 +1,40 @@
+from sqlalchemy import text
+from app import create_app
+from db import db
+from models import TodoModel
+
+
+def test_sqlite_pragmas(tmp_path):
+    """
+    ファイルの SQLite では WAL などの PRAGMA が接続ごとに設定されること
+    """
+    app = create_app(f"sqlite:///{tmp_path / 'pragma.db'}")
+    with app.app_context():
+        with db.engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_pre_ping"] is True
+
+
+def test_reads_go_to_replica(tmp_path, monkeypatch):
+    """
+    GET はリードレプリカ、書き込みはプライマリに振り分けられること
+    """
+    monkeypatch.setenv("DATABASE_READ_URL", f"sqlite:///{tmp_path / 'replica.db'}")
+    app = create_app(f"sqlite:///{tmp_path / 'primary.db'}")
+    app.config["JWT_COOKIE_CSRF_PROTECT"] = False
+    with app.app_context():
+        db.metadata.create_all(app.extensions["db_replica"])
+
+    client = app.test_client()
+    client.post("/api/register", json={"username": "replica", "password": "pw"})
+    client.post("/api/login", json={"username": "replica", "password": "pw"})
+    res = client.post("/api/todos", json={"name": "primary only"})
+    assert res.status_code == 201
+
+    # レプリカにはまだ複製されていないので見えない
+    assert client.get("/api/todos").get_json() == []
+
+    with app.app_context():
+        assert db.session.query(TodoModel).count() == 1
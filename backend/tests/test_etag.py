@@ -0,0 +1,64 @@
+from sqlalchemy import event
+from db import db
+
+
+def test_conditional_get_returns_304_until_write(auth_client):
+    """
+    変更が無ければ 304、書き込みがあれば新しい ETag で 200 が返ること
+    """
+    client = auth_client()
+    client.post("/api/todos", json={"name": "etag"})
+
+    res = client.get("/api/todos")
+    etag = res.headers["ETag"]
+    assert res.status_code == 200
+
+    res = client.get("/api/todos", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+
+    client.patch("/api/todos/1", json={"is_done": True})
+    res = client.get("/api/todos", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+    assert res.get_json()[0]["is_done"] is True
+
+
+def test_tag_write_changes_etag(auth_client):
+    client = auth_client()
+    client.post("/api/todos", json={"name": "etag"})
+    etag = client.get("/api/todos/1").headers["ETag"]
+    tags_etag = client.get("/api/tags").headers["ETag"]
+
+    client.post("/api/tags", json={"name": "new-tag"})
+    client.post("/api/todos/1/tag/1")
+
+    res = client.get("/api/todos/1", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.get_json()["tags"][0]["name"] == "new-tag"
+    res = client.get("/api/tags", headers={"If-None-Match": tags_etag})
+    assert res.status_code == 200
+
+
+def test_not_modified_skips_orm_queries(auth_client):
+    """
+    304 の場合はバージョン番号の読み取り以外のクエリを発行しないこと
+    """
+    client = auth_client()
+    client.post("/api/todos", json={"name": "etag"})
+    etag = client.get("/api/todos").headers["ETag"]
+
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        res = client.get("/api/todos", headers={"If-None-Match": etag})
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _before_cursor_execute)
+    assert res.status_code == 304
+    # トークンのユーザーの確認は除く
+    statements = [s for s in statements if "FROM users" not in s]
+    assert len(statements) == 1
+    assert "user_versions" in statements[0]
@@ -0,0 +1,62 @@
+import pytest
+from gql.cache import DocumentCache, document_cache, query_hash
+
+HELLO_QUERY = "{ hello }"
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    document_cache.clear()
+    yield
+    document_cache.clear()
+
+
+def test_same_query_is_parsed_once(client):
+    """
+    同じクエリは2回目以降キャッシュから使われること
+    """
+    for _ in range(3):
+        res = client.post("/graphql", json={"query": HELLO_QUERY})
+        assert res.status_code == 200
+        assert res.get_json()["data"]["hello"]
+
+    stats = document_cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+
+
+def test_persisted_query_flow(client):
+    """
+    persisted query: 未知のハッシュ -> 本文付きで再送 -> ハッシュだけで実行できる
+    """
+    extensions = {
+        "persistedQuery": {"version": 1, "sha256Hash": query_hash(HELLO_QUERY)}
+    }
+
+    res = client.post("/graphql", json={"extensions": extensions})
+    assert res.get_json()["errors"][0]["message"] == "PersistedQueryNotFound"
+
+    res = client.post("/graphql", json={"query": HELLO_QUERY, "extensions": extensions})
+    assert res.get_json()["data"]["hello"]
+
+    res = client.post("/graphql", json={"extensions": extensions})
+    assert res.status_code == 200
+    assert res.get_json()["data"]["hello"]
+
+
+def test_persisted_query_hash_mismatch(client):
+    extensions = {"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}}
+    res = client.post("/graphql", json={"query": HELLO_QUERY, "extensions": extensions})
+    assert res.status_code == 400
+
+
+def test_lru_eviction():
+    cache = DocumentCache(max_size=2)
+    cache.get_or_parse("{ a }")
+    cache.get_or_parse("{ b }")
+    cache.get_or_parse("{ a }")
+    cache.get_or_parse("{ c }")
+
+    assert cache.get(query_hash("{ a }")) is not None
+    assert cache.get(query_hash("{ b }")) is None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,83 @@
+from graphql import parse
+from gql.cost import analyze
+from gql.index import schema
+
+TODOS_QUERY = "{ todos { id name tags { name } user { username } } }"
+
+
+def test_analyze_depth_and_cost():
+    """
+    リストの件数の見積もりとフィールドの重みからコストが計算されること
+    """
+    # tags: 5 × 1、user: 1、todos: 100 × (1 + 5 + 1)
+    assert analyze(schema, parse(TODOS_QUERY)) == (2, 700)
+
+    # 件数は引数 (変数も可) から見積もる。フラグメントも辿る
+    document = parse(
+        """
+        query Search($limit: Int) { searchTodos(query: "a", limit: $limit) { ...T } }
+        fragment T on Todo { id tags { id } }
+        """
+    )
+    assert analyze(schema, document, variables={"limit": 20}) == (2, 20 * (3 + 5))
+    # 引数の省略時はスキーマのデフォルト (limit = 50)
+    assert analyze(schema, document) == (2, 50 * 8)
+
+    mutation = parse(
+        'mutation { createTodos(todos: [{name: "a"}, {name: "b"}]) { id status } }'
+    )
+    assert analyze(schema, mutation) == (1, 2)
+
+    # イントロスペクションは数えない
+    assert analyze(schema, parse("{ __schema { types { name } } hello }")) == (0, 0)
+
+
+def _create_todos(client, count):
+    res = client.post(
+        "/api/todos/bulk",
+        json={"create": [{"name": f"todo {i}"} for i in range(count)]},
+    )
+    assert res.status_code == 200
+
+
+def test_cost_reported_in_extensions(auth_client):
+    """
+    todos は全件を返すので、ユーザーの todo の実際の件数でコストを計算すること
+    """
+    client = auth_client()
+    _create_todos(client, 3)
+    res = client.post("/graphql", json={"query": TODOS_QUERY})
+    assert res.status_code == 200
+    assert len(res.get_json()["data"]["todos"]) == 3
+    cost = res.get_json()["extensions"]["cost"]
+    # todos: 3 × (1 + 5 + 1)
+    assert (cost["depth"], cost["cost"]) == (2, 21)
+    assert cost["maxCost"] == 10000
+
+
+def test_queries_over_the_limits_are_rejected(app, auth_client):
+    """
+    上限を超えるクエリはリゾルバを実行せずに拒否されること
+    """
+    client = auth_client()
+    _create_todos(client, 80)
+    app.config["GRAPHQL_MAX_COST"] = 500
+    res = client.post("/graphql", json={"query": TODOS_QUERY})
+    assert res.status_code == 400
+    body = res.get_json()
+    assert "data" not in body
+    assert body["errors"][0]["extensions"]["code"] == "QUERY_TOO_COMPLEX"
+    assert body["extensions"]["cost"]["cost"] == 80 * 7
+
+    # 変数で件数を増やした場合も検証の段階で止まる
+    query = 'query($n: Int) { searchTodos(query: "x", limit: $n) { id } }'
+    res = client.post("/graphql", json={"query": query, "variables": {"n": 100}})
+    assert res.status_code == 200
+    res = client.post("/graphql", json={"query": query, "variables": {"n": 1000}})
+    assert res.status_code == 400
+
+    app.config["GRAPHQL_MAX_COST"] = 10000
+    app.config["GRAPHQL_MAX_DEPTH"] = 1
+    res = client.post("/graphql", json={"query": "{ todos { tags { name } } }"})
+    codes = [e["extensions"]["code"] for e in res.get_json()["errors"]]
+    assert codes == ["QUERY_TOO_DEEP"]
@@ -0,0 +1,56 @@
+from datetime import datetime
+from sqlalchemy import event
+from db import db
+from models import TagModel, TodoModel
+
+TODOS_QUERY = "{ todos { id name tags { name } user { username } } }"
+
+
+def _seed(user_id, count, prefix="tag"):
+    tags = [TagModel(name=f"{prefix}-{i}", user_id=user_id) for i in range(3)]
+    db.session.add_all(tags)
+    for i in range(count):
+        todo = TodoModel(name=f"todo-{i}", user_id=user_id, created_at=datetime.now())
+        todo.tags = tags[: i % 3 + 1]
+        db.session.add(todo)
+    db.session.commit()
+    # ORM のキャッシュを消して、実際にクエリが走る状態にする
+    db.session.expunge_all()
+
+
+def _count_queries(client):
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        res = client.post("/graphql", json={"query": TODOS_QUERY})
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _before_cursor_execute)
+    assert res.status_code == 200
+    return res.get_json()["data"]["todos"], len(statements)
+
+
+def test_query_count_is_constant(auth_client):
+    """
+    N+1 回帰テスト: Todo の件数が増えてもクエリ数が変わらないこと
+    """
+    client = auth_client()
+    _seed(user_id=1, count=3)
+    todos, few = _count_queries(client)
+    assert len(todos) == 3
+
+    _seed(user_id=1, count=30, prefix="more")
+    todos, many = _count_queries(client)
+    assert len(todos) == 33
+    assert many == few
+
+
+def test_loaders_return_correct_relations(auth_client):
+    client = auth_client()
+    _seed(user_id=1, count=3)
+    todos, _ = _count_queries(client)
+    assert [len(t["tags"]) for t in todos] == [1, 2, 3]
+    assert all(t["user"]["username"] == "testuser" for t in todos)
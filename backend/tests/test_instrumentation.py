@@ -0,0 +1,78 @@
+import logging
+import pytest
+from app import create_app
+from db import db
+from instrumentation import redact
+
+
+@pytest.fixture
+def instrumented_client(monkeypatch, tmp_path):
+    monkeypatch.setenv("INSTRUMENTATION_ENABLED", "1")
+    monkeypatch.setenv("SLOW_QUERY_MS", "0")
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    app = create_app("sqlite:///:memory:")
+    app.config.update({"TESTING": True, "JWT_COOKIE_CSRF_PROTECT": False})
+    with app.app_context():
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def test_server_timing_and_metrics(instrumented_client):
+    """
+    SQL の件数・時間とシリアライズの時間が Server-Timing に載り、/metrics に集計されること
+    """
+    client = instrumented_client
+    client.post("/api/register", json={"username": "metrics", "password": "pw"})
+    client.post("/api/login", json={"username": "metrics", "password": "pw"})
+    client.post("/api/todos", json={"name": "計測"})
+
+    res = client.get("/api/todos")
+    timing = res.headers["Server-Timing"]
+    assert "db;dur=" in timing and 'queries"' in timing
+    assert "serialize;dur=" in timing
+    assert "total;dur=" in timing
+
+    res = client.post("/graphql", json={"query": "{ todos { id } }"})
+    assert "graphql;dur=" in res.headers["Server-Timing"]
+
+    body = client.get("/metrics").get_data(as_text=True)
+    assert (
+        'http_request_duration_seconds_count{endpoint="/api/todos",method="GET"} 1'
+        in body
+    )
+    assert (
+        'http_requests_total{endpoint="/api/todos",method="POST",status="201"} 1'
+        in body
+    )
+    assert 'http_request_db_queries_bucket{endpoint="/api/todos",method="GET"' in body
+    assert "# TYPE graphql_document_cache_misses_total counter" in body
+    assert "# TYPE graphql_document_cache_size gauge" in body
+
+
+def test_slow_query_log_redacts_parameters(instrumented_client, caplog):
+    client = instrumented_client
+    with caplog.at_level(logging.WARNING, logger="instrumentation"):
+        client.post("/api/register", json={"username": "secret-name", "password": "pw"})
+    messages = [r.getMessage() for r in caplog.records]
+    assert any("slow query" in m and "users" in m for m in messages)
+    assert not any("secret-name" in m for m in messages)
+
+
+def test_sampled_profile(instrumented_client, tmp_path):
+    client = instrumented_client
+    client.application.config["PROFILE_SAMPLE_RATE"] = 1.0
+    client.get("/graphql")
+    assert [p.suffix for p in tmp_path.iterdir()] == [".prof"]
+
+
+def test_disabled_by_default(client):
+    res = client.get("/graphql")
+    assert "Server-Timing" not in res.headers
+    assert client.get("/metrics").status_code == 404
+
+
+def test_redact():
+    assert redact(("alice", 3)) == ["str", "int"]
+    assert redact({"name": "alice"}) == {"name": "str"}
+    assert redact([("a",), ("b",)]) == "<2 parameter sets>"
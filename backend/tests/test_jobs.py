@@ -0,0 +1,141 @@
+import pytest
+from datetime import timedelta
+import jobs
+from jobs import Worker, enqueue
+from db import db
+from models import JobModel, TodoModel, UserModel
+
+
+def test_large_bulk_runs_in_worker(app, auth_client):
+    """
+    閾値を超える一括操作は 202 で仕事を積み、ワーカーが実行した結果を取得できること
+    """
+    app.config["BULK_ASYNC_THRESHOLD"] = 3
+    client = auth_client()
+    res = client.post(
+        "/api/todos/bulk",
+        json={"create": [{"name": f"bulk {i}", "deadline": None} for i in range(5)]},
+    )
+    assert res.status_code == 202
+    job = res.get_json()
+    assert (job["kind"], job["status"], job["result"]) == ("todos.bulk", "queued", None)
+    assert res.headers["Location"].endswith(f"/api/jobs/{job['id']}")
+    assert client.get("/api/todos").get_json() == []
+
+    assert Worker(app).run_pending() == 1
+    job = client.get(f"/api/jobs/{job['id']}").get_json()
+    assert job["status"] == "succeeded"
+    assert [item["status"] for item in job["result"]["create"]] == [201] * 5
+    assert len(client.get("/api/todos").get_json()) == 5
+    assert client.get("/api/stats").get_json()["total"] == 5
+
+    # 小さい一括操作はこれまで通りその場で実行する
+    res = client.post("/api/todos/bulk", json={"delete": [1, 2]})
+    assert res.status_code == 200
+
+
+def test_account_deletion_is_deferred(app, auth_client):
+    """
+    アカウントの削除はログアウトして 202 を返し、ワーカーがデータをまとめて消すこと
+    """
+    client = auth_client()
+    client.post("/api/tags", json={"name": "gone"})
+    client.post("/api/todos", json={"name": "検索される todo"})
+    client.post("/api/todos/1/tag/1")
+
+    res = client.delete("/api/me")
+    assert res.status_code == 202
+    assert res.get_json()["kind"] == "account.delete"
+    assert client.get("/api/me").status_code == 401
+    assert db.session.get(UserModel, 1) is not None
+
+    Worker(app).run_pending()
+    # テストではアプリのコンテキストを共有しているので、前のリクエストで読んだユーザーが
+    # g (flask-jwt-extended) に残っている。DB から読み直す
+    db.session.expire_all()
+    assert db.session.get(UserModel, 1) is None
+    assert TodoModel.query.count() == 0
+    assert JobModel.query.one().status == "succeeded"
+
+    # 同じユーザー名で登録し直せて、前のデータは見えない
+    client = auth_client()
+    assert client.get("/api/todos?name=検索").get_json() == []
+    assert client.get("/api/tags").get_json() == []
+
+
+def test_deleted_account_tokens_cannot_take_over_new_user(app, auth_client):
+    """
+    削除を受け付けた時点で他の端末のトークンも失効し、
+    削除後に登録したユーザーは別の id になって古いトークンと ETag が通らないこと
+    """
+    client = auth_client()
+    client.post("/api/todos", json={"name": "old"})
+    other = app.test_client()
+    other.post("/api/login", json={"username": "testuser", "password": "password"})
+    res = other.get("/api/todos")
+    etag = res.headers["ETag"]
+
+    assert client.delete("/api/me").status_code == 202
+    assert other.get("/api/todos").status_code == 401
+    assert other.post("/api/refresh").status_code == 401
+    Worker(app).run_pending()
+
+    client = auth_client()
+    client.post("/api/todos", json={"name": "new"})
+    assert client.get("/api/me").get_json()["id"] == 2
+    assert other.get("/api/todos").status_code == 401
+    res = client.get("/api/todos", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert [todo["name"] for todo in res.get_json()] == ["new"]
+
+
+def test_failed_jobs_retry_with_backoff(app, monkeypatch):
+    """
+    失敗した仕事はバックオフの後に再試行し、max_attempts 回で失敗になること
+    """
+    calls = []
+
+    def flaky(user_id, payload):
+        calls.append(payload)
+        if len(calls) < payload["succeed_on"]:
+            raise RuntimeError("temporary failure")
+        return {"calls": len(calls)}
+
+    monkeypatch.setitem(jobs.HANDLERS, "test.flaky", flaky)
+    job_id = enqueue("test.flaky", {"succeed_on": 2}).id
+    db.session.commit()
+    worker = Worker(app)
+
+    assert worker.run_pending() == 1
+    job = db.session.get(JobModel, job_id)
+    db.session.refresh(job)
+    assert (job.status, job.attempts) == ("queued", 1)
+    assert job.last_error == "RuntimeError: temporary failure"
+    # バックオフの間は実行しない
+    assert job.run_at > jobs._now()
+    assert worker.run_pending() == 0
+
+    job.run_at -= timedelta(hours=1)
+    db.session.commit()
+    assert worker.run_pending() == 1
+    db.session.refresh(job)
+    assert (job.status, job.result) == ("succeeded", '{"calls": 2}')
+
+    calls.clear()
+    job_id = enqueue("test.flaky", {"succeed_on": 10}, max_attempts=1).id
+    db.session.commit()
+    assert worker.run_pending() == 1
+    job = db.session.get(JobModel, job_id)
+    assert (job.status, job.attempts) == ("failed", 1)
+
+
+def test_worker_process_refuses_memory_feed(app):
+    """
+    別プロセスのワーカーの変更は memory:// のフィードでは Web の購読者に届かないので起動しないこと
+    """
+    app.config["CACHE_ENABLED"] = False
+    worker = Worker(app)
+    with pytest.raises(RuntimeError, match="CHANGE_FEED_URL"):
+        worker.run()
+    # run_pending() だけを同じプロセスで呼ぶとき (テストなど) は確認しない
+    assert worker.run_pending() == 0
@@ -0,0 +1,105 @@
+from sqlalchemy import create_engine, inspect, text
+from db import db
+import migrations
+import search  # noqa: F401  (todo_search の DDL を登録する)
+
+
+def test_upgrade_existing_database(tmp_path):
+    """
+    インデックスの無い古いスキーマに対して、重複リンクを消してインデックスを張れること
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(20) NOT NULL UNIQUE, password VARCHAR NOT NULL)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE TABLE todos (id INTEGER PRIMARY KEY, name VARCHAR(80) NOT NULL, created_at DATETIME, updated_at DATETIME, deadline DATETIME, is_done BOOLEAN NOT NULL, user_id INTEGER NOT NULL)"
+            )
+        )
+        conn.execute(text("CREATE INDEX ix_todos_user_id ON todos (user_id)"))
+        conn.execute(
+            text(
+                "CREATE TABLE tags (id INTEGER PRIMARY KEY, name VARCHAR(80) NOT NULL UNIQUE, user_id INTEGER NOT NULL)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE TABLE todo_tags (id INTEGER PRIMARY KEY, tag_id INTEGER NOT NULL, todo_id INTEGER NOT NULL)"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO todo_tags (tag_id, todo_id) VALUES (1, 1), (1, 1), (2, 1)"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO todos (id, name, is_done, user_id) "
+                "VALUES (1, '東京タワーに行く', 0, 7)"
+            )
+        )
+
+    applied = migrations.upgrade(engine)
+    assert [m.version for m in applied][:2] == [1, 2]
+
+    inspector = inspect(engine)
+    todo_indexes = {i["name"] for i in inspector.get_indexes("todos")}
+    assert "ix_todos_user_id_created_at_id" in todo_indexes
+    assert "ix_todos_user_id" not in todo_indexes
+    assert "ix_tags_user_id" in {i["name"] for i in inspector.get_indexes("tags")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM todo_tags")).scalar() == 2
+
+    # ユーザーの id は再利用しない
+    with engine.connect() as conn:
+        users_sql = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE name = 'users'")
+        ).scalar()
+    assert "AUTOINCREMENT" in users_sql
+    assert "tokens_valid_after" in {c["name"] for c in inspector.get_columns("users")}
+    assert inspector.get_foreign_keys("user_versions") == []
+
+    # 集計の行は UPSERT できるように一意
+    (counter_index,) = inspector.get_indexes("todo_counters")
+    assert counter_index["unique"]
+
+    # 既存の todo も検索できる (user_id 付き)
+    with engine.connect() as conn:
+        assert conn.execute(
+            text(
+                "SELECT rowid, user_id FROM todo_search WHERE todo_search MATCH 'タワ'"
+            )
+        ).all() == [(1, 7)]
+
+    # 2回目は何も適用しない
+    assert migrations.upgrade(engine) == []
+
+
+def _schema(engine):
+    inspector = inspect(engine)
+    return {
+        table: (
+            {c["name"] for c in inspector.get_columns(table)},
+            {(i["name"], i["unique"]) for i in inspector.get_indexes(table)},
+        )
+        for table in inspector.get_table_names()
+        if table != "schema_migrations" and not table.startswith("todo_search")
+    }
+
+
+def test_fresh_database_matches_models(tmp_path):
+    """
+    空のデータベースにマイグレーションを順に当てると、今のモデルと同じスキーマになること
+    """
+    migrated = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    migrations.upgrade(migrated)
+    created = create_engine(f"sqlite:///{tmp_path / 'created.db'}")
+    db.metadata.create_all(created)
+
+    assert _schema(migrated) == _schema(created)
+    with migrated.connect() as conn:
+        assert "todo_search" in inspect(conn).get_table_names()
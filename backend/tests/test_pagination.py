@@ -0,0 +1,87 @@
+import json
+from datetime import datetime
+from db import db
+from models import TodoModel
+
+
+def _seed_todos(user_id, count):
+    # created_at を全件同じにして、id による順序付けも確認できるようにする
+    created_at = datetime(2025, 1, 1, 12, 0, 0)
+    for i in range(count):
+        db.session.add(
+            TodoModel(
+                name=f"todo-{i}",
+                user_id=user_id,
+                created_at=created_at,
+                is_done=i % 2 == 0,
+                deadline=datetime(2025, 2, 1 + i),
+            )
+        )
+    db.session.commit()
+
+
+def test_cursor_pagination_walks_all_pages(auth_client):
+    """
+    カーソルを辿ると、重複も欠けもなく全件を新しい順に取得できること
+    """
+    client = auth_client()
+    _seed_todos(user_id=1, count=5)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        res = client.get("/api/todos", query_string=params)
+        assert res.status_code == 200
+        assert len(res.get_json()) <= 2
+        seen.extend(todo["id"] for todo in res.get_json())
+        cursor = json.loads(res.headers["X-Pagination"])["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [5, 4, 3, 2, 1]
+
+
+def test_list_without_limit_returns_everything(auth_client):
+    """
+    limit を指定しない場合は従来通り全件が返ること
+    """
+    client = auth_client()
+    _seed_todos(user_id=1, count=3)
+
+    res = client.get("/api/todos")
+    assert len(res.get_json()) == 3
+    assert "X-Pagination" not in res.headers
+
+
+def test_filters(auth_client):
+    """
+    is_done・期限の範囲・タグIDで絞り込めること
+    """
+    client = auth_client()
+    _seed_todos(user_id=1, count=4)
+    client.post("/api/tags", json={"name": "work"})
+    client.post("/api/todos/2/tag/1")
+
+    res = client.get("/api/todos", query_string={"is_done": "true"})
+    assert [t["id"] for t in res.get_json()] == [3, 1]
+
+    res = client.get(
+        "/api/todos",
+        query_string={
+            "deadline_from": "2025-02-02T00:00:00",
+            "deadline_to": "2025-02-04T00:00:00",
+        },
+    )
+    assert [t["id"] for t in res.get_json()] == [3, 2]
+
+    res = client.get("/api/todos", query_string={"tag_id": 1})
+    assert [t["id"] for t in res.get_json()] == [2]
+
+
+def test_invalid_cursor(auth_client):
+    client = auth_client()
+    res = client.get("/api/todos", query_string={"limit": 2, "cursor": "broken"})
+    assert res.status_code == 400
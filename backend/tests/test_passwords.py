@@ -0,0 +1,67 @@
+from models import UserModel
+
+
+def test_login_upgrades_hash_when_cost_changes(app, client):
+    """
+    ハッシュのコストを上げると、次回ログイン成功時に保存済みハッシュが更新されること
+    """
+    app.config["PASSWORD_HASH_ROUNDS"] = 1000
+    client.post("/api/register", json={"username": "rehash", "password": "pw"})
+    old_hash = UserModel.query.filter_by(username="rehash").first().password
+    assert "$1000$" in old_hash
+
+    app.config["PASSWORD_HASH_ROUNDS"] = 2000
+    res = client.post("/api/login", json={"username": "rehash", "password": "pw"})
+    assert res.status_code == 204
+    new_hash = UserModel.query.filter_by(username="rehash").first().password
+    assert "$2000$" in new_hash
+
+    # 新しいハッシュでもログインできる
+    res = client.post("/api/login", json={"username": "rehash", "password": "pw"})
+    assert res.status_code == 204
+
+
+def test_wrong_password_is_rejected_inline(app, client):
+    """
+    ワーカー数 0 (リクエストスレッドで計算) でも検証できること
+    """
+    app.config["PASSWORD_HASH_WORKERS"] = 0
+    client.post("/api/register", json={"username": "inline", "password": "pw"})
+    res = client.post("/api/login", json={"username": "inline", "password": "bad"})
+    assert res.status_code == 401
+    res = client.post("/api/login", json={"username": "inline", "password": "pw"})
+    assert res.status_code == 204
+
+
+def test_concurrent_first_requests_share_one_pool(app, monkeypatch):
+    """
+    最初のリクエストが同時に来てもプロセスプールは1つだけ作られること
+    """
+    import threading
+    import time
+    import passwords
+    from passwords import PasswordHasher
+
+    created = []
+
+    class SlowExecutor:
+        def __init__(self, max_workers):
+            time.sleep(0.05)
+            created.append(self)
+
+    monkeypatch.setattr(passwords, "ProcessPoolExecutor", SlowExecutor)
+    hasher = PasswordHasher()
+    app.config["PASSWORD_HASH_WORKERS"] = 2
+    results = []
+
+    def first_request():
+        with app.app_context():
+            results.append(hasher._executor())
+
+    threads = [threading.Thread(target=first_request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert all(executor is created[0] for executor in results)
@@ -0,0 +1,85 @@
+"""
+ホットなエンドポイントが発行する SQL を EXPLAIN QUERY PLAN にかけ、
+インデックスを使わないテーブルの全件走査が無いことを確認する
+"""
+
+import re
+import pytest
+from sqlalchemy import event, text
+from db import db
+
+HOT_TABLES = ("todos", "tags", "todo_tags", "users", "user_versions", "todo_counters")
+
+
+@pytest.fixture
+def seeded_client(auth_client):
+    client = auth_client()
+    client.post("/api/todos", json={"name": "計画", "deadline": "2025-01-10T00:00:00"})
+    client.post("/api/tags", json={"name": "plan"})
+    client.post("/api/todos/1/tag/1")
+    return client
+
+
+def _capture(client, method, url, **kwargs):
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, *args):
+        if (
+            statement.lstrip()
+            .upper()
+            .startswith(("SELECT", "INSERT", "UPDATE", "DELETE"))
+        ):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        res = getattr(client, method)(url, **kwargs)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _before_cursor_execute)
+    assert res.status_code < 400, res.get_data(as_text=True)
+    return statements
+
+
+def _full_scans(statement, parameters):
+    with db.engine.connect() as conn:
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        details = [row[-1] for row in plan]
+    scans = []
+    for detail in details:
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and match.group(1) in HOT_TABLES and "INDEX" not in detail:
+            scans.append(detail)
+        if "TEMP B-TREE FOR ORDER BY" in detail:
+            scans.append(detail)
+    return scans
+
+
+@pytest.mark.parametrize(
+    "method, url, kwargs",
+    [
+        ("get", "/api/todos", {}),
+        ("get", "/api/todos?limit=10", {}),
+        ("get", "/api/todos?tag_id=1&is_done=false", {}),
+        ("get", "/api/todos?name=計画", {}),
+        ("get", "/api/todos/1", {}),
+        ("get", "/api/tags", {}),
+        ("get", "/api/tags/1", {}),
+        ("get", "/api/todos/1/tag", {}),
+        ("post", "/api/todos/1/tag/1", {}),
+        ("delete", "/api/todos/1/tag/1", {}),
+        ("put", "/api/todos/1/tag", {"json": {"tag_ids": [1]}}),
+        ("get", "/api/stats", {}),
+        ("get", "/api/calendar?from=2025-01-01&to=2025-02-01", {}),
+        ("get", "/api/calendar?from=2025-01-01&to=2025-02-01&tag_id=1", {}),
+        (
+            "post",
+            "/graphql",
+            {"json": {"query": "{ todos { id tags { id } user { id } } }"}},
+        ),
+    ],
+)
+def test_hot_queries_use_indexes(seeded_client, method, url, kwargs):
+    statements = _capture(seeded_client, method, url, **kwargs)
+    assert statements
+    for statement, parameters in statements:
+        assert _full_scans(statement, parameters) == [], statement
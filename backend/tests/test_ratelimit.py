@@ -0,0 +1,117 @@
+from sqlalchemy import event
+from db import db
+from passwords import hasher
+from ratelimit import Limit, RedisRateLimitStore
+
+
+def test_gcra_burst_and_refill():
+    """
+    バーストの分だけ続けて通り、その後は間隔を空ければまた通ること
+    """
+    limit = Limit.parse("2/second:3")
+    assert (limit.interval, limit.burst) == (0.5, 3)
+
+    tat, now = None, 100.0
+    remaining = []
+    for _ in range(3):
+        decision = limit.evaluate(tat, now)
+        assert decision.allowed
+        tat = decision.tat
+        remaining.append(decision.remaining)
+    assert remaining == [2, 1, 0]
+
+    decision = limit.evaluate(tat, now)
+    assert not decision.allowed
+    assert decision.retry_after == 0.5
+    assert limit.evaluate(tat, now + 0.5).allowed
+
+
+def test_login_is_throttled_before_kdf(app, client, monkeypatch):
+    """
+    同じユーザー名へのログインは制限を超えると 429 になり、KDF を実行しないこと
+    """
+    app.config["RATELIMIT_LOGIN_USERNAME"] = "2/minute"
+    client.post("/api/register", json={"username": "victim", "password": "secret"})
+
+    calls = []
+    verify = hasher.verify_and_update
+    monkeypatch.setattr(
+        hasher,
+        "verify_and_update",
+        lambda *args: calls.append(args) or verify(*args),
+    )
+    attempt = {"username": "victim", "password": "wrong"}
+    res = client.post("/api/login", json=attempt)
+    assert res.status_code == 401
+    assert res.headers["RateLimit-Remaining"] == "1"
+    assert res.headers["RateLimit-Policy"] == "2;w=60;burst=2"
+    assert client.post("/api/login", json=attempt).status_code == 401
+
+    res = client.post("/api/login", json=attempt)
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "30"
+    assert res.headers["RateLimit-Remaining"] == "0"
+    assert len(calls) == 2
+
+    # 別のユーザー名は影響を受けない
+    other = {"username": "someone", "password": "x"}
+    assert client.post("/api/login", json=other).status_code == 401
+
+
+def test_graphql_limit_is_per_user(app, auth_client):
+    """
+    GraphQL はログインしているユーザーごとに数えること
+    """
+    app.config["RATELIMIT_GRAPHQL"] = "1/minute:2"
+    client = auth_client()
+    query = {"query": "{ hello }"}
+    assert client.post("/graphql", json=query).headers["RateLimit-Remaining"] == "1"
+    assert client.post("/graphql", json=query).status_code == 200
+    assert client.post("/graphql", json=query).status_code == 429
+
+    # 別のユーザーは別のバケツ
+    client.delete_cookie("access_token_cookie")
+    client.post("/api/register", json={"username": "second", "password": "pw"})
+    client.post("/api/login", json={"username": "second", "password": "pw"})
+    assert client.post("/graphql", json=query).status_code == 200
+
+
+def test_rejection_does_not_query_the_database(app, auth_client):
+    """
+    ログインしているユーザーの 429 も、トークンの失効やユーザーを DB で確かめずに返すこと
+    """
+    app.config["RATELIMIT_GRAPHQL"] = "1/minute:1"
+    client = auth_client()
+    query = {"query": "{ hello }"}
+    assert client.post("/graphql", json=query).status_code == 200
+
+    # 前のリクエストで読んだユーザーがセッションに残っていると SQL が出ないので捨てる
+    db.session.expunge_all()
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        assert client.post("/graphql", json=query).status_code == 429
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _before_cursor_execute)
+    assert statements == []
+
+
+def test_redis_store_is_shared_between_processes(resp_server):
+    """
+    Redis プロトコルのストアでは、別のプロセス (別のクライアント) とバケツを共有すること
+    """
+    limit = Limit.parse("1/minute:2")
+    first = RedisRateLimitStore(resp_server.url)
+    second = RedisRateLimitStore(resp_server.url)
+
+    assert first.hit("login:ip:1.2.3.4", limit, 1000.0).allowed
+    assert second.hit("login:ip:1.2.3.4", limit, 1000.0).allowed
+    decision = first.hit("login:ip:1.2.3.4", limit, 1000.0)
+    assert not decision.allowed
+    assert decision.retry_after == 60.0
+    assert second.hit("login:ip:5.6.7.8", limit, 1000.0).allowed
+    assert {"WATCH", "MULTI", "EXEC"} <= set(resp_server.commands)
@@ -21,7 +21,7 @@ def test_user_flow_happy_path(client):
 
     # 3. Todo作成 (Cookieはclientが勝手に持っている状態)
     res = client.post("/api/todos", json={"name": "世界を救う", "is_done": False})
-    assert res.status_code == 204
+    assert res.status_code == 201
 
     # 4. Todo一覧取得
     res = client.get("/api/todos")
@@ -0,0 +1,83 @@
+from search import index_tokens
+
+
+def _names(res):
+    return [t["name"] for t in res.get_json()]
+
+
+def test_japanese_substring_search(auth_client):
+    """
+    分かち書きの無い日本語でも、部分文字列・1文字で検索できること
+    """
+    client = auth_client()
+    for name in ["東京タワーに行く", "京都で買い物", "牛乳を買う"]:
+        client.post("/api/todos", json={"name": name})
+
+    assert _names(client.get("/api/todos", query_string={"name": "タワー"})) == [
+        "東京タワーに行く"
+    ]
+    assert sorted(_names(client.get("/api/todos", query_string={"name": "京"}))) == [
+        "京都で買い物",
+        "東京タワーに行く",
+    ]
+    assert sorted(_names(client.get("/api/todos", query_string={"name": "買"}))) == [
+        "京都で買い物",
+        "牛乳を買う",
+    ]
+
+
+def test_index_follows_update_and_delete(auth_client):
+    client = auth_client()
+    client.post("/api/todos", json={"name": "Write report"})
+    assert _names(client.get("/api/todos", query_string={"name": "rep"})) == [
+        "Write report"
+    ]
+
+    client.patch("/api/todos/1", json={"name": "Send invoice"})
+    assert _names(client.get("/api/todos", query_string={"name": "rep"})) == []
+    assert _names(client.get("/api/todos", query_string={"name": "INV"})) == [
+        "Send invoice"
+    ]
+
+    client.delete("/api/todos/1")
+    assert _names(client.get("/api/todos", query_string={"name": "invoice"})) == []
+
+
+def test_graphql_search_todos_is_ranked(auth_client):
+    client = auth_client()
+    for name in ["会議の資料", "会議 会議 会議", "昼ごはん"]:
+        client.post("/api/todos", json={"name": name})
+
+    res = client.post(
+        "/graphql", json={"query": '{ searchTodos(query: "会議") { name } }'}
+    )
+    names = [t["name"] for t in res.get_json()["data"]["searchTodos"]]
+    assert names == ["会議 会議 会議", "会議の資料"]
+
+
+def test_ngram_tokens():
+    assert index_tokens("東京タワー") == "東京 京タ タワ ワー ー"
+    assert index_tokens("Buy ＭＩＬＫ") == "buy milk"
+
+
+def test_search_is_limited_to_own_todos(auth_client):
+    """
+    他のユーザーの todo は検索の一致にも含めない (limit を食われない)
+    """
+    other = auth_client("other")
+    for i in range(3):
+        other.post("/api/todos", json={"name": f"会議 {i}"})
+    client = auth_client()
+    client.post("/api/todos", json={"name": "会議の資料"})
+
+    assert _names(client.get("/api/todos", query_string={"name": "会議"})) == [
+        "会議の資料"
+    ]
+    res = client.post(
+        "/graphql", json={"query": '{ searchTodos(query: "会議", limit: 1) { name } }'}
+    )
+    assert [t["name"] for t in res.get_json()["data"]["searchTodos"]] == ["会議の資料"]
+    res = client.post(
+        "/graphql", json={"query": '{ searchTodos(query: "会議", limit: 0) { name } }'}
+    )
+    assert [t["name"] for t in res.get_json()["data"]["searchTodos"]] == ["会議の資料"]
@@ -0,0 +1,32 @@
+import pytest
+
+
+@pytest.fixture
+def seeded_client(auth_client):
+    client = auth_client()
+    client.post(
+        "/api/todos", json={"name": "期限あり", "deadline": "2025-01-10T09:30:00"}
+    )
+    client.post("/api/todos", json={"name": "期限なし", "is_done": True})
+    client.post("/api/tags", json={"name": "b"})
+    client.post("/api/tags", json={"name": "a"})
+    client.post("/api/todos/1/tag/2")
+    client.post("/api/todos/1/tag/1")
+    return client
+
+
+@pytest.mark.parametrize(
+    "url", ["/api/todos", "/api/todos?limit=1", "/api/tags", "/api/me"]
+)
+def test_fast_path_matches_marshmallow(app, seeded_client, url):
+    """
+    軽量シリアライズの出力が marshmallow と同じであること
+    """
+    app.config["API_FAST_SERIALIZATION"] = True
+    fast = seeded_client.get(url)
+    app.config["API_FAST_SERIALIZATION"] = False
+    slow = seeded_client.get(url)
+
+    assert fast.status_code == slow.status_code == 200
+    assert fast.get_json() == slow.get_json()
+    assert fast.headers.get("X-Pagination") == slow.headers.get("X-Pagination")
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import runpy
+from asgi import ASGIApp
+from changes import RedisChangeStore, feed
+
+
+def _asgi_request(asgi_app, method, path, body=b"", headers=()):
+    """ASGI のアプリを1リクエスト分だけ直接呼ぶ"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "scheme": "http",
+        "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    asyncio.run(asgi_app(scope, receive, send))
+    start = messages[0]
+    return start["status"], b"".join(m.get("body", b"") for m in messages[1:])
+
+
+def test_health_and_readiness(client, monkeypatch):
+    """
+    /healthz は常に 200、/readyz は依存先に繋がらなければ 503 になること
+    """
+    assert client.get("/healthz").status_code == 200
+
+    res = client.get("/readyz")
+    assert res.status_code == 200
+    assert res.get_json() == {"status": "ready", "checks": {"database": "ok"}}
+
+    # 変更フィードの Redis に繋がらない
+    monkeypatch.setattr(feed, "store", RedisChangeStore("redis://127.0.0.1:1"))
+    res = client.get("/readyz")
+    assert res.status_code == 503
+    assert res.get_json()["checks"] == {
+        "database": "ok",
+        "change_feed": "unavailable",
+    }
+
+
+def test_gunicorn_config_from_environment(monkeypatch):
+    """
+    ワーカー・スレッド・keep-alive の数を環境変数から読むこと
+    """
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    monkeypatch.setenv("GUNICORN_THREADS", "8")
+    monkeypatch.setenv("GUNICORN_KEEPALIVE", "10")
+    monkeypatch.setenv("PORT", "8000")
+    config = runpy.run_path("gunicorn.conf.py")
+    assert config["workers"] == 3
+    assert config["threads"] == 8
+    assert config["keepalive"] == 10
+    assert config["bind"] == "0.0.0.0:8000"
+    assert config["worker_class"] == "gthread"
+    assert config["preload_app"] is True
+
+
+def test_asgi_graphql_uses_flask_auth_and_hooks(app, auth_client):
+    """
+    ASGI モードの /graphql が Cookie の JWT で認証して非同期の実行で結果を返し、
+    それ以外のパスは WSGI の Flask アプリにそのまま渡ること
+    """
+    client = auth_client()
+    client.post("/api/todos", json={"name": "asgi todo"})
+    cookie = client.get_cookie("access_token_cookie").value
+    asgi_app = ASGIApp(app)
+
+    status, body = _asgi_request(
+        asgi_app,
+        "POST",
+        "/graphql",
+        json.dumps({"query": "{ todos { name } }"}).encode(),
+        [
+            ("Content-Type", "application/json"),
+            ("Cookie", f"access_token_cookie={cookie}"),
+        ],
+    )
+    assert status == 200
+    result = json.loads(body)
+    assert result["data"] == {"todos": [{"name": "asgi todo"}]}
+    assert result["extensions"]["cost"]["depth"] == 1
+
+    status, body = _asgi_request(asgi_app, "GET", "/healthz")
+    assert (status, json.loads(body)) == (200, {"status": "ok"})
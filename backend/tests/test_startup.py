@@ -0,0 +1,44 @@
+import subprocess
+import sys
+from sqlalchemy import inspect
+from app import create_app
+from db import db
+import migrations
+
+
+def test_migrations_replace_create_all(tmp_path, monkeypatch):
+    """
+    DB_AUTO_MIGRATE=0 では起動時にテーブルを作らず、flask db-upgrade で作ること
+    """
+    monkeypatch.setenv("DB_AUTO_MIGRATE", "0")
+    app = create_app(f"sqlite:///{tmp_path / 'app.db'}")
+    with app.app_context():
+        assert inspect(db.engine).get_table_names() == []
+
+    result = app.test_cli_runner().invoke(args=["db-upgrade"])
+    assert "Applied 0001 initial schema" in result.output
+    with app.app_context():
+        tables = inspect(db.engine).get_table_names()
+        assert {"users", "todos", "tags", "schema_migrations"} <= set(tables)
+        # 適用済みなら何もしない
+        assert migrations.upgrade() == []
+
+
+def test_graphql_schema_is_built_lazily():
+    """
+    create_app() では GraphQL のスキーマと GraphiQL の HTML を作らず、最初の利用時に作ること
+    """
+    script = """
+from app import create_app
+from gql.index import get_schema
+from resources.graphql_route import explorer
+app = create_app("sqlite://")
+assert get_schema.cache_info().currsize == 0
+assert not explorer.built
+client = app.test_client()
+assert client.post("/graphql", json={"query": "{ hello }"}).status_code == 200
+assert client.get("/graphql").status_code == 200
+assert get_schema.cache_info().currsize == 1
+assert explorer.built
+"""
+    subprocess.run([sys.executable, "-c", script], check=True)
@@ -0,0 +1,191 @@
+from datetime import datetime, time, timedelta
+from sqlalchemy import delete, event
+from db import db
+from models import TodoCounterModel
+import migrations
+import stats
+
+
+def _deadline(days):
+    return datetime.combine(stats.today() + timedelta(days=days), time(12)).isoformat()
+
+
+def _expected(client):
+    """todo の一覧から数え直した集計"""
+    today = stats.today()
+    week_end = today + timedelta(days=7 - today.weekday())
+    counts = {"total": 0, "done": 0, "open": 0, "overdue": 0, "due_this_week": 0}
+    histogram = {}
+    for todo in client.get("/api/todos").get_json():
+        counts["total"] += 1
+        counts["done" if todo["is_done"] else "open"] += 1
+        if todo["deadline"] is None:
+            continue
+        day = datetime.fromisoformat(todo["deadline"]).date()
+        if not todo["is_done"]:
+            if day < today:
+                counts["overdue"] += 1
+            elif day < week_end:
+                counts["due_this_week"] += 1
+        bucket = histogram.setdefault(day.isoformat(), {"total": 0, "done": 0})
+        bucket["total"] += 1
+        bucket["done"] += todo["is_done"]
+    counts["histogram"] = [{"date": d, **b} for d, b in sorted(histogram.items())]
+    return counts
+
+
+def _summary(client):
+    result = client.get("/api/stats").get_json()
+    return {key: value for key, value in result.items() if key != "tags"}, result
+
+
+def test_counters_follow_every_write_path(auth_client):
+    """
+    作成・更新・削除・タグ付け・一括操作のあとも、数え直した結果と一致すること
+    """
+    client = auth_client()
+    client.post("/api/tags", json={"name": "work"})
+    client.post("/api/todos", json={"name": "late", "deadline": _deadline(-1)})
+    client.post("/api/todos", json={"name": "today", "deadline": _deadline(0)})
+    client.post("/api/todos", json={"name": "later", "deadline": _deadline(8)})
+    client.post("/api/todos", json={"name": "someday"})
+    summary, result = _summary(client)
+    assert summary == _expected(client)
+    assert (summary["overdue"], summary["due_this_week"]) == (1, 1)
+
+    client.post("/api/todos/1/tag/1")
+    client.post("/api/todos/2/tag/1")
+    client.patch("/api/todos/2", json={"is_done": True})
+    client.patch("/api/todos/3", json={"deadline": _deadline(-3)})
+    client.post(
+        "/api/todos/bulk",
+        json={
+            "create": [{"name": "bulk", "deadline": _deadline(0), "is_done": True}],
+            "update": [{"id": 4, "deadline": _deadline(2)}],
+            "unlink": [{"todo_id": 1, "tag_id": 1}],
+        },
+    )
+    client.delete("/api/todos/1")
+    summary, result = _summary(client)
+    assert summary == _expected(client)
+    assert result["tags"] == [
+        {
+            "tag_id": 1,
+            "name": "work",
+            "total": 1,
+            "done": 1,
+            "open": 0,
+            "overdue": 0,
+            "due_this_week": 0,
+        }
+    ]
+
+    # ヒストグラムは [from, to) とタグで絞れる
+    today = stats.today().isoformat()
+    res = client.get(f"/api/stats?from={today}&to={today}")
+    assert res.get_json()["histogram"] == []
+    res = client.get("/api/stats?tag_id=1")
+    assert res.get_json()["histogram"] == [{"date": today, "total": 1, "done": 1}]
+
+
+def test_stats_read_only_counters(auth_client):
+    """
+    集計の API は todo の表を読まず、GraphQL でも同じ結果を返すこと
+    """
+    client = auth_client()
+    for i in range(5):
+        client.post(
+            "/api/todos", json={"name": f"todo {i}", "deadline": _deadline(i - 2)}
+        )
+
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        rest = client.get("/api/stats").get_json()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _before_cursor_execute)
+    assert not any("FROM todos" in statement for statement in statements)
+
+    query = "{ todoStats { total overdue due_this_week histogram { date total } } }"
+    data = client.post("/graphql", json={"query": query}).get_json()["data"]
+    assert data["todoStats"]["total"] == rest["total"] == 5
+    assert data["todoStats"]["overdue"] == rest["overdue"] == 2
+    assert data["todoStats"]["histogram"] == [
+        {"date": bucket["date"], "total": bucket["total"]}
+        for bucket in rest["histogram"]
+    ]
+
+
+def test_migration_backfills_counters(app, auth_client):
+    """
+    0004 / 0008 のマイグレーションが既存の todo から件数を作ること
+
+    今の一意なテーブルを作って数え直すのは 0008 (数え方は 0004 と同じ)
+    """
+    client = auth_client()
+    client.post("/api/tags", json={"name": "work"})
+    for i in range(3):
+        client.post(
+            "/api/todos",
+            json={"name": f"todo {i}", "deadline": _deadline(i - 1), "is_done": i == 2},
+        )
+    client.post("/api/todos", json={"name": "no deadline"})
+    client.post("/api/todos/1/tag/1")
+    before = client.get("/api/stats").get_json()
+
+    db.session.execute(delete(TodoCounterModel))
+    db.session.commit()
+    assert client.get("/api/stats").get_json()["total"] == 0
+
+    (migration,) = migrations.load_migrations([8])
+    with db.engine.begin() as conn:
+        migration.upgrade(conn)
+    assert client.get("/api/stats").get_json() == before
+
+
+def _counter_statements(client, method, path, body=None):
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, *args):
+        if "todo_counters" in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        res = getattr(client, method)(path, json=body)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _before_cursor_execute)
+    assert res.status_code < 300
+    return statements
+
+
+def test_single_writes_upsert_counters_in_one_statement(auth_client):
+    """
+    1件の作成・更新・削除・タグ付けは、集計を読まずに UPSERT 1文で更新すること
+    """
+    client = auth_client()
+    client.post("/api/tags", json={"name": "work"})
+    client.post("/api/todos", json={"name": "other"})
+    writes = [
+        ("post", "/api/todos", {"name": "todo", "deadline": _deadline(1)}),
+        ("post", "/api/todos/2/tag/1"),
+        ("patch", "/api/todos/2", {"is_done": True}),
+        ("patch", "/api/todos/2", {"deadline": _deadline(-2)}),
+        ("delete", "/api/todos/2/tag/1"),
+        ("post", "/api/todos/2/tag/1"),
+        ("delete", "/api/todos/2"),
+    ]
+    for write in writes:
+        statements = _counter_statements(client, *write)
+        assert len(statements) == 1, write
+        assert statements[0].startswith("INSERT INTO todo_counters")
+        assert "ON CONFLICT" in statements[0]
+        summary, _ = _summary(client)
+        assert summary == _expected(client)
+
+    # 名前だけの変更では集計に触れない
+    assert _counter_statements(client, "patch", "/api/todos/1", {"name": "x"}) == []
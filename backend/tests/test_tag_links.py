@@ -0,0 +1,61 @@
+def _tag_names(client, todo_id):
+    return [t["name"] for t in client.get(f"/api/todos/{todo_id}/tag").get_json()]
+
+
+def test_link_is_idempotent_and_unlink(auth_client):
+    client = auth_client()
+    client.post("/api/todos", json={"name": "todo"})
+    client.post("/api/tags", json={"name": "a"})
+
+    assert client.post("/api/todos/1/tag/1").status_code == 204
+    assert client.post("/api/todos/1/tag/1").status_code == 204
+    assert _tag_names(client, 1) == ["a"]
+
+    assert client.delete("/api/todos/1/tag/1").status_code == 204
+    assert client.delete("/api/todos/1/tag/1").status_code == 204
+    assert _tag_names(client, 1) == []
+
+
+def test_link_errors(client, auth_client):
+    """
+    存在しない場合は 404、他人の todo やタグの場合は 403 になること
+    """
+    client_a = auth_client(username="link_a", password="pw")
+    client_a.post("/api/tags", json={"name": "a のタグ"})
+    client.delete_cookie("access_token_cookie")
+
+    client_b = auth_client(username="link_b", password="pw")
+    client_b.post("/api/todos", json={"name": "b の todo"})
+    assert client_b.post("/api/todos/1/tag/99").status_code == 404
+    assert client_b.post("/api/todos/99/tag/1").status_code == 404
+    assert client_b.post("/api/todos/1/tag/1").status_code == 403
+    assert client_b.delete("/api/todos/1/tag/1").status_code == 403
+    assert client_b.put("/api/todos/1/tag", json={"tag_ids": [1]}).status_code == 403
+
+
+def test_replace_tag_set(auth_client):
+    client = auth_client()
+    client.post("/api/todos", json={"name": "todo"})
+    for name in ["a", "b", "c"]:
+        client.post("/api/tags", json={"name": name})
+    client.post("/api/todos/1/tag/1")
+    client.post("/api/todos/1/tag/2")
+
+    res = client.put("/api/todos/1/tag", json={"tag_ids": [2, 3]})
+    assert res.status_code == 200
+    assert [t["name"] for t in res.get_json()] == ["b", "c"]
+    assert _tag_names(client, 1) == ["b", "c"]
+
+    res = client.put("/api/todos/1/tag", json={"tag_ids": []})
+    assert res.get_json() == []
+
+
+def test_delete_tag_in_use(auth_client):
+    client = auth_client()
+    client.post("/api/todos", json={"name": "todo"})
+    client.post("/api/tags", json={"name": "a"})
+    client.post("/api/todos/1/tag/1")
+
+    assert client.delete("/api/tags/1").status_code == 400
+    client.delete("/api/todos/1/tag/1")
+    assert client.delete("/api/tags/1").status_code == 204
@@ -0,0 +1,202 @@
+import json
+
+
+def _ndjson(res):
+    return [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+
+
+def _seed(client, prefix):
+    client.post("/api/tags", json={"name": f"{prefix}-a"})
+    client.post("/api/tags", json={"name": f"{prefix}-b"})
+    for i in range(3):
+        client.post(
+            "/api/todos",
+            json={"name": f"{prefix} todo {i}", "deadline": "2025-04-01T09:00:00"},
+        )
+    client.post("/api/todos/1/tag/1")
+    client.post("/api/todos/1/tag/2")
+    client.post("/api/todos/3/tag/2")
+
+
+def test_export_ndjson_and_resume(app, auth_client):
+    """
+    タグ → todo → リンクの順に流れ、途中のレコードから再開できること
+    """
+    app.config["EXPORT_PROGRESS_INTERVAL"] = 2
+    client = auth_client()
+    _seed(client, "export")
+
+    res = client.get("/api/export")
+    assert res.status_code == 200
+    assert res.mimetype == "application/x-ndjson"
+    assert res.headers["X-Export-Total"] == "8"
+    records = _ndjson(res)
+    assert records[0]["type"] == "header"
+    assert records[0]["totals"] == {"tag": 2, "todo": 3, "link": 3}
+    assert records[-1] == {"type": "end", "done": 8, "total": 8}
+    data = [r for r in records if r["type"] in ("tag", "todo", "link")]
+    assert [r["type"] for r in data] == ["tag"] * 2 + ["todo"] * 3 + ["link"] * 3
+    assert [r["done"] for r in records if r["type"] == "progress"] == [2, 4, 6, 8]
+
+    # 3件目 (最初の todo) まで受け取ったところで切れた想定
+    res = client.get(f"/api/export?after=todo:{data[2]['id']}")
+    assert res.headers["X-Export-Offset"] == "3"
+    resumed = [r for r in _ndjson(res) if r["type"] in ("tag", "todo", "link")]
+    assert resumed == data[3:]
+
+    assert client.get("/api/export?after=user:1").status_code == 400
+
+
+def test_export_csv(auth_client):
+    client = auth_client()
+    _seed(client, "csv-export")
+
+    res = client.get("/api/export?format=csv")
+    assert res.mimetype == "text/csv"
+    lines = res.get_data(as_text=True).splitlines()
+    assert (
+        lines[0] == "type,id,name,created_at,updated_at,deadline,is_done,todo_id,tag_id"
+    )
+    assert lines[1] == "tag,1,csv-export-a,,,,,,"
+    assert lines[3].startswith("todo,1,csv-export todo 0,")
+    assert lines[3].endswith(",2025-04-01T09:00:00,false,,")
+    assert lines[-1].startswith("end,")
+
+
+def test_import_roundtrip_with_resume(app, client, auth_client):
+    """
+    別のユーザーのエクスポートを取り込み、途中で切れても続きから取り込めること
+    """
+    app.config["IMPORT_BATCH_SIZE"] = 2
+    source = auth_client(username="source", password="pw")
+    _seed(source, "import")
+    # タグ名は全体で一意なので、1つ目は target の既存タグに、2つ目は source と衝突させる
+    body = source.get("/api/export").get_data().replace(b"import-a", b"own-tag")
+    client.delete_cookie("access_token_cookie")
+
+    target = auth_client(username="target", password="pw")
+    target.post("/api/tags", json={"name": "own-tag"})
+    target.post("/api/todos", json={"name": "既存のタスク"})
+    job = target.post("/api/imports").get_json()
+    assert job["status"] == "pending"
+
+    # 先頭4行 (header + タグ2件 + todo 1件) だけ届いて切れた
+    lines = body.splitlines(keepends=True)
+    res = target.put(
+        f"/api/imports/{job['id']}",
+        data=b"".join(lines[:4]),
+        content_type="application/x-ndjson",
+    )
+    assert res.status_code == 200
+    assert res.get_json()["processed"] == 3
+    assert res.get_json()["status"] == "running"
+
+    assert target.put(f"/api/imports/{job['id']}?offset=5", data=b"").status_code == 409
+
+    # 最初から送り直しても取り込み済みの分は読み飛ばされる
+    res = target.put(
+        f"/api/imports/{job['id']}?offset=0",
+        data=body,
+        content_type="application/x-ndjson",
+    )
+    job = res.get_json()
+    assert job["status"] == "done"
+    assert (job["processed"], job["tags"], job["todos"], job["links"]) == (8, 1, 3, 1)
+    assert job["skipped"] == 3
+    assert target.get(f"/api/imports/{job['id']}").get_json() == job
+
+    todos = {t["name"]: t for t in target.get("/api/todos").get_json()}
+    assert len(todos) == 4
+    assert todos["import todo 0"]["deadline"] == "2025-04-01T09:00:00"
+    assert [t["name"] for t in todos["import todo 0"]["tags"]] == ["own-tag"]
+    assert [t["name"] for t in todos["import todo 2"]["tags"]] == []
+    # 集計のカウンターもバッチをまたいだタグ付けまで反映されている
+    summary = target.get("/api/stats").get_json()
+    assert summary["total"] == 4
+    assert [(t["name"], t["total"]) for t in summary["tags"]] == [("own-tag", 1)]
+
+    res = target.put(f"/api/imports/{job['id']}", data=body)
+    assert res.status_code == 409
+
+
+def test_import_csv_and_invalid_body(auth_client):
+    client = auth_client()
+    job = client.post("/api/imports").get_json()
+    body = (
+        "type,id,name,created_at,updated_at,deadline,is_done,todo_id,tag_id\n"
+        "tag,10,csv-tag,,,,,,\n"
+        'todo,20,"comma, name",,,2025-05-01T00:00:00,true,,\n'
+        "link,30,,,,,,20,10\n"
+        "end,,,,,,,,\n"
+    )
+    res = client.put(
+        f"/api/imports/{job['id']}", data=body.encode(), content_type="text/csv"
+    )
+    assert res.get_json()["status"] == "done"
+    todos = client.get("/api/todos").get_json()
+    assert todos[0]["name"] == "comma, name"
+    assert todos[0]["is_done"] is True
+    assert [t["name"] for t in todos[0]["tags"]] == ["csv-tag"]
+    assert client.get("/api/todos?name=comma").get_json()[0]["id"] == todos[0]["id"]
+
+    job = client.post("/api/imports").get_json()
+    res = client.put(
+        f"/api/imports/{job['id']}",
+        data=b'{"type": "tag", "id": 1, "name": "ok-tag"}\nnot json\n',
+        content_type="application/x-ndjson",
+    )
+    assert res.status_code == 400
+    assert "line 2" in res.get_json()["message"]
+
+
+def test_import_parses_is_done_strictly(auth_client):
+    """
+    is_done の文字列 "false" を True にせず、読めない値の todo は飛ばすこと
+    """
+    client = auth_client()
+    job = client.post("/api/imports").get_json()
+    records = [
+        {"type": "todo", "id": 1, "name": "json-true", "is_done": True},
+        {"type": "todo", "id": 2, "name": "string-false", "is_done": "false"},
+        {"type": "todo", "id": 3, "name": "string-one", "is_done": "1"},
+        {"type": "todo", "id": 4, "name": "unknown", "is_done": "yes"},
+        {"type": "todo", "id": 5, "name": "number", "is_done": 1},
+    ]
+    res = client.put(
+        f"/api/imports/{job['id']}",
+        data="".join(json.dumps(r) + "\n" for r in records).encode(),
+        content_type="application/x-ndjson",
+    )
+    job = res.get_json()
+    assert (job["todos"], job["skipped"]) == (3, 2)
+    todos = {t["name"]: t["is_done"] for t in client.get("/api/todos").get_json()}
+    assert todos == {"json-true": True, "string-false": False, "string-one": True}
+
+
+def test_import_skips_repeated_source_ids(app, auth_client):
+    """
+    エクスポート元の id が重複していても 500 にせず、最初の1件だけを取り込むこと
+    """
+    client = auth_client()
+    records = [
+        {"type": "tag", "id": 1, "name": "first-tag"},
+        {"type": "tag", "id": 1, "name": "second-tag"},
+        {"type": "todo", "id": 1, "name": "first"},
+        {"type": "todo", "id": 1, "name": "second"},
+        {"type": "todo", "id": 2, "name": "third"},
+        {"type": "todo", "id": 2, "name": "next batch"},
+        {"type": "link", "id": 1, "todo_id": 1, "tag_id": 1},
+    ]
+    body = "".join(json.dumps(r) + "\n" for r in records).encode()
+    # 重複がバッチをまたぐ場合も飛ばす
+    app.config["IMPORT_BATCH_SIZE"] = 5
+    job = client.post("/api/imports").get_json()
+    res = client.put(
+        f"/api/imports/{job['id']}", data=body, content_type="application/x-ndjson"
+    )
+    assert res.status_code == 200
+    job = res.get_json()
+    assert (job["tags"], job["todos"], job["links"], job["skipped"]) == (1, 2, 1, 3)
+    todos = {t["name"]: t for t in client.get("/api/todos").get_json()}
+    assert sorted(todos) == ["first", "third"]
+    assert [t["name"] for t in todos["first"]["tags"]] == ["first-tag"]
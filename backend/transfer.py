@@ -0,0 +1,403 @@
+"""
+ユーザーのデータ一式 (タグ・todo・リンク) のエクスポートとインポート
+
+どちらも1行1レコードで扱い、件数に関係なくメモリ使用量が一定になるようにする。
+エクスポートはサーバーサイドカーソル (yield_per) で少しずつ読みながら書き出し、
+インポートは本文を1行ずつ読んで batch_size 件ごとにコミットする。
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from sqlalchemy import func, insert, select, tuple_
+from changes import emit
+from db import db
+from models import ImportIdMapModel, TagModel, TodoModel, TodoTags
+from search import index_todos
+from serializers import TODO_COLUMNS, dumps, plain_todo
+from stats import track
+from versions import bump_version
+
+# エクスポートはタグ → todo → リンクの順。リンクが参照する id は先に出ている
+SECTIONS = ("tag", "todo", "link")
+CSV_FIELDS = [
+    "type",
+    "id",
+    "name",
+    "created_at",
+    "updated_at",
+    "deadline",
+    "is_done",
+    "todo_id",
+    "tag_id",
+]
+DATETIME_FIELDS = ("created_at", "updated_at", "deadline")
+
+
+class TransferFormatError(ValueError):
+    """インポートの本文が読めない"""
+
+
+def parse_after(after):
+    """再開位置 "<type>:<id>" を (セクションの番号, id) にする。不正な値なら ValueError"""
+    if not after:
+        return 0, 0
+    kind, _, last_id = after.partition(":")
+    if kind not in SECTIONS:
+        raise ValueError("Invalid resume position")
+    return SECTIONS.index(kind), int(last_id)
+
+
+def _section(kind, user_id, after_id=0):
+    if kind == "tag":
+        return (
+            select(TagModel.id, TagModel.name)
+            .where(TagModel.user_id == user_id, TagModel.id > after_id)
+            .order_by(TagModel.id)
+        )
+    if kind == "todo":
+        return (
+            select(*TODO_COLUMNS)
+            .where(TodoModel.user_id == user_id, TodoModel.id > after_id)
+            .order_by(TodoModel.id)
+        )
+    return (
+        select(TodoTags.id, TodoTags.todo_id, TodoTags.tag_id)
+        .join(TodoModel, TodoModel.id == TodoTags.todo_id)
+        .where(TodoModel.user_id == user_id, TodoTags.id > after_id)
+        .order_by(TodoTags.id)
+    )
+
+
+def _count(stmt):
+    return db.session.execute(
+        select(func.count()).select_from(stmt.order_by(None).subquery())
+    ).scalar()
+
+
+def _record(kind, row):
+    if kind == "tag":
+        return {"type": "tag", "id": row.id, "name": row.name}
+    if kind == "todo":
+        return {"type": "todo", **plain_todo(row)}
+    return {"type": "link", "id": row.id, "todo_id": row.todo_id, "tag_id": row.tag_id}
+
+
+def start_export(user_id, after=None, batch_size=1000, progress_every=1000):
+    """
+    エクスポートを始める。(全体の件数, 送信済みの件数, レコードのジェネレーター) を返す
+
+    after には途切れたエクスポートで最後に受け取ったレコードの "<type>:<id>" を渡す。
+    ジェネレーターは header → データ (progress_every 件ごとに progress) → end の順に返す。
+    end が届いていなければ途中で切れているので、最後のレコードから再開できる。
+    """
+    start, after_id = parse_after(after)
+    totals = {kind: _count(_section(kind, user_id)) for kind in SECTIONS}
+    total = sum(totals.values())
+    done = sum(totals[kind] for kind in SECTIONS[:start])
+    done += totals[SECTIONS[start]] - _count(
+        _section(SECTIONS[start], user_id, after_id)
+    )
+
+    def records(done=done):
+        yield {"type": "header", "totals": totals, "total": total, "done": done}
+        for i, kind in enumerate(SECTIONS[start:]):
+            stmt = _section(kind, user_id, after_id if i == 0 else 0)
+            # 全件をメモリに載せず、batch_size 行ずつカーソルから取り出す
+            result = db.session.execute(
+                stmt, execution_options={"yield_per": batch_size}
+            )
+            for row in result:
+                yield _record(kind, row)
+                done += 1
+                if done % progress_every == 0:
+                    yield {"type": "progress", "done": done, "total": total}
+        yield {"type": "end", "done": done, "total": total}
+
+    return total, done, records()
+
+
+def ndjson_lines(records):
+    for record in records:
+        line = dumps(record)
+        if isinstance(line, str):
+            line = line.encode()
+        yield line + b"\n"
+
+
+def csv_lines(records):
+    """CSV には header / progress を出さない。最後の end 行で完了が分かる"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for record in records:
+        if record["type"] in ("header", "progress"):
+            continue
+        if "is_done" in record:
+            record = {**record, "is_done": "true" if record["is_done"] else "false"}
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _lines(stream):
+    # RawIOBase の readline は1バイトずつ読むのでバッファを挟む
+    if isinstance(stream, io.RawIOBase):
+        stream = io.BufferedReader(stream)
+    for line in stream:
+        yield line.decode("utf-8")
+
+
+def _parse_ndjson(stream):
+    for number, line in enumerate(_lines(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise TransferFormatError(f"line {number}: invalid JSON") from e
+        if not isinstance(record, dict):
+            raise TransferFormatError(f"line {number}: expected an object")
+        yield record
+
+
+def _parse_csv(stream):
+    for row in csv.DictReader(_lines(stream)):
+        record = {key: value for key, value in row.items() if value not in ("", None)}
+        for key in ("id", "todo_id", "tag_id"):
+            if key in record:
+                try:
+                    record[key] = int(record[key])
+                except ValueError as e:
+                    raise TransferFormatError(f"invalid {key}: {record[key]}") from e
+        yield record
+
+
+def read_records(stream, mimetype):
+    """本文を少しずつ読んでレコードを返す。header / progress は読み飛ばす"""
+    parse = _parse_csv if mimetype == "text/csv" else _parse_ndjson
+    for record in parse(stream):
+        if record.get("type") not in ("header", "progress"):
+            yield record
+
+
+def _parse_bool(value):
+    """JSON の真偽値か "true" / "false" / "1" / "0" (CSV)。それ以外は ValueError"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "1"):
+        return True
+    if isinstance(value, str) and value.lower() in ("false", "0"):
+        return False
+    raise ValueError(value)
+
+
+def _parse_datetime(value):
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(value)
+    return datetime.fromisoformat(value)
+
+
+def _save_map(job_id, kind, pairs):
+    if pairs:
+        db.session.execute(
+            insert(ImportIdMapModel),
+            [
+                {"job_id": job_id, "kind": kind, "source_id": s, "target_id": t}
+                for s, t in pairs
+            ],
+        )
+
+
+def _lookup(job_id, kind, source_ids):
+    source_ids = {id for id in source_ids if id is not None}
+    if not source_ids:
+        return {}
+    rows = db.session.execute(
+        select(ImportIdMapModel.source_id, ImportIdMapModel.target_id).where(
+            ImportIdMapModel.job_id == job_id,
+            ImportIdMapModel.kind == kind,
+            ImportIdMapModel.source_id.in_(source_ids),
+        )
+    ).all()
+    return dict(rows)
+
+
+def _source_id(record):
+    """エクスポート元の id (整数のときだけ。それ以外は付け替えに使わない)"""
+    value = record.get("id")
+    if isinstance(value, int) and not isinstance(value, bool) and value:
+        return value
+    return None
+
+
+def _first_by_source(job_id, kind, records):
+    """
+    エクスポート元の id が同じレコードは最初の1件だけを残す
+
+    前のバッチで取り込んだ id も除く。除いたものは skipped に数えられる
+    """
+    seen = set(_lookup(job_id, kind, [_source_id(r) for r in records]))
+    unique = []
+    for record in records:
+        source_id = _source_id(record)
+        if source_id is not None:
+            if source_id in seen:
+                continue
+            seen.add(source_id)
+        unique.append(record)
+    return unique
+
+
+def _import_tags(job, records):
+    """同じ名前のタグが自分にあればそれを使う。他人が使っている名前は飛ばす"""
+    names = {}
+    for record in _first_by_source(job.id, "tag", records):
+        name = record.get("name")
+        if isinstance(name, str) and name:
+            names.setdefault(name, []).append(_source_id(record))
+    if not names:
+        return 0
+    tags = {
+        name: (tag_id, owner)
+        for name, tag_id, owner in db.session.execute(
+            select(TagModel.name, TagModel.id, TagModel.user_id).where(
+                TagModel.name.in_(list(names))
+            )
+        )
+    }
+    new_names = [name for name in names if name not in tags]
+    if new_names:
+        ids = db.session.scalars(
+            insert(TagModel).returning(TagModel.id, sort_by_parameter_order=True),
+            [{"name": name, "user_id": job.user_id} for name in new_names],
+        ).all()
+        tags.update((name, (id, job.user_id)) for name, id in zip(new_names, ids))
+    imported, pairs = 0, []
+    for name, source_ids in names.items():
+        tag_id, owner = tags[name]
+        if owner != job.user_id:
+            continue
+        imported += len(source_ids)
+        pairs += [(source_id, tag_id) for source_id in source_ids if source_id]
+    _save_map(job.id, "tag", pairs)
+    return imported
+
+
+def _import_todos(job, records, tracked):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows, source_ids = [], []
+    for record in _first_by_source(job.id, "todo", records):
+        if not isinstance(record.get("name"), str) or not record["name"]:
+            continue
+        try:
+            dates = {key: _parse_datetime(record.get(key)) for key in DATETIME_FIELDS}
+            is_done = _parse_bool(record.get("is_done", False))
+        except ValueError:
+            continue
+        rows.append(
+            {
+                "name": record["name"],
+                "created_at": dates["created_at"] or now,
+                "updated_at": dates["updated_at"] or now,
+                "deadline": dates["deadline"],
+                "is_done": is_done,
+                "user_id": job.user_id,
+            }
+        )
+        source_ids.append(_source_id(record))
+    if not rows:
+        return 0
+    ids = db.session.scalars(
+        insert(TodoModel).returning(TodoModel.id, sort_by_parameter_order=True), rows
+    ).all()
+    tracked.created(ids)
+    index_todos(job.user_id, zip(ids, (row["name"] for row in rows)))
+    _save_map(
+        job.id,
+        "todo",
+        [(source, target) for source, target in zip(source_ids, ids) if source],
+    )
+    return len(ids)
+
+
+def _import_links(job, records, tracked):
+    """エクスポート元の id を付け替えてリンクする。付け替え先が無いものは飛ばす"""
+    todos = _lookup(job.id, "todo", [r.get("todo_id") for r in records])
+    tags = _lookup(job.id, "tag", [r.get("tag_id") for r in records])
+    pairs = [
+        (todos[r.get("todo_id")], tags[r.get("tag_id")])
+        for r in records
+        if r.get("todo_id") in todos and r.get("tag_id") in tags
+    ]
+    if not pairs:
+        return 0
+    tracked.watch(todo_id for todo_id, _ in pairs)
+    existing = set(
+        db.session.execute(
+            select(TodoTags.todo_id, TodoTags.tag_id).where(
+                tuple_(TodoTags.todo_id, TodoTags.tag_id).in_(set(pairs))
+            )
+        ).all()
+    )
+    missing = [
+        {"todo_id": todo_id, "tag_id": tag_id}
+        for todo_id, tag_id in dict.fromkeys(pairs)
+        if (todo_id, tag_id) not in existing
+    ]
+    if missing:
+        db.session.execute(insert(TodoTags), missing)
+    return len(pairs)
+
+
+def _apply_batch(job, batch):
+    """1バッチ分を取り込み、進み具合と一緒に1トランザクションでコミットする"""
+    by_kind = {kind: [r for r in batch if r.get("type") == kind] for kind in SECTIONS}
+    tags = _import_tags(job, by_kind["tag"])
+    with track(job.user_id) as tracked:
+        todos = _import_todos(job, by_kind["todo"], tracked)
+        links = _import_links(job, by_kind["link"], tracked)
+    job.tags += tags
+    job.todos += todos
+    job.links += links
+    job.skipped += len(batch) - tags - todos - links
+    job.processed += len(batch)
+    job.status = "running"
+    bump_version(job.user_id)
+    emit(job.user_id, "import.progress", {"job_id": job.id, "processed": job.processed})
+    db.session.commit()
+
+
+def import_records(job, records, offset=0, batch_size=500):
+    """
+    レコードを batch_size 件ずつ取り込む
+
+    offset は本文の先頭がデータの何件目からか。job.processed までは取り込み済みなので
+    読み飛ばす (最初から送り直してもよい)。end のレコードまで届いたら完了にする。
+    """
+    if offset > job.processed:
+        raise ValueError("offset is ahead of the processed records")
+    position = offset
+    batch = []
+    finished = False
+    for record in records:
+        if record.get("type") == "end":
+            finished = True
+            break
+        position += 1
+        if position <= job.processed:
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            _apply_batch(job, batch)
+            batch = []
+    if batch:
+        _apply_batch(job, batch)
+    if finished:
+        job.status = "done"
+        db.session.commit()
+    return job
@@ -0,0 +1,38 @@
+from flask import request
+from sqlalchemy import select, update
+from db import db
+from models import UserVersionModel
+
+
+def get_version(user_id):
+    """
+    ORM オブジェクトを作らずにバージョン番号だけを読む
+
+    304 を返してよいかを決める値なので、キャッシュせずに毎回 DB から読む
+    """
+    version = db.session.execute(
+        select(UserVersionModel.version).where(UserVersionModel.user_id == user_id)
+    ).scalar()
+    return version or 0
+
+
+def bump_version(user_id):
+    """
+    ユーザーのバージョンを1つ進める。書き込みと同じトランザクションで呼ぶこと
+    """
+    result = db.session.execute(
+        update(UserVersionModel)
+        .where(UserVersionModel.user_id == user_id)
+        .values(version=UserVersionModel.version + 1)
+    )
+    if result.rowcount == 0:
+        db.session.add(UserVersionModel(user_id=user_id, version=1))
+
+
+def etag_data(user_id):
+    """blp.set_etag() に渡すデータ。クエリ文字列ごとに別の ETag になる"""
+    return {
+        "user_id": user_id,
+        "version": get_version(user_id),
+        "path": request.full_path,
+    }
@@ -0,0 +1,16 @@
+"""
+バックグラウンドの仕事を実行するワーカーのエントリーポイント
+
+    cd backend
+    python worker.py        # flask jobs-worker と同じ。JOBS_CONCURRENCY 本のスレッドで実行する
+
+Web のプロセスとは別に動かす。仕事の取り合いは DB で行うので、何プロセス動かしてもよい。
+"""
+
+from app import create_app
+from jobs import Worker
+
+app = create_app()
+
+if __name__ == "__main__":
+    Worker(app).run()
@@ -0,0 +1,19 @@
+"""
+本番用の WSGI エントリーポイント
+
+    cd backend
+    gunicorn wsgi:app      # 設定は gunicorn.conf.py
+
+preload_app では親プロセスでこのモジュールを読み込んでから fork するので、
+アプリの初期化と GraphQL のスキーマの構築は1回だけで済む。
+マイグレーションはデプロイ時に flask db-upgrade で別に適用する (DB_AUTO_MIGRATE=0)。
+"""
+
+from app import create_app
+from gql.index import get_schema
+
+app = create_app()
+# スキーマ・OpenAPI の JSON・GraphiQL は最初のリクエストで作られるので、fork の前に作っておく
+get_schema()
+for asset in app.extensions["static_assets"]:
+    asset.build()
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import api from '../api/axios';
 import Calendar from 'react-calendar';
@@ -12,6 +12,7 @@ const TodoList = () => {
     const [user, setUser] = useState(null);
     const [viewMode, setViewMode] = useState('list'); // 'list' or 'calendar'
     const navigate = useNavigate();
+    const searchRef = useRef('');
 
     const fetchUser = async () => {
         try {
@@ -45,6 +46,19 @@ const TodoList = () => {
         fetchTodos();
     }, []);
 
+    // 他の端末での変更はサーバーからのイベントで受け取る (ポーリングしない)
+    // 切断時は EventSource が Last-Event-ID 付きで自動的に再接続する
+    useEffect(() => {
+        const source = new EventSource('/api/changes', { withCredentials: true });
+        source.onmessage = (event) => {
+            const change = JSON.parse(event.data);
+            if (change.type !== 'ready') {
+                fetchTodos(searchRef.current);
+            }
+        };
+        return () => source.close();
+    }, []);
+
     const handleLogout = async () => {
         try {
             await api.post('/logout');
@@ -56,6 +70,7 @@ const TodoList = () => {
 
     const handleSearch = (e) => {
         e.preventDefault();
+        searchRef.current = search;
         fetchTodos(search);
     };
 
@@ -63,8 +78,8 @@ const TodoList = () => {
         if (!window.confirm("Are you sure?")) return;
         try {
             await api.delete(`/todos/${id}`);
-            // Refresh list to keep sync
-            fetchTodos(search);
+            // 一覧の取り直しは変更フィードのイベントで行う
+            setTodos(todos.filter(t => t.id !== id));
         } catch (err) {
             alert("Failed to delete");
         }